@@ -7,11 +7,12 @@ from app.views.check.checks_view import (ChecksViewHttp, ChecksViewDns, ChecksVi
                                          ChecksViewRabbit, AllChecksViewWithFilters)
 from app.views.check.check_metric_view import (ChecksMetricViewHttp, ChecksMetricViewTcp, ChecksMetricViewDNS,
                                                ChecksMetricViewPing, ChecksMetricViewSMTP, ChecksMetricViewRabbitmq,
-                                               CheckStatusesView, CheckStatusView, CheckHistoryStatuses)
+                                               CheckStatusesView, CheckStatusView, CheckHistoryStatuses, ChecksStatusesView)
 from app.views.check.status_page_views import StatusPageView, StatusPages, StatusPageSlug
 from app.views.check.histrory_views import ChecksHistoryView, CheckHistoryView
 from app.views.check.group_views import CheckGroupView, CheckGroupsView
 from app.views.check.mtr_views import MtrCheckView
+from app.views.check.bulk_views import ChecksImportView, ChecksExportView
 
 
 def register_api(view, endpoint, url, pk='check_id', pk_type='int'):
@@ -30,6 +31,8 @@ bp.add_url_rule('/checks/tcp', view_func=ChecksViewTcp.as_view('tcp_checks'))
 bp.add_url_rule('/checks/ping', view_func=ChecksViewPing.as_view('ping_checks'))
 bp.add_url_rule('/checks/smtp', view_func=ChecksViewSmtp.as_view('smtp_checks'))
 bp.add_url_rule('/checks/rabbitmq', view_func=ChecksViewRabbit.as_view('rabbit_checks'))
+bp.add_url_rule('/checks/import', view_func=ChecksImportView.as_view('checks_import'))
+bp.add_url_rule('/checks/export', view_func=ChecksExportView.as_view('checks_export'))
 bp.add_url_rule('/check/http/<int:check_id>/metrics', view_func=ChecksMetricViewHttp.as_view('http_metric'))
 bp.add_url_rule('/check/tcp/<int:check_id>/metrics', view_func=ChecksMetricViewTcp.as_view('tcp_metric'))
 bp.add_url_rule('/check/dns/<int:check_id>/metrics', view_func=ChecksMetricViewDNS.as_view('dns_metric'))
@@ -38,6 +41,7 @@ bp.add_url_rule('/check/smtp/<int:check_id>/metrics', view_func=ChecksMetricView
 bp.add_url_rule('/check/rabbitmq/<int:check_id>/metrics', view_func=ChecksMetricViewRabbitmq.as_view('rabbitmq_metric'))
 bp.add_url_rule('/check/history/<int:check_id>', view_func=CheckHistoryStatuses.as_view('check_history_statuses'))
 bp.add_url_rule('/check/<int:check_id>/statuses', view_func=CheckStatusesView.as_view('check_statuses'))
+bp.add_url_rule('/checks/statuses', view_func=ChecksStatusesView.as_view('checks_statuses'))
 bp.add_url_rule('/check/<int:check_id>/status', view_func=CheckStatusView.as_view('check_status'))
 bp.add_url_rule('/check/<int:check_id>/route', view_func=MtrCheckView.as_view('mtr'))
 bp.add_url_rule('/check-groups', view_func=CheckGroupsView.as_view('check_groups'))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import argparse
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, scheduler
+import app.modules.db.db_model as db_model
+import app.modules.db.history as history_sql
+import app.modules.db.search as search_sql
+import app.modules.roxywi.auth as roxywi_auth
+import app.modules.benchmark.seed as bench_seed
+import app.modules.benchmark.runner as bench_runner
+from app.modules.benchmark.stub_agent import StubAgents
+
+
+def _use_sqlite(path: str) -> None:
+    """
+    Point the models at a scratch SQLite database, so the configured one is not touched.
+    """
+    if db_model.pgsql_enable == '1' or db_model.mysql_enable == '1':
+        raise Exception('--sqlite can only be used when RMON is configured to use SQLite')
+    new_database = not os.path.exists(path)
+    db_model.conn.init(path, pragmas=db_model.conn._pragmas)
+    db_model.create_tables(db_model.conn)
+    history_sql.create_alerts_history_triggers()
+    search_sql.create_search_indexes()
+    if new_database:
+        from app.create_db import default_values
+
+        default_values()
+
+
+def _progress(message: str) -> None:
+    print(message, flush=True)
+
+
+def seed(args) -> None:
+    if not args.sqlite and not args.yes:
+        raise Exception('Seeding writes into the configured database, pass --yes to confirm or use --sqlite')
+    if bench_seed.load_dataset(args.group_id)['agents'] and not args.force:
+        raise Exception('The database already has a benchmark dataset, pass --force to add another one')
+    summary = bench_seed.seed(
+        group_id=args.group_id, countries=args.countries, regions=args.regions, agents=args.agents,
+        multi_checks=args.multi_checks, history_rows=args.history_rows, alerts=args.alerts, status_pages=args.status_pages,
+        random_seed=args.seed, progress=_progress
+    )
+    print(json.dumps(summary, indent=2))
+
+
+def run(args) -> int:
+    scenarios = args.scenarios.split(',') if args.scenarios else list(bench_runner.SCENARIOS)
+    unknown = [name for name in scenarios if name not in bench_runner.SCENARIOS]
+    if unknown:
+        raise Exception(f'Unknown scenarios: {", ".join(unknown)}')
+    if args.read_only:
+        scenarios = [name for name in scenarios if not bench_runner.SCENARIOS[name].writes]
+
+    dataset = bench_seed.load_dataset(args.group_id)
+    if not dataset['agents']:
+        raise Exception('There is no benchmark dataset, run the seed command first')
+
+    if args.url:
+        token = args.token or os.environ.get('RMON_TOKEN')
+        if not token:
+            raise Exception('Pass --token or set RMON_TOKEN to benchmark a running server')
+        clients = [bench_runner.HttpClient(args.url, token) for _ in range(args.concurrency)]
+    else:
+        with app.app_context():
+            token = roxywi_auth.create_jwt_token({'user': args.user_id, 'group': args.group_id})
+        clients = [bench_runner.LocalClient(app, token) for _ in range(args.concurrency)]
+
+    stub_agents = None if args.no_stub_agents else StubAgents(dataset['agents'], args.agent_latency).start()
+    try:
+        report = bench_runner.run(
+            clients, dataset, scenarios, args.duration, args.requests, args.warmup, args.seed, stub_agents, _progress
+        )
+    finally:
+        if stub_agents:
+            stub_agents.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            report_file.write(output)
+        print(f'Report has been written to {args.report}')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = bench_runner.compare(json.load(baseline_file), report, args.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RMON benchmark and load-test harness')
+    parser.add_argument('--sqlite', help='Use a scratch SQLite database at this path instead of the configured one')
+    parser.add_argument('--group-id', type=int, default=1, help='Group of the dataset (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    subparsers = parser.add_subparsers(dest='command', help='Command to run')
+
+    seed_parser = subparsers.add_parser('seed', help='Fill the database with a benchmark dataset')
+    seed_parser.add_argument('--countries', type=int, default=5)
+    seed_parser.add_argument('--regions', type=int, default=20)
+    seed_parser.add_argument('--agents', type=int, default=40)
+    seed_parser.add_argument('--multi-checks', type=int, default=1000, help='Country checks get one check per region')
+    seed_parser.add_argument('--history-rows', type=int, default=1000000)
+    seed_parser.add_argument('--alerts', type=int, default=50000)
+    seed_parser.add_argument('--status-pages', type=int, default=10)
+    seed_parser.add_argument('--yes', action='store_true', help='Allow seeding the configured database')
+    seed_parser.add_argument('--force', action='store_true', help='Seed even if there is a dataset already')
+
+    run_parser = subparsers.add_parser('run', help='Measure the endpoints against the seeded dataset')
+    run_parser.add_argument('--scenarios', help=f'Comma separated, default: all of {", ".join(bench_runner.SCENARIOS)}')
+    run_parser.add_argument('--read-only', action='store_true', help='Skip the scenarios that create or change checks')
+    run_parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario (default: 10)')
+    run_parser.add_argument('--requests', type=int, help='Stop a scenario after this many requests')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients (default: 4)')
+    run_parser.add_argument('--warmup', type=int, default=5, help='Untimed requests before every scenario (default: 5)')
+    run_parser.add_argument('--url', help='Benchmark a running server, like http://127.0.0.1:5100, instead of this process')
+    run_parser.add_argument('--token', help='API token for --url, see POST /api/v1.0/login')
+    run_parser.add_argument('--user-id', type=int, default=1, help='User of the in-process requests (default: 1)')
+    run_parser.add_argument('--agent-latency', type=float, default=0, help='Seconds every stub agent request takes')
+    run_parser.add_argument('--no-stub-agents', action='store_true', help='Do not start stub agents')
+    run_parser.add_argument('--report', help='Write the JSON report to this file')
+    run_parser.add_argument('--baseline', help='Compare with this report, exit with 1 on regressions')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown against the baseline (default: 0.2)')
+
+    args = parser.parse_args()
+    if args.command not in ('seed', 'run'):
+        parser.print_help()
+        return
+
+    # Jobs would change the dataset while it is measured
+    scheduler.pause()
+    try:
+        if args.sqlite:
+            _use_sqlite(args.sqlite)
+        if args.command == 'seed':
+            seed(args)
+        else:
+            sys.exit(run(args))
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
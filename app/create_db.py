@@ -40,6 +40,11 @@ def default_values():
 		{'param': 'ldap_search_field', 'value': 'mail', 'section': 'ldap', 'desc': 'UserPost\'s email address', 'group_id': '1'},
 		{'param': 'ldap_type', 'value': '0', 'section': 'ldap', 'desc': 'Use LDAPS', 'group_id': '1'},
 		{'param': 'keep_history_range', 'value': '14', 'section': 'smon', 'desc': 'Retention period for RMON history', 'group_id': '1'},
+		{'param': 'smon_keep_history_raw_range', 'value': '1', 'section': 'smon', 'desc': 'Retention period for raw RMON check results (in days)', 'group_id': '1'},
+		{'param': 'smon_keep_rollup_1m_range', 'value': '2', 'section': 'smon', 'desc': 'Retention period for 1-minute RMON rollups (in days)', 'group_id': '1'},
+		{'param': 'smon_keep_rollup_5m_range', 'value': '14', 'section': 'smon', 'desc': 'Retention period for 5-minute RMON rollups (in days)', 'group_id': '1'},
+		{'param': 'smon_keep_rollup_1h_range', 'value': '365', 'section': 'smon', 'desc': 'Retention period for hourly RMON rollups (in days)', 'group_id': '1'},
+		{'param': 'smon_keep_rollup_1d_range', 'value': '1825', 'section': 'smon', 'desc': 'Retention period for daily RMON rollups (in days)', 'group_id': '1'},
 		{'param': 'action_keep_history_range', 'value': '30', 'section': 'monitoring', 'desc': 'Retention period for Action history', 'group_id': '1'},
 		{'param': 'ssl_expire_warning_alert', 'value': '14', 'section': 'smon', 'desc': 'Warning alert about a SSL certificate expiration (in days)', 'group_id': '1'},
 		{'param': 'ssl_expire_critical_alert', 'value': '7', 'section': 'smon', 'desc': 'Critical alert about a SSL certificate expiration (in days)', 'group_id': '1'},
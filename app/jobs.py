@@ -6,78 +6,88 @@ import distro
 
 from app import scheduler
 import app.modules.db.sql as sql
-import app.modules.db.smon as smon_sql
+import app.modules.db.job as job_sql
+import app.modules.tools.smon as smon_mod
 import app.modules.db.roxy as roxy_sql
 import app.modules.db.history as history_sql
+import app.modules.db.history_partition as history_partition
 import app.modules.roxywi.roxy as roxy
 import app.modules.tools.common as tools_common
+import app.modules.tools.smon_rollup as smon_rollup
+import app.modules.tools.alert_dispatcher as alert_dispatcher
+import app.modules.tools.smon_liveness as smon_liveness
+import app.modules.tools.job_runner as job_runner
+import app.modules.server.ssh_connection as ssh_connection
+import app.modules.tools.service_status as service_status
 import app.modules.roxy_wi_tools as roxy_wi_tools
+from app.modules.tools.job_runner import job
 
 get_config = roxy_wi_tools.GetConfigVar()
 
 
-@scheduler.task('interval', id='update_plan', minutes=55, misfire_grace_time=None)
-def update_user_status():
+@scheduler.task(
+    'interval', id='renew_leader_lease', seconds=job_runner.LEADER_RENEW, next_run_time=datetime.datetime.now(),
+    misfire_grace_time=None, max_instances=1
+)
+def renew_leader_lease():
     app = scheduler.app
     with app.app_context():
-        roxy.update_plan()
+        job_runner.renew_lease()
+
+
+@scheduler.task('interval', id='update_plan', minutes=55, misfire_grace_time=None)
+@job('update_plan')
+def update_user_status():
+    roxy.update_plan()
 
 
 @scheduler.task('interval', id='check_new_version', days=1, misfire_grace_time=None)
+@job('check_new_version')
 def check_new_version():
-    app = scheduler.app
-    with app.app_context():
-        tools = roxy_sql.get_roxy_tools()
-        for tool in tools:
-            ver = roxy.check_new_version(tool)
-            roxy_sql.update_tool_new_version(tool, ver)
+    tools = roxy_sql.get_roxy_tools()
+    for tool in tools:
+        ver = roxy.check_new_version(tool)
+        roxy_sql.update_tool_new_version(tool, ver)
 
 
 @scheduler.task('interval', id='update_cur_tool_versions', days=1, misfire_grace_time=None)
+@job('update_cur_tool_versions')
 def update_cur_tool_versions():
-    app = scheduler.app
-    with app.app_context():
-        tools_common.update_cur_tool_versions()
+    tools_common.update_cur_tool_versions()
 
 
 @scheduler.task('interval', id='delete_action_history_for_period', minutes=70, misfire_grace_time=None)
+@job('delete_action_history_for_period')
 def delete_action_history_for_period():
-    app = scheduler.app
-    with app.app_context():
-        history_sql.delete_action_history_for_period()
+    history_sql.delete_action_history_for_period()
 
 
 @scheduler.task('interval', id='delete_old_logs', hours=1, misfire_grace_time=None)
+@job('delete_old_logs', leader_only=False)
 def delete_old_logs():
-    app = scheduler.app
-    with app.app_context():
-        time_storage = sql.get_setting('log_time_storage')
-        log_path = get_config.get_config_var('main', 'log_path')
-        try:
-            time_storage_hours = time_storage * 24
-            for dirpath, dirnames, filenames in os.walk(log_path):
-                for file in filenames:
-                    curpath = os.path.join(dirpath, file)
-                    file_modified = datetime.datetime.fromtimestamp(os.path.getmtime(curpath))
-                    if datetime.datetime.now() - file_modified > datetime.timedelta(hours=time_storage_hours):
-                        os.remove(curpath)
-        except Exception as e:
-            print(f'error: cannot delete old log files: {e}')
+    time_storage = sql.get_setting('log_time_storage')
+    log_path = get_config.get_config_var('main', 'log_path')
+    time_storage_hours = time_storage * 24
+    for dirpath, dirnames, filenames in os.walk(log_path):
+        for file in filenames:
+            curpath = os.path.join(dirpath, file)
+            file_modified = datetime.datetime.fromtimestamp(os.path.getmtime(curpath))
+            if datetime.datetime.now() - file_modified > datetime.timedelta(hours=time_storage_hours):
+                os.remove(curpath)
 
 
 @scheduler.task('interval', id='update_owner_on_log', hours=12, misfire_grace_time=None)
+@job('update_owner_on_log', leader_only=False)
 def update_owner_on_log():
     log_path = get_config.get_config_var('main', 'log_path')
-    try:
-        if distro.id() == 'ubuntu':
-            os.system(f'sudo chown www-data:www-data -R {log_path}')
-        else:
-            os.system(f'sudo chown apache:apache -R {log_path}')
-    except Exception:
-        pass
+    if distro.id() == 'ubuntu':
+        os.system(f'sudo chown www-data:www-data -R {log_path}')
+    else:
+        os.system(f'sudo chown apache:apache -R {log_path}')
 
 
 @scheduler.task('interval', id='delete_ansible_artifacts', hours=24, misfire_grace_time=None)
+@job('delete_ansible_artifacts', leader_only=False)
 def delete_ansible_artifacts():
     ansible_path = '/var/www/rmon/app/scripts/ansible'
     folders = ['artifacts', 'env']
@@ -90,23 +100,63 @@ def delete_ansible_artifacts():
                 raise Exception(f'error: Cron cannot delete ansible folders: {e}')
 
 
-@scheduler.task('interval', id='disable_expired_check', minutes=3, misfire_grace_time=None)
+@scheduler.task('interval', id='disable_expired_check', minutes=1, misfire_grace_time=None, max_instances=1)
+@job('disable_expired_check')
 def disable_expired_check():
-    app = scheduler.app
-    with app.app_context():
-        smon_sql.disable_expired_check()
+    smon_mod.disable_expired_checks()
 
 
 @scheduler.task('interval', id='delete_alert_history', hours=24, misfire_grace_time=None)
+@job('delete_alert_history')
 def delete_alert_history():
-    app = scheduler.app
-    with app.app_context():
-        history_range = int(sql.get_setting('keep_history_range'))
-        history_sql.delete_alert_history(history_range, 'RMON')
+    history_range = int(sql.get_setting('keep_history_range'))
+    history_sql.delete_alert_history(history_range, 'RMON')
 
 
 @scheduler.task('interval', id='delete_smon_history', hours=24, misfire_grace_time=None)
+@job('delete_smon_history')
 def delete_smon_history():
-    app = scheduler.app
-    with app.app_context():
-        smon_sql.delete_smon_history()
+    smon_rollup.delete_old_history()
+    smon_rollup.delete_old_rollups()
+
+
+@scheduler.task('interval', id='delete_job_runs', hours=24, misfire_grace_time=None)
+@job('delete_job_runs')
+def delete_job_runs():
+    job_sql.delete_job_runs_before(datetime.datetime.now() - datetime.timedelta(days=job_runner.JOB_RUNS_KEEP_DAYS))
+
+
+@scheduler.task('interval', id='ensure_history_partitions', hours=1, misfire_grace_time=None, max_instances=1)
+@job('ensure_history_partitions')
+def ensure_history_partitions():
+    history_partition.ensure_partitions()
+
+
+@scheduler.task('interval', id='rollup_smon_history', minutes=1, misfire_grace_time=None, max_instances=1)
+@job('rollup_smon_history')
+def rollup_smon_history():
+    smon_rollup.rollup_history()
+
+
+@scheduler.task('interval', id='dispatch_alerts', seconds=5, misfire_grace_time=None, max_instances=1)
+@job('dispatch_alerts')
+def dispatch_alerts():
+    alert_dispatcher.dispatch_alerts()
+
+
+@scheduler.task('interval', id='check_agents_liveness', seconds=15, misfire_grace_time=None, max_instances=1)
+@job('check_agents_liveness')
+def check_agents_liveness():
+    smon_liveness.check_agents_liveness()
+
+
+@scheduler.task('interval', id='close_idle_ssh_connections', minutes=1, misfire_grace_time=None, max_instances=1)
+@job('close_idle_ssh_connections', leader_only=False)
+def close_idle_ssh_connections():
+    ssh_connection.close_idle_connections()
+
+
+@scheduler.task('interval', id='refresh_service_status', seconds=service_status.SERVICE_STATUS_TTL, misfire_grace_time=None, max_instances=1)
+@job('refresh_service_status', leader_only=False)
+def refresh_service_status():
+    service_status.refresh(force=False)
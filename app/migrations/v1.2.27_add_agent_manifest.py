@@ -0,0 +1,24 @@
+from app.modules.db.db_model import connect, SmonAgentManifest
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Create the smon_agent_manifest table
+    try:
+        conn = connect()
+        conn.create_tables([SmonAgentManifest], safe=True)
+        print("Created smon_agent_manifest table")
+    except Exception as e:
+        print(f"Error creating smon_agent_manifest table: {e}")
+
+
+def downgrade():
+    # Drop the smon_agent_manifest table
+    try:
+        conn = connect()
+        conn.drop_tables([SmonAgentManifest], safe=True)
+        print("Dropped smon_agent_manifest table")
+    except Exception as e:
+        print(f"Error dropping smon_agent_manifest table: {e}")
@@ -0,0 +1,46 @@
+from app.modules.db.db_model import connect, Setting, SmonHistoryRollup, SmonRollupState
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+ROLLUP_SETTINGS = [
+    {'param': 'smon_keep_history_raw_range', 'value': '1', 'section': 'smon', 'desc': 'Retention period for raw RMON check results (in days)', 'group_id': 1},
+    {'param': 'smon_keep_rollup_1m_range', 'value': '2', 'section': 'smon', 'desc': 'Retention period for 1-minute RMON rollups (in days)', 'group_id': 1},
+    {'param': 'smon_keep_rollup_5m_range', 'value': '14', 'section': 'smon', 'desc': 'Retention period for 5-minute RMON rollups (in days)', 'group_id': 1},
+    {'param': 'smon_keep_rollup_1h_range', 'value': '365', 'section': 'smon', 'desc': 'Retention period for hourly RMON rollups (in days)', 'group_id': 1},
+    {'param': 'smon_keep_rollup_1d_range', 'value': '1825', 'section': 'smon', 'desc': 'Retention period for daily RMON rollups (in days)', 'group_id': 1},
+]
+
+
+def upgrade():
+    # Create the smon_history_rollup and smon_rollup_state tables
+    try:
+        conn = connect()
+        conn.create_tables([SmonHistoryRollup, SmonRollupState], safe=True)
+        print("Created smon_history_rollup and smon_rollup_state tables")
+    except Exception as e:
+        print(f"Error creating rollup tables: {e}")
+
+    # Add retention settings for raw history and rollups
+    try:
+        Setting.insert_many(ROLLUP_SETTINGS).on_conflict_ignore().execute()
+        print("Added rollup retention settings")
+    except Exception as e:
+        print(f"Error adding rollup retention settings: {e}")
+
+
+def downgrade():
+    # Drop the rollup tables
+    try:
+        conn = connect()
+        conn.drop_tables([SmonHistoryRollup, SmonRollupState], safe=True)
+        print("Dropped smon_history_rollup and smon_rollup_state tables")
+    except Exception as e:
+        print(f"Error dropping rollup tables: {e}")
+
+    # Delete rollup retention settings
+    try:
+        Setting.delete().where(Setting.param.in_([s['param'] for s in ROLLUP_SETTINGS])).execute()
+        print("Deleted rollup retention settings")
+    except Exception as e:
+        print(f"Error deleting rollup retention settings: {e}")
@@ -0,0 +1,24 @@
+from app.modules.db.db_model import connect, SettingsVersion
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Create the settings_version table
+    try:
+        conn = connect()
+        conn.create_tables([SettingsVersion], safe=True)
+        print("Created settings_version table")
+    except Exception as e:
+        print(f"Error creating settings_version table: {e}")
+
+
+def downgrade():
+    # Drop the settings_version table
+    try:
+        conn = connect()
+        conn.drop_tables([SettingsVersion], safe=True)
+        print("Dropped settings_version table")
+    except Exception as e:
+        print(f"Error dropping settings_version table: {e}")
@@ -0,0 +1,42 @@
+from playhouse.migrate import *
+from peewee import IntegerField, DateTimeField, SQL
+from app.modules.db.db_model import connect
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Add the retry columns used by the alert dispatcher to the alert_event table
+    try:
+        migrate(
+            migrator.add_column('alert_event', 'attempts', IntegerField(constraints=[SQL('DEFAULT 0')])),
+            migrator.add_column('alert_event', 'next_attempt_at', DateTimeField(null=True)),
+        )
+        print("Added attempts and next_attempt_at columns to alert_event table")
+    except Exception as e:
+        if "duplicate column" in str(e).lower() or "already exists" in str(e).lower():
+            print("Columns attempts and next_attempt_at already exist in alert_event table")
+        else:
+            print(f"Error adding alert_event dispatch columns: {e}")
+
+    try:
+        migrate(
+            migrator.add_index('alert_event', ('next_attempt_at',), False),
+        )
+        print("Created index on next_attempt_at in alert_event")
+    except Exception as e:
+        print(f"Error creating next_attempt_at index: {e}")
+
+
+def downgrade():
+    # Remove the retry columns from the alert_event table
+    try:
+        migrate(
+            migrator.drop_index('alert_event', 'alert_event_next_attempt_at'),
+            migrator.drop_column('alert_event', 'next_attempt_at'),
+            migrator.drop_column('alert_event', 'attempts'),
+        )
+        print("Removed attempts and next_attempt_at columns from alert_event table")
+    except Exception as e:
+        print(f"Error removing alert_event dispatch columns: {e}")
@@ -0,0 +1,24 @@
+from app.modules.db.db_model import connect, SmonAgentLiveness, SmonCheckFailover
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Create the smon_agent_liveness and smon_check_failover tables
+    try:
+        conn = connect()
+        conn.create_tables([SmonAgentLiveness, SmonCheckFailover], safe=True)
+        print("Created smon_agent_liveness and smon_check_failover tables")
+    except Exception as e:
+        print(f"Error creating agent liveness tables: {e}")
+
+
+def downgrade():
+    # Drop the smon_agent_liveness and smon_check_failover tables
+    try:
+        conn = connect()
+        conn.drop_tables([SmonCheckFailover, SmonAgentLiveness], safe=True)
+        print("Dropped smon_agent_liveness and smon_check_failover tables")
+    except Exception as e:
+        print(f"Error dropping agent liveness tables: {e}")
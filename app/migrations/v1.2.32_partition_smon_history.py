@@ -0,0 +1,53 @@
+from playhouse.migrate import *
+from peewee import IntegerField
+from app.modules.db.db_model import connect, Setting
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def _keep_days() -> int:
+    try:
+        return int(Setting.get(Setting.param == 'smon_keep_history_raw_range').value or 1)
+    except Exception:
+        return 1
+
+
+def upgrade():
+    # Add the per-check history retention to the multi_check table
+    try:
+        migrate(
+            migrator.add_column('multi_check', 'keep_history', IntegerField(null=True)),
+        )
+        print("Added keep_history column to multi_check table")
+    except Exception as e:
+        if "duplicate column" in str(e).lower() or "already exists" in str(e).lower():
+            print("Column keep_history already exists in multi_check table")
+        else:
+            print(f"Error adding keep_history column: {e}")
+
+    # Split smon_history by day, so the retention drops partitions instead of deleting rows
+    try:
+        import app.modules.db.history_partition as history_partition
+        history_partition.partition_history_table(_keep_days())
+        print("Partitioned smon_history table by day")
+    except Exception as e:
+        print(f"Error partitioning smon_history table: {e}")
+
+
+def downgrade():
+    # Move the history back to a plain table and remove the per-check retention
+    try:
+        import app.modules.db.history_partition as history_partition
+        history_partition.unpartition_history_table()
+        print("Moved smon_history back to a plain table")
+    except Exception as e:
+        print(f"Error removing smon_history partitions: {e}")
+
+    try:
+        migrate(
+            migrator.drop_column('multi_check', 'keep_history'),
+        )
+        print("Removed keep_history column from multi_check table")
+    except Exception as e:
+        print(f"Error removing keep_history column: {e}")
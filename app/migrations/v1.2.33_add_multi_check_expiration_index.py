@@ -0,0 +1,27 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    try:
+        migrate(
+            migrator.add_index('multi_check', ('expiration',), False),
+        )
+        print("Created index on expiration in multi_check")
+    except Exception as e:
+        if "duplicate" in str(e).lower() or "already exists" in str(e).lower():
+            print("Index on expiration already exists in multi_check")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        migrate(
+            migrator.drop_index('multi_check', 'multi_check_expiration'),
+        )
+        print("Removed index on expiration in multi_check")
+    except Exception as e:
+        print(f"Error dropping index: {e}")
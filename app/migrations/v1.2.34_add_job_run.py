@@ -0,0 +1,24 @@
+from app.modules.db.db_model import connect, AggregatorLock, JobRun
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Create the job_run table and the aggregator_lock table used for the scheduler leader lease
+    try:
+        conn = connect()
+        conn.create_tables([AggregatorLock, JobRun], safe=True)
+        print("Created aggregator_lock and job_run tables")
+    except Exception as e:
+        print(f"Error creating job runner tables: {e}")
+
+
+def downgrade():
+    # aggregator_lock is part of the base schema, only job_run is dropped
+    try:
+        conn = connect()
+        conn.drop_tables([JobRun], safe=True)
+        print("Dropped job_run table")
+    except Exception as e:
+        print(f"Error dropping job_run table: {e}")
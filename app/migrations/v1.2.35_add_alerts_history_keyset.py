@@ -0,0 +1,49 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect, RMONAlertsHistoryCount
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Index for the keyset pagination of the alerts history
+    try:
+        migrate(
+            migrator.add_index('rmon_alerts_history', ('group_id', 'service', 'date', 'id'), False),
+        )
+        print("Created index on group_id, service, date and id in rmon_alerts_history")
+    except Exception as e:
+        if "duplicate" in str(e).lower() or "already exists" in str(e).lower():
+            print("Index on group_id, service, date and id already exists in rmon_alerts_history")
+        else:
+            raise e
+
+    # Per group counter of the alerts, kept by triggers
+    try:
+        import app.modules.db.history as history_sql
+        conn = connect()
+        conn.create_tables([RMONAlertsHistoryCount], safe=True)
+        history_sql.create_alerts_history_triggers()
+        history_sql.recount_alerts_history()
+        print("Created rmon_alerts_history_count table and its triggers")
+    except Exception as e:
+        print(f"Error creating rmon_alerts_history_count table: {e}")
+
+
+def downgrade():
+    try:
+        import app.modules.db.history as history_sql
+        history_sql.drop_alerts_history_triggers()
+        conn = connect()
+        conn.drop_tables([RMONAlertsHistoryCount], safe=True)
+        print("Dropped rmon_alerts_history_count table and its triggers")
+    except Exception as e:
+        print(f"Error dropping rmon_alerts_history_count table: {e}")
+
+    try:
+        migrate(
+            migrator.drop_index('rmon_alerts_history', 'rmon_alerts_history_group_id_service_date_id'),
+        )
+        print("Removed index on group_id, service, date and id in rmon_alerts_history")
+    except Exception as e:
+        print(f"Error dropping index: {e}")
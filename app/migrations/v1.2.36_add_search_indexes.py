@@ -0,0 +1,19 @@
+def upgrade():
+    # Full-text search indexes of the alerts history and the checks: FTS5 tables on SQLite,
+    # trigram GIN indexes on PostgreSQL and FULLTEXT indexes on MySQL
+    try:
+        import app.modules.db.search as search_sql
+        search_sql.create_search_indexes()
+        search_sql.rebuild_search_indexes()
+        print("Created search indexes of rmon_alerts_history and multi_check")
+    except Exception as e:
+        print(f"Error creating search indexes: {e}")
+
+
+def downgrade():
+    try:
+        import app.modules.db.search as search_sql
+        search_sql.drop_search_indexes()
+        print("Dropped search indexes of rmon_alerts_history and multi_check")
+    except Exception as e:
+        print(f"Error dropping search indexes: {e}")
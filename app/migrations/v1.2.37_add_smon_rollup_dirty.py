@@ -0,0 +1,23 @@
+from app.modules.db.db_model import connect, SmonRollupDirty
+
+# Get the migrator for the current database
+migrator = connect(get_migrator=True)
+
+
+def upgrade():
+    # Create the smon_rollup_dirty table, the ingest marks there the history that lands after its rollup
+    try:
+        conn = connect()
+        conn.create_tables([SmonRollupDirty], safe=True)
+        print("Created smon_rollup_dirty table")
+    except Exception as e:
+        print(f"Error creating smon_rollup_dirty table: {e}")
+
+
+def downgrade():
+    try:
+        conn = connect()
+        conn.drop_tables([SmonRollupDirty], safe=True)
+        print("Dropped smon_rollup_dirty table")
+    except Exception as e:
+        print(f"Error dropping smon_rollup_dirty table: {e}")
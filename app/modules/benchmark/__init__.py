@@ -0,0 +1 @@
+NAME = 'roxy-wi-benchmark-module'
@@ -0,0 +1,459 @@
+import os
+import math
+import time
+import random
+import platform
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+from app.modules.db.db_model import conn, pgsql_enable, mysql_enable, SMON, MultiCheck, SmonHistory, RMONAlertsHistory
+import app.modules.db.smon as smon_sql
+
+API = '/api/v1.0/rmon'
+STATUSES_BATCH = 50
+# Checks created by the update scenario before it is measured
+UPDATE_POOL = 20
+
+
+class LocalClient:
+    """
+    Call the application in this process through the Flask test client, without a web server in between.
+    """
+    transport = 'local'
+
+    def __init__(self, flask_app, token: str):
+        self.client = flask_app.test_client()
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def request(self, method: str, path: str, params: dict = None, json_data: dict = None) -> tuple[int, object]:
+        response = self.client.open(path, method=method, query_string=params, json=json_data, headers=self.headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """
+    Call a running RMON server over HTTP.
+    """
+    transport = 'http'
+
+    def __init__(self, base_url: str, token: str, timeout: int = 60):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, params: dict = None, json_data: dict = None) -> tuple[int, object]:
+        response = self.session.request(method, f'{self.base_url}{path}', params=params, json=json_data, timeout=self.timeout)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+class Scenario:
+    """
+    One endpoint under load. build() returns the next request as (method, path, params, json).
+    setup() and cleanup() run once around the measurement and are not timed.
+    """
+    writes = False
+
+    def __init__(self, dataset: dict):
+        self.dataset = dataset
+
+    def available(self) -> bool:
+        return True
+
+    def setup(self, client) -> None:
+        pass
+
+    def build(self, rnd: random.Random) -> tuple:
+        raise NotImplementedError
+
+    def collect(self, response: object) -> None:
+        """
+        Called with the response of every successful request.
+        """
+        pass
+
+    def cleanup(self, client) -> None:
+        pass
+
+    def _all_checks(self) -> list[dict]:
+        return [check for checks in self.dataset['checks'].values() for check in checks]
+
+
+class ChecksListScenario(Scenario):
+    def available(self) -> bool:
+        return bool(self._all_checks())
+
+    def build(self, rnd):
+        pages = max(len({check['multi_check_id'] for check in self._all_checks()}) // 25, 1)
+        return 'GET', f'{API}/checks', {'offset': rnd.randint(1, pages), 'limit': 25}, None
+
+
+class ChecksFilterScenario(Scenario):
+    def available(self) -> bool:
+        return bool(self.dataset['checks'])
+
+    def build(self, rnd):
+        params = {
+            'check_type': rnd.choice(list(self.dataset['checks'])),
+            'check_status': rnd.choice((0, 1)),
+            'check_name': f'{rnd.randint(1, 99)}',
+            'sort_by': rnd.choice(('name', '-updated_at', 'status')),
+            'limit': 25,
+        }
+        return 'GET', f'{API}/checks', params, None
+
+
+class ChecksStatusesScenario(Scenario):
+    def available(self) -> bool:
+        return bool(self._all_checks())
+
+    def build(self, rnd):
+        checks = self._all_checks()
+        check_ids = [check['id'] for check in rnd.sample(checks, min(STATUSES_BATCH, len(checks)))]
+        return 'GET', f'{API}/checks/statuses', {'check_id': ','.join(map(str, check_ids)), 'last': 40}, None
+
+
+class CheckStatusesScenario(Scenario):
+    def available(self) -> bool:
+        return bool(self._all_checks())
+
+    def build(self, rnd):
+        return 'GET', f'{API}/check/{rnd.choice(self._all_checks())["id"]}/statuses', None, None
+
+
+class CheckMetricsScenario(Scenario):
+    format = 'string'
+
+    def available(self) -> bool:
+        return bool(self.dataset['checks'])
+
+    def build(self, rnd):
+        check_type = rnd.choice(list(self.dataset['checks']))
+        check = rnd.choice(self.dataset['checks'][check_type])
+        return 'GET', f'{API}/check/{check_type}/{check["id"]}/metrics', {'format': self.format}, None
+
+
+class CheckMetricsColumnarScenario(CheckMetricsScenario):
+    format = 'columnar'
+
+
+class StatusPageScenario(Scenario):
+    def available(self) -> bool:
+        return bool(self.dataset['status_pages'])
+
+    def build(self, rnd):
+        return 'GET', f'{API}/status-page/slug/{rnd.choice(self.dataset["status_pages"])}', None, None
+
+
+class AlertsHistoryScenario(Scenario):
+    def build(self, rnd):
+        return 'GET', f'{API}/history', {'offset': rnd.randint(1, 20), 'limit': 25}, None
+
+
+class AgentHelloScenario(Scenario):
+    """
+    The steady state of an agent: it reports the manifest it already has, so nothing has to be sent.
+    """
+    full = False
+
+    def available(self) -> bool:
+        return bool(self.dataset['agents'])
+
+    def setup(self, client) -> None:
+        for agent in self.dataset['agents']:
+            client.request('POST', '/rmon/agent/hello', json_data={'uuid': agent['uuid']})
+
+    def build(self, rnd):
+        agent = rnd.choice(self.dataset['agents'])
+        manifest_version = None
+        if not self.full:
+            manifest = smon_sql.get_agent_manifest(agent['id'])
+            manifest_version = manifest.version if manifest else None
+        return 'POST', '/rmon/agent/hello', None, {'uuid': agent['uuid'], 'manifest_version': manifest_version}
+
+
+class AgentHelloFullScenario(AgentHelloScenario):
+    """
+    An agent that restarted: it reports no manifest and gets all its checks.
+    """
+    full = True
+
+    def setup(self, client) -> None:
+        pass
+
+
+def _tcp_check_body(name: str, country_id: int) -> dict:
+    return {
+        'name': name, 'place': 'country', 'entities': [country_id], 'ip': '127.0.0.1', 'port': 443,
+        'check_timeout': 2, 'interval': 120, 'enabled': True,
+    }
+
+
+class CheckCreateScenario(Scenario):
+    """
+    Create a TCP check in every region of a country, every region sends it to one of its agents.
+    """
+    writes = True
+
+    def __init__(self, dataset: dict):
+        super().__init__(dataset)
+        self.created = []
+        self._lock = threading.Lock()
+        self._number = 0
+
+    def available(self) -> bool:
+        return bool(self.dataset['countries'] and self.dataset['agents'])
+
+    def build(self, rnd):
+        with self._lock:
+            self._number += 1
+            number = self._number
+        return 'POST', f'{API}/check/tcp', None, _tcp_check_body(f'bench-created-{number}', rnd.choice(self.dataset['countries']))
+
+    def collect(self, response: object) -> None:
+        if isinstance(response, dict) and response.get('id'):
+            with self._lock:
+                self.created.append(response['id'])
+
+    def cleanup(self, client) -> None:
+        for multi_check_id in self.created:
+            client.request('DELETE', f'{API}/check/tcp/{multi_check_id}')
+        self.created = []
+
+
+class CheckUpdateScenario(CheckCreateScenario):
+    """
+    Update TCP checks that run in every region of a country, every check is sent to its agent again.
+    """
+
+    def setup(self, client) -> None:
+        for number in range(UPDATE_POOL):
+            country_id = self.dataset['countries'][number % len(self.dataset['countries'])]
+            status, response = client.request('POST', f'{API}/check/tcp', json_data=_tcp_check_body(f'bench-updated-{number}', country_id))
+            if status < 400 and isinstance(response, dict) and response.get('id'):
+                self.created.append((response['id'], country_id))
+
+    def build(self, rnd):
+        multi_check_id, country_id = rnd.choice(self.created)
+        body = _tcp_check_body(f'bench-updated-{multi_check_id}', country_id)
+        body['port'] = rnd.randint(1024, 65535)
+        return 'PUT', f'{API}/check/tcp/{multi_check_id}', None, body
+
+    def collect(self, response: object) -> None:
+        pass
+
+    def cleanup(self, client) -> None:
+        for multi_check_id, _ in self.created:
+            client.request('DELETE', f'{API}/check/tcp/{multi_check_id}')
+        self.created = []
+
+
+SCENARIOS = {
+    'checks_list': ChecksListScenario,
+    'checks_filter': ChecksFilterScenario,
+    'checks_statuses': ChecksStatusesScenario,
+    'check_statuses': CheckStatusesScenario,
+    'check_metrics': CheckMetricsScenario,
+    'check_metrics_columnar': CheckMetricsColumnarScenario,
+    'status_page': StatusPageScenario,
+    'alerts_history': AlertsHistoryScenario,
+    'agent_hello': AgentHelloScenario,
+    'agent_hello_full': AgentHelloFullScenario,
+    'check_create': CheckCreateScenario,
+    'check_update': CheckUpdateScenario,
+}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(fraction * len(values)), 1) - 1]
+
+
+def summarize(latencies: list[float], errors: int, statuses: dict, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'statuses': {str(status): number for status, number in sorted(statuses.items())},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'min': round(latencies[0] * 1000, 3) if count else 0.0,
+            'mean': round(sum(latencies) / count * 1000, 3) if count else 0.0,
+            'p50': round(percentile(latencies, 0.5) * 1000, 3),
+            'p90': round(percentile(latencies, 0.9) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3) if count else 0.0,
+        },
+    }
+
+
+def _worker(client, scenario: Scenario, deadline: float, budget: dict, result: dict, seed: int) -> None:
+    rnd = random.Random(seed)
+    try:
+        while time.perf_counter() < deadline:
+            with budget['lock']:
+                if budget['left'] is not None:
+                    if budget['left'] <= 0:
+                        break
+                    budget['left'] -= 1
+            method, path, params, json_data = scenario.build(rnd)
+            started = time.perf_counter()
+            try:
+                status, response = client.request(method, path, params, json_data)
+            except Exception:
+                status, response = 0, None
+            result['latencies'].append(time.perf_counter() - started)
+            result['statuses'][status] = result['statuses'].get(status, 0) + 1
+            if status == 0 or status >= 400:
+                result['errors'] += 1
+            else:
+                scenario.collect(response)
+    finally:
+        # Worker threads keep their own DB connection, give it back like teardown_request does
+        if not conn.is_closed():
+            conn.close()
+
+
+def run_scenario(
+        clients: list, scenario: Scenario, duration: float, requests: int = None, warmup: int = 5, seed: int = 0
+) -> dict:
+    """
+    Run the scenario with one closed-loop worker per client until the duration is over or the requests are sent.
+    """
+    scenario.setup(clients[0])
+    try:
+        rnd = random.Random(seed)
+        for _ in range(warmup):
+            method, path, params, json_data = scenario.build(rnd)
+            status, response = clients[0].request(method, path, params, json_data)
+            if status < 400:
+                scenario.collect(response)
+
+        budget = {'left': requests, 'lock': threading.Lock()}
+        results = [{'latencies': [], 'statuses': {}, 'errors': 0} for _ in clients]
+        started = time.perf_counter()
+        deadline = started + duration
+        threads = [
+            threading.Thread(target=_worker, args=(client, scenario, deadline, budget, result, seed + number + 1))
+            for number, (client, result) in enumerate(zip(clients, results))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        scenario.cleanup(clients[0])
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    statuses = {}
+    for result in results:
+        for status, number in result['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + number
+    return summarize(latencies, sum(result['errors'] for result in results), statuses, elapsed)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return ''
+
+
+def _backend() -> str:
+    if pgsql_enable == '1':
+        return 'postgresql'
+    if mysql_enable == '1':
+        return 'mysql'
+    return 'sqlite'
+
+
+def dataset_size() -> dict:
+    return {
+        'multi_checks': MultiCheck.select().count(),
+        'checks': SMON.select().count(),
+        'history_rows': SmonHistory.select().count(),
+        'alerts': RMONAlertsHistory.select().count(),
+    }
+
+
+def run(
+        clients: list, dataset: dict, scenarios: list[str], duration: float, requests: int = None, warmup: int = 5,
+        seed: int = 0, stub_agents=None, progress=None
+) -> dict:
+    """
+    Run the scenarios one after another and return the report.
+    """
+    report = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'commit': _git_commit(),
+            'backend': _backend(),
+            'transport': clients[0].transport,
+            'concurrency': len(clients),
+            'duration_s': duration,
+            'requests': requests,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dataset': dataset_size(),
+        },
+        'scenarios': {},
+    }
+    for name in scenarios:
+        scenario = SCENARIOS[name](dataset)
+        if not scenario.available():
+            report['scenarios'][name] = {'skipped': 'the dataset has nothing to run it on'}
+            continue
+        agent_requests = stub_agents.requests() if stub_agents else {}
+        result = run_scenario(clients, scenario, duration, requests, warmup, seed)
+        if stub_agents:
+            result['agent_requests'] = {
+                endpoint: count - agent_requests.get(endpoint, 0) for endpoint, count in stub_agents.requests().items()
+                if count != agent_requests.get(endpoint, 0)
+            }
+        report['scenarios'][name] = result
+        if progress:
+            latency = result['latency_ms']
+            progress(
+                f'{name}: {result["requests"]} requests, {result["errors"]} errors, {result["throughput_rps"]} rps, '
+                f'p50 {latency["p50"]} ms, p99 {latency["p99"]} ms'
+            )
+    return report
+
+
+def compare(baseline: dict, report: dict, threshold: float = 0.2) -> list[str]:
+    """
+    Return the regressions of the report against the baseline: p50 or p99 latency higher,
+    or throughput lower, by more than threshold, or new errors.
+    """
+    regressions = []
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or 'skipped' in base or 'skipped' in result:
+            continue
+        for metric in ('p50', 'p99'):
+            before = base['latency_ms'][metric]
+            after = result['latency_ms'][metric]
+            if before and after > before * (1 + threshold):
+                regressions.append(f'{name}: {metric} {before} ms -> {after} ms')
+        before = base['throughput_rps']
+        after = result['throughput_rps']
+        if before and after < before * (1 - threshold):
+            regressions.append(f'{name}: throughput {before} rps -> {after} rps')
+        if result['errors'] and not base['errors']:
+            regressions.append(f'{name}: {result["errors"]} errors')
+    return regressions
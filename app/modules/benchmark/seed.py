@@ -0,0 +1,311 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from peewee import fn, chunked
+
+from app.modules.db.db_model import (
+    conn, pgsql_enable, Server, SmonAgent, Country, Region, SmonGroup, MultiCheck, SMON, SmonTcpCheck, SmonHttpCheck,
+    SmonPingCheck, SmonDnsCheck, SmonSMTPCheck, SmonRabbitCheck, SmonHistory, RMONAlertsHistory, SmonStatusPage,
+    SmonStatusPageCheck
+)
+import app.modules.tools.smon as smon_mod
+
+# Everything the seed creates is named with this prefix, so a run can find its dataset again
+SEED_PREFIX = 'bench'
+STUB_AGENT_BASE_PORT = 15700
+# Rows per INSERT statement, keeps SQLite under its limit of bound variables
+INSERT_CHUNK = 100
+# Rows per transaction when seeding history
+HISTORY_BATCH = 10000
+CHECK_TYPE_SHARES = {'http': 0.4, 'tcp': 0.25, 'ping': 0.2, 'dns': 0.1, 'smtp': 0.03, 'rabbitmq': 0.02}
+CHECK_INTERVALS = (30, 60, 120, 300)
+# Share of multi-checks that run in every region of a country instead of on a single agent
+COUNTRY_CHECK_SHARE = 0.7
+HISTORY_FAILURE_RATE = 0.02
+STATUS_PAGE_CHECKS = 20
+
+
+def _next_id(model) -> int:
+    return (model.select(fn.MAX(model._meta.primary_key)).scalar() or 0) + 1
+
+
+def _bulk_insert(model, rows: list) -> None:
+    with conn.atomic():
+        for chunk in chunked(rows, INSERT_CHUNK):
+            model.insert_many(chunk).execute()
+
+
+def _reset_sequences(models: list) -> None:
+    # Rows are inserted with explicit ids, PostgreSQL sequences have to catch up with them
+    if pgsql_enable != '1':
+        return
+    for model in models:
+        table = model._meta.table_name
+        column = model._meta.primary_key.column_name
+        conn.execute_sql(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', '{column}'), (SELECT MAX(\"{column}\") FROM \"{table}\"))"
+        )
+
+
+def _agent_ip(number: int) -> str:
+    # Every agent gets its own loopback address, server IPs are unique
+    return f'127.1.{number // 250}.{number % 250 + 1}'
+
+
+def _type_row(check_type: str, smon_id: int, number: int, interval: int) -> dict:
+    host = f'host-{number}.{SEED_PREFIX}.local'
+    if check_type == 'http':
+        return {
+            'smon_id': smon_id, 'url': f'https://{host}/health', 'method': 'get', 'accepted_status_codes': [200],
+            'interval': interval, 'ignore_ssl_error': 0, 'redirects': 10,
+        }
+    if check_type == 'tcp':
+        return {'smon_id': smon_id, 'ip': host, 'port': 443, 'interval': interval}
+    if check_type == 'ping':
+        return {'smon_id': smon_id, 'ip': host, 'packet_size': 56, 'interval': interval, 'count_packets': 4, 'use_kernel_timestamp': False}
+    if check_type == 'dns':
+        return {'smon_id': smon_id, 'ip': host, 'port': 53, 'resolver': '127.0.0.53', 'record_type': 'a', 'interval': interval}
+    if check_type == 'smtp':
+        return {'smon_id': smon_id, 'ip': host, 'port': 25, 'username': 'user', 'password': 'password', 'interval': interval}
+    return {'smon_id': smon_id, 'ip': host, 'port': 5672, 'username': 'user', 'password': 'password', 'interval': interval, 'vhost': '/'}
+
+
+TYPE_MODELS = {
+    'http': SmonHttpCheck, 'tcp': SmonTcpCheck, 'ping': SmonPingCheck, 'dns': SmonDnsCheck, 'smtp': SmonSMTPCheck,
+    'rabbitmq': SmonRabbitCheck,
+}
+
+
+def seed_topology(group_id: int, countries: int, regions: int, agents: int, base_port: int) -> list[dict]:
+    """
+    Create the countries, regions, agent servers and agents. Agents are spread over the regions round robin.
+    """
+    country_id = _next_id(Country)
+    _bulk_insert(Country, [
+        {'id': country_id + i, 'name': f'{SEED_PREFIX}-country-{i}', 'description': '', 'group_id': group_id, 'enabled': True}
+        for i in range(countries)
+    ])
+    region_id = _next_id(Region)
+    region_rows = [
+        {
+            'id': region_id + i, 'name': f'{SEED_PREFIX}-region-{i}', 'description': '', 'group_id': group_id, 'enabled': True,
+            'country_id': country_id + i % countries,
+        } for i in range(regions)
+    ]
+    _bulk_insert(Region, region_rows)
+
+    server_id = _next_id(Server)
+    agent_id = _next_id(SmonAgent)
+    agent_rows = []
+    server_rows = []
+    for i in range(agents):
+        region = region_rows[i % regions]
+        server_rows.append({
+            'server_id': server_id + i, 'hostname': f'{SEED_PREFIX}-agent-{i}', 'ip': _agent_ip(i), 'group_id': str(group_id),
+            'enabled': 1, 'port': 22, 'description': '',
+        })
+        agent_rows.append({
+            'id': agent_id + i, 'server_id': server_id + i, 'name': f'{SEED_PREFIX}-agent-{i}', 'uuid': str(uuid.uuid4()),
+            'enabled': 1, 'description': '', 'shared': 0, 'port': base_port + i, 'region_id': region['id'],
+        })
+    _bulk_insert(Server, server_rows)
+    _bulk_insert(SmonAgent, agent_rows)
+    _reset_sequences([Country, Region, Server, SmonAgent])
+    return [
+        {'id': agent['id'], 'region_id': agent['region_id'], 'country_id': region_rows[i % regions]['country_id']}
+        for i, agent in enumerate(agent_rows)
+    ]
+
+
+def seed_checks(group_id: int, agents: list[dict], multi_checks: int, rnd: random.Random) -> list[dict]:
+    """
+    Create multi-checks of every type. Most of them run in all regions of a country, the others on one agent.
+    Returns the created SMON rows as {'id', 'check_type', 'interval', 'name'}.
+    """
+    check_group_id = _next_id(SmonGroup)
+    check_groups = max(multi_checks // 50, 1)
+    _bulk_insert(SmonGroup, [
+        {'id': check_group_id + i, 'name': f'{SEED_PREFIX}-group-{i}', 'group_id': group_id} for i in range(check_groups)
+    ])
+    agents_by_country = {}
+    for agent in agents:
+        agents_by_country.setdefault(agent['country_id'], {}).setdefault(agent['region_id'], []).append(agent)
+
+    now = datetime.now()
+    multi_check_id = _next_id(MultiCheck)
+    smon_id = _next_id(SMON)
+    multi_check_rows = []
+    smon_rows = []
+    type_rows = {check_type: [] for check_type in TYPE_MODELS}
+    checks = []
+    check_types = list(CHECK_TYPE_SHARES)
+    weights = list(CHECK_TYPE_SHARES.values())
+    for i in range(multi_checks):
+        check_type = rnd.choices(check_types, weights)[0]
+        interval = rnd.choice(CHECK_INTERVALS)
+        name = f'{SEED_PREFIX}-{check_type}-{i}'
+        if rnd.random() < COUNTRY_CHECK_SHARE:
+            place = 'country'
+            regions = agents_by_country[rnd.choice(list(agents_by_country))]
+            placements = [rnd.choice(region_agents) for region_agents in regions.values()]
+        else:
+            place = 'agent'
+            placements = [rnd.choice(agents)]
+        multi_check_rows.append({
+            'id': multi_check_id, 'entity_type': place, 'group_id': group_id, 'check_group_id': check_group_id + i % check_groups,
+            'priority': 'critical', 'threshold_timeout': 0, 'name': name, 'description': f'{check_type} check {i}',
+        })
+        for agent in placements:
+            status = 0 if rnd.random() < HISTORY_FAILURE_RATE else 1
+            smon_rows.append({
+                'id': smon_id, 'status': status, 'enabled': 1, 'response_time': str(round(rnd.uniform(5, 300), 2)),
+                'time_state': now, 'group_id': group_id, 'check_type': check_type, 'check_timeout': 2,
+                'region_id': agent['region_id'], 'country_id': agent['country_id'], 'agent_id': agent['id'],
+                'multi_check_id': multi_check_id, 'retries': 3, 'current_retries': 0, 'created_at': now, 'updated_at': now,
+                'ssl_expire_warning_alert': 0, 'ssl_expire_critical_alert': 0,
+            })
+            type_rows[check_type].append(_type_row(check_type, smon_id, i, interval))
+            checks.append({'id': smon_id, 'check_type': check_type, 'interval': interval, 'name': name})
+            smon_id += 1
+        multi_check_id += 1
+
+    _bulk_insert(MultiCheck, multi_check_rows)
+    _bulk_insert(SMON, smon_rows)
+    for check_type, rows in type_rows.items():
+        _bulk_insert(TYPE_MODELS[check_type], rows)
+    _reset_sequences([SmonGroup, MultiCheck, SMON])
+    return checks
+
+
+def _history_rows(checks: list[dict], history_rows: int, rnd: random.Random, now: datetime):
+    per_check, remainder = divmod(history_rows, len(checks))
+    for number, check in enumerate(checks):
+        check_id = smon_mod.get_check_id_by_name(check['check_type'])
+        interval = timedelta(seconds=check['interval'])
+        for point in range(per_check + (1 if number < remainder else 0)):
+            status = 0 if rnd.random() < HISTORY_FAILURE_RATE else 1
+            response_time = round(rnd.lognormvariate(4, 0.5), 2)
+            row = {
+                'smon_id': check['id'], 'check_id': check_id, 'response_time': response_time, 'status': status,
+                'mes': 'OK' if status else 'Connection timeout', 'date': now - interval * point,
+                'name_lookup': None, 'connect': None, 'app_connect': None, 'pre_transfer': None, 'redirect': None,
+                'start_transfer': None, 'download': None,
+            }
+            if check['check_type'] == 'http':
+                row.update({
+                    'name_lookup': str(round(response_time * 0.05, 3)), 'connect': str(round(response_time * 0.15, 3)),
+                    'app_connect': str(round(response_time * 0.35, 3)), 'pre_transfer': str(round(response_time * 0.36, 3)),
+                    'redirect': '0', 'start_transfer': str(round(response_time * 0.9, 3)), 'download': str(response_time),
+                })
+            yield row
+
+
+def seed_history(checks: list[dict], history_rows: int, rnd: random.Random, progress=None) -> None:
+    """
+    Insert history_rows results spread over the checks, one per check interval back from now.
+    """
+    if not checks or not history_rows:
+        return
+    now = datetime.now()
+    inserted = 0
+    for batch in chunked(_history_rows(checks, history_rows, rnd, now), HISTORY_BATCH):
+        _bulk_insert(SmonHistory, batch)
+        inserted += len(batch)
+        if progress:
+            progress(f'history: {inserted}/{history_rows}')
+
+
+def seed_alerts(group_id: int, checks: list[dict], alerts: int, rnd: random.Random) -> None:
+    if not checks or not alerts:
+        return
+    now = datetime.now()
+    rows = []
+    for i in range(alerts):
+        check = rnd.choice(checks)
+        level = rnd.choice(('warning', 'info'))
+        rows.append({
+            'name': check['name'], 'message': f'Check {check["name"]} is {"down" if level == "warning" else "up"}', 'level': level,
+            'rmon_id': check['id'], 'port': 0, 'group_id': group_id, 'service': 'RMON',
+            'date': now - timedelta(seconds=rnd.randint(0, 30 * 86400)),
+        })
+    for batch in chunked(rows, HISTORY_BATCH):
+        _bulk_insert(RMONAlertsHistory, batch)
+
+
+def seed_status_pages(group_id: int, status_pages: int, rnd: random.Random) -> None:
+    multi_check_ids = [
+        multi_check.id for multi_check in
+        MultiCheck.select(MultiCheck.id).where(MultiCheck.name.startswith(f'{SEED_PREFIX}-') & (MultiCheck.group_id == group_id))
+    ]
+    if not multi_check_ids:
+        return
+    page_id = _next_id(SmonStatusPage)
+    _bulk_insert(SmonStatusPage, [
+        {'id': page_id + i, 'name': f'{SEED_PREFIX} page {i}', 'slug': f'{SEED_PREFIX}-{page_id + i}', 'description': '', 'group_id': group_id}
+        for i in range(status_pages)
+    ])
+    _bulk_insert(SmonStatusPageCheck, [
+        {'page_id': page_id + i, 'multi_check_id': multi_check_id}
+        for i in range(status_pages)
+        for multi_check_id in rnd.sample(multi_check_ids, min(STATUS_PAGE_CHECKS, len(multi_check_ids)))
+    ])
+    _reset_sequences([SmonStatusPage])
+
+
+def seed(
+        group_id: int = 1, countries: int = 5, regions: int = 20, agents: int = 40, multi_checks: int = 1000,
+        history_rows: int = 1000000, alerts: int = 50000, status_pages: int = 10, base_port: int = STUB_AGENT_BASE_PORT,
+        random_seed: int = 0, progress=None
+) -> dict:
+    """
+    Fill the database with a realistic dataset through the models.
+
+    A multi-check placed on a country gets one check per region, so the number of checks is a few times multi_checks.
+    The same random_seed gives the same dataset.
+    """
+    if agents < regions:
+        raise ValueError('Every region needs at least one agent')
+    rnd = random.Random(random_seed)
+    agent_rows = seed_topology(group_id, countries, regions, agents, base_port)
+    if progress:
+        progress(f'topology: {countries} countries, {regions} regions, {agents} agents')
+    checks = seed_checks(group_id, agent_rows, multi_checks, rnd)
+    if progress:
+        progress(f'checks: {multi_checks} multi-checks, {len(checks)} checks')
+    seed_history(checks, history_rows, rnd, progress)
+    seed_alerts(group_id, checks, alerts, rnd)
+    if progress:
+        progress(f'alerts: {alerts}')
+    seed_status_pages(group_id, status_pages, rnd)
+    return {
+        'countries': countries, 'regions': regions, 'agents': agents, 'multi_checks': multi_checks, 'checks': len(checks),
+        'history_rows': history_rows, 'alerts': alerts, 'status_pages': status_pages,
+    }
+
+
+def load_dataset(group_id: int = 1) -> dict:
+    """
+    Find a seeded dataset: its agents, checks by type, countries and status pages.
+    """
+    agents = [
+        {'id': agent.id, 'uuid': agent.uuid, 'ip': agent.server_id.ip, 'port': agent.port, 'region_id': agent.region_id_id}
+        for agent in SmonAgent.select(SmonAgent, Server).join(Server).where(SmonAgent.name.startswith(f'{SEED_PREFIX}-agent-'))
+    ]
+    checks = {}
+    query = SMON.select(SMON.id, SMON.check_type, SMON.multi_check_id).where(
+        (SMON.group_id == group_id) & (SMON.agent_id.in_([agent['id'] for agent in agents] or [0]))
+    ).order_by(SMON.id)
+    for check in query:
+        checks.setdefault(check.check_type, []).append({'id': check.id, 'multi_check_id': check.multi_check_id_id})
+    countries = [
+        country.id for country in Country.select(Country.id).where(
+            Country.name.startswith(f'{SEED_PREFIX}-country-') & (Country.group_id == group_id)
+        )
+    ]
+    slugs = [
+        page.slug for page in SmonStatusPage.select(SmonStatusPage.slug).where(
+            SmonStatusPage.slug.startswith(f'{SEED_PREFIX}-') & (SmonStatusPage.group_id == group_id)
+        )
+    ]
+    return {'agents': agents, 'checks': checks, 'countries': countries, 'status_pages': slugs}
@@ -0,0 +1,103 @@
+import json
+import re
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_ID_PATTERN = re.compile(r'/\d+')
+
+
+class StubAgentHandler(BaseHTTPRequestHandler):
+    """
+    Answers the agent API like a real agent would, without running any check.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict) -> None:
+        self.server.count(self.command, self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+    def do_GET(self):
+        if self.path.startswith('/version'):
+            self._reply(200, {'version': '1.0'})
+        else:
+            self._reply(200, {'status': 'ok'})
+
+    def do_POST(self):
+        self._read_body()
+        if re.fullmatch(r'/check/\d+', self.path):
+            self._reply(201, {'status': 'created'})
+        else:
+            self._reply(200, {'status': 'ok'})
+
+    def do_DELETE(self):
+        self._read_body()
+        self._reply(200, {'status': 'deleted'})
+
+
+class StubAgentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency: float = 0):
+        super().__init__(address, StubAgentHandler)
+        self.latency = latency
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def count(self, method: str, path: str) -> None:
+        endpoint = method + ' ' + _ID_PATTERN.sub('/<id>', path.split('?')[0])
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+
+class StubAgents:
+    """
+    Run a stub agent on the address and port of every seeded agent.
+    """
+
+    def __init__(self, agents: list[dict], latency: float = 0):
+        self.agents = agents
+        self.latency = latency
+        self.servers = []
+
+    def start(self) -> 'StubAgents':
+        for agent in self.agents:
+            server = StubAgentServer((agent['ip'], agent['port']), self.latency)
+            threading.Thread(target=server.serve_forever, name=f'stub-agent-{agent["id"]}', daemon=True).start()
+            self.servers.append(server)
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+    def requests(self) -> dict:
+        total = {}
+        for server in self.servers:
+            with server._lock:
+                for endpoint, count in server.requests.items():
+                    total[endpoint] = total.get(endpoint, 0) + count
+        return total
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
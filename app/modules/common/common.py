@@ -1,9 +1,16 @@
+import sys
+import json
+import math
+import base64
+import calendar
+from array import array
 from datetime import datetime
 import dateutil
 
 from pytz import timezone
 
 import app.modules.db.sql as sql
+from app.modules.roxywi.exception import RoxywiValidationError
 
 
 def get_present_time():
@@ -18,22 +25,24 @@ def get_present_time():
 	return datetime.strptime(formatted_present, '%b %d %H:%M:%S %Y %Z')
 
 
-def _convert_to_time_zone(date: datetime) -> datetime:
+def _convert_to_time_zone(date: datetime, time_zone: str = None) -> datetime:
 	"""
 	Convert a datetime object to the specified time zone.
 
 	:param date: The datetime object to convert.
+	:param time_zone: The time zone to convert to. The time_zone setting of the user group is used by default.
 	:return: The converted datetime object.
 	"""
 	from_zone = dateutil.tz.gettz('UTC')
-	time_zone = sql.get_setting('time_zone')
+	if time_zone is None:
+		time_zone = sql.get_setting('time_zone')
 	to_zone = dateutil.tz.gettz(time_zone)
 	utc = date.replace(tzinfo=from_zone)
 	native = utc.astimezone(to_zone)
 	return native
 
 
-def get_time_zoned_date(date: datetime, fmt: str = None) -> str:
+def get_time_zoned_date(date: datetime, fmt: str = None, time_zone: str = None) -> str:
 	"""
 	Formats a given date and returns the formatted date in the specified or default format.
 
@@ -43,10 +52,13 @@ def get_time_zoned_date(date: datetime, fmt: str = None) -> str:
 	:param fmt: The format to use for the formatted date. If not provided, a default format will be used.
 	:type fmt: str, optional
 
+	:param time_zone: The time zone to format the date in. If not provided, the time_zone setting is used.
+	:type time_zone: str, optional
+
 	:return: The formatted date.
 	:rtype: str
 	"""
-	native = _convert_to_time_zone(date)
+	native = _convert_to_time_zone(date, time_zone)
 	date_format = '%Y-%m-%d %H:%M:%S'
 	if fmt:
 		return native.strftime(fmt)
@@ -54,9 +66,59 @@ def get_time_zoned_date(date: datetime, fmt: str = None) -> str:
 		return native.strftime(date_format)
 
 
+def to_epoch(date: datetime) -> int:
+	"""
+	Convert a naive UTC datetime, as it is stored in the database, to a unix timestamp.
+	"""
+	return calendar.timegm(date.timetuple())
+
+
+def metrics_to_columns(timestamps: list, series: dict, fmt: str = 'columnar') -> dict:
+	"""
+	Build a columnar metrics response: unix timestamps and a numeric array per series, missing points are null.
+
+	Timestamps are converted to the returned time_zone by the client. With the columnar_f32 format every series
+	is a base64 encoded little-endian float32 buffer and missing points are NaN.
+	"""
+	columns = {'timestamps': timestamps, 'time_zone': sql.get_setting('time_zone'), 'series': {}}
+	for name, values in series.items():
+		if fmt == 'columnar_f32':
+			buffer = array('f', [math.nan if value is None else value for value in values])
+			if sys.byteorder == 'big':
+				buffer.byteswap()
+			columns['series'][name] = base64.b64encode(buffer.tobytes()).decode('ascii')
+		else:
+			columns['series'][name] = [None if value is None or math.isnan(value) else value for value in values]
+	if fmt == 'columnar_f32':
+		columns['encoding'] = 'float32'
+	return columns
+
+
 def return_proxy_dict() -> dict:
 	proxy = sql.get_setting('proxy')
 	proxy_dict = {}
 	if proxy is not None and proxy != '' and proxy != 'None':
 		proxy_dict = {"https": proxy, "http": proxy}
 	return proxy_dict
+
+
+def encode_cursor(values: list) -> str:
+	"""
+	Encode the sort key of the last row of a page as an opaque cursor for the next page.
+	"""
+	return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+	"""
+	Decode a cursor made by encode_cursor, it must hold a sort key of size values.
+
+	:raises RoxywiValidationError: If the cursor is not valid.
+	"""
+	try:
+		values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+	except Exception:
+		raise RoxywiValidationError('Invalid cursor')
+	if not isinstance(values, list) or len(values) != size:
+		raise RoxywiValidationError('Invalid cursor')
+	return values
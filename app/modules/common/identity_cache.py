@@ -0,0 +1,69 @@
+import time
+import threading
+from typing import Any, Callable
+
+from flask import g, has_request_context
+
+import app.modules.common.metrics as app_metrics
+
+# How long a user lookup is reused by later requests with the same token, in seconds.
+# Changes made in this worker invalidate it at once, other workers pick them up after the TTL.
+IDENTITY_CACHE_TTL = 30
+IDENTITY_CACHE_MAX_SIZE = 10000
+
+_identity_cache: dict[tuple, tuple[float, Any]] = {}
+_identity_cache_lock = threading.Lock()
+
+
+def get_or_load(key: tuple, loader: Callable[[], Any]) -> Any:
+	"""
+	Return the cached value of the key or load it.
+
+	Values are memoized for the current request and cached in the process for IDENTITY_CACHE_TTL seconds.
+	The key must start with the user_id, so invalidate_user() can find it.
+	"""
+	memo = None
+	if has_request_context():
+		memo = g.setdefault('identity_memo', {})
+		if key in memo:
+			app_metrics.count_cache_lookup('identity', True)
+			return memo[key]
+
+	now = time.monotonic()
+	cached = _identity_cache.get(key)
+	if cached and now - cached[0] < IDENTITY_CACHE_TTL:
+		app_metrics.count_cache_lookup('identity', True)
+		value = cached[1]
+	else:
+		app_metrics.count_cache_lookup('identity', False)
+		value = loader()
+		with _identity_cache_lock:
+			if len(_identity_cache) >= IDENTITY_CACHE_MAX_SIZE:
+				_prune(now)
+			_identity_cache[key] = (now, value)
+
+	if memo is not None:
+		memo[key] = value
+	return value
+
+
+def _prune(now: float) -> None:
+	for key in [key for key, cached in _identity_cache.items() if now - cached[0] >= IDENTITY_CACHE_TTL]:
+		del _identity_cache[key]
+	if len(_identity_cache) >= IDENTITY_CACHE_MAX_SIZE:
+		_identity_cache.clear()
+
+
+def invalidate_user(user_id: int) -> None:
+	with _identity_cache_lock:
+		for key in [key for key in _identity_cache if str(key[0]) == str(user_id)]:
+			del _identity_cache[key]
+	if has_request_context():
+		g.pop('identity_memo', None)
+
+
+def invalidate_all() -> None:
+	with _identity_cache_lock:
+		_identity_cache.clear()
+	if has_request_context():
+		g.pop('identity_memo', None)
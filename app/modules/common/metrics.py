@@ -0,0 +1,74 @@
+import os
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app import registry as app_registry
+
+# With several workers the values are written to PROMETHEUS_MULTIPROC_DIR and exported by the MultiProcessCollector
+# of the app registry. Registering the metrics there as well would export every sample twice.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir'):
+	_registry = None
+else:
+	_registry = app_registry
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+DB_QUERY_SECONDS = Histogram(
+	'rmon_db_query_seconds', 'Database query latency', ['model', 'operation'], buckets=FAST_BUCKETS, registry=_registry
+)
+AGENT_REQUEST_SECONDS = Histogram(
+	'rmon_agent_request_seconds', 'Latency of the requests to the agents', ['agent_id', 'endpoint'], buckets=FAST_BUCKETS,
+	registry=_registry
+)
+AGENT_REQUEST_ERRORS = Counter(
+	'rmon_agent_request_errors', 'Agent requests that failed or were answered with an error status', ['agent_id', 'endpoint'],
+	registry=_registry
+)
+ALERT_DELIVERY_SECONDS = Histogram(
+	'rmon_alert_delivery_seconds', 'Alert delivery latency', ['channel_type'], buckets=SLOW_BUCKETS, registry=_registry
+)
+ALERT_DELIVERY_FAILURES = Counter(
+	'rmon_alert_delivery_failures', 'Alert deliveries that failed', ['channel_type'], registry=_registry
+)
+SSE_STREAMS = Gauge(
+	'rmon_sse_streams', 'Open server-sent event streams', multiprocess_mode='livesum', registry=_registry
+)
+JOB_SECONDS = Histogram(
+	'rmon_job_seconds', 'Duration of the scheduler jobs', ['job_id', 'status'], buckets=SLOW_BUCKETS, registry=_registry
+)
+CACHE_REQUESTS = Counter(
+	'rmon_cache_requests', 'Cache lookups, the hit rate is hit / (hit + miss)', ['cache', 'result'], registry=_registry
+)
+
+
+def observe_query(model: str, operation: str, seconds: float) -> None:
+	DB_QUERY_SECONDS.labels(model, operation).observe(seconds)
+
+
+def observe_agent_request(agent_id: int, endpoint: str, seconds: float, error: bool) -> None:
+	AGENT_REQUEST_SECONDS.labels(agent_id, endpoint).observe(seconds)
+	if error:
+		AGENT_REQUEST_ERRORS.labels(agent_id, endpoint).inc()
+
+
+def observe_alert_delivery(channel_type: str, seconds: float, failed: bool) -> None:
+	ALERT_DELIVERY_SECONDS.labels(channel_type).observe(seconds)
+	if failed:
+		ALERT_DELIVERY_FAILURES.labels(channel_type).inc()
+
+
+def observe_job(job_id: str, status: str, seconds: float) -> None:
+	JOB_SECONDS.labels(job_id, status).observe(seconds)
+
+
+def count_cache_lookup(cache: str, hit: bool) -> None:
+	CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def stream_opened() -> None:
+	SSE_STREAMS.inc()
+
+
+def stream_closed() -> None:
+	SSE_STREAMS.dec()
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from app.modules.db.db_model import conn, AlertEvent, SMON, mysql_enable, pgsql_enable
+from app.modules.db.common import out_error
+
+CHANNEL_FIELDS = {
+	'telegram': SMON.telegram_channel_id,
+	'slack': SMON.slack_channel_id,
+	'pd': SMON.pd_channel_id,
+	'mm': SMON.mm_channel_id,
+	'email': SMON.email_channel_id,
+	'incidentrelay': SMON.incidentrelay_channel_id,
+}
+
+
+def insert_alert_event(multi_check_id: int, message: str, level: str, entity_name: str, alert_key: str, kwargs: dict) -> int:
+	try:
+		return AlertEvent.insert(
+			multi_check_id=multi_check_id, message=message, level=level, entity_name=entity_name, alert_key=alert_key,
+			kwargs=kwargs, next_attempt_at=datetime.now()
+		).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def claim_due_alert_events(limit: int, until: datetime) -> list[AlertEvent]:
+	"""
+	Take up to limit due alerts and hide them from other runs until the lease expires.
+
+	The select and the lease are one transaction with the rows locked, FOR UPDATE on PostgreSQL and MySQL and
+	the write lock on SQLite, so two runs never take the same alert.
+	"""
+	now = datetime.now()
+	query = AlertEvent.select().where(
+		(AlertEvent.next_attempt_at.is_null()) | (AlertEvent.next_attempt_at <= now)
+	).order_by(AlertEvent.id).limit(limit)
+	if pgsql_enable == '1' or mysql_enable == '1':
+		transaction = conn.atomic()
+		query = query.for_update()
+	else:
+		transaction = conn.atomic('IMMEDIATE')
+	try:
+		with transaction:
+			events = list(query)
+			if events:
+				AlertEvent.update(next_attempt_at=until).where(AlertEvent.id.in_([event.id for event in events])).execute()
+		return events
+	except Exception as e:
+		out_error(e)
+
+
+def update_alert_event_retry(event_id: int, attempts: int, next_attempt_at: datetime, kwargs: dict) -> None:
+	try:
+		AlertEvent.update(
+			attempts=attempts, next_attempt_at=next_attempt_at, kwargs=kwargs
+		).where(AlertEvent.id == event_id).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def delete_alert_events(event_ids: list) -> None:
+	try:
+		AlertEvent.delete().where(AlertEvent.id.in_(event_ids)).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def select_alert_channels(multi_check_ids: set) -> dict:
+	"""
+	Return {multi_check_id: {channel_type: channel_id}} of the alert channels set on the checks.
+	"""
+	channels = {}
+	if not multi_check_ids:
+		return channels
+	try:
+		query = SMON.select(SMON.multi_check_id, *CHANNEL_FIELDS.values()).where(
+			SMON.multi_check_id.in_(list(multi_check_ids))
+		).tuples()
+		for row in query:
+			check_channels = channels.setdefault(row[0], {})
+			for channel_type, channel_id in zip(CHANNEL_FIELDS, row[1:]):
+				if channel_id:
+					check_channels.setdefault(channel_type, channel_id)
+	except Exception as e:
+		out_error(e)
+	return channels
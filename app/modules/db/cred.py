@@ -1,3 +1,5 @@
+from peewee import JOIN
+
 from app.modules.db.db_model import Cred, Server
 from app.modules.db.common import out_error
 from app.modules.roxywi.exception import RoxywiResourceNotFound
@@ -82,6 +84,22 @@ def update_private_key(cred_id: int, private_key: bytes):
 		out_error(e)
 
 
+def select_server_ssh(server_ip: str) -> dict:
+	"""
+	Return the SSH port of the server with the still encrypted fields of its credentials, in one query.
+	"""
+	query = Server.select(
+		Server.port, Cred.id.alias('cred_id'), Cred.name, Cred.key_enabled, Cred.username, Cred.password,
+		Cred.group_id, Cred.passphrase, Cred.private_key
+	).join(Cred, JOIN.LEFT_OUTER, on=(Server.cred_id == Cred.id)).where(Server.ip == server_ip).dicts()
+	try:
+		return query.get()
+	except Server.DoesNotExist:
+		raise RoxywiResourceNotFound
+	except Exception as e:
+		out_error(e)
+
+
 def get_ssh(ssh_id: int) -> Cred:
 	try:
 		return Cred.get(Cred.id == ssh_id)
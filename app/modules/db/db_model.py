@@ -1,5 +1,8 @@
+import time
+import threading
+
 from peewee import DateTimeField, AutoField, CharField, ForeignKeyField, IntegerField, SQL, Model, TextField, \
-    BooleanField, FloatField, MySQLDatabase, ModelSelect
+    BooleanField, FloatField, MySQLDatabase, ModelSelect, SelectBase, Insert, Update, Delete
 from playhouse.migrate import *
 from datetime import datetime
 from playhouse.shortcuts import ReconnectMixin
@@ -8,6 +11,7 @@ from playhouse.pool import PooledPostgresqlExtDatabase
 from psycopg2 import InterfaceError, OperationalError
 
 import app.modules.roxy_wi_tools as roxy_wi_tools
+import app.modules.common.metrics as app_metrics
 
 get_config = roxy_wi_tools.GetConfigVar()
 pgsql_enable = get_config.get_config_var('pgsql', 'enable')
@@ -21,11 +25,57 @@ else:
     from playhouse.sqlite_ext import JSONField
 
 
-class ReconnectMySQLDatabase(ReconnectMixin, MySQLDatabase):
+_query_labels = threading.local()
+
+
+def _query_operation(query) -> str:
+    if isinstance(query, SelectBase):
+        return 'select'
+    if isinstance(query, Insert):
+        return 'insert'
+    if isinstance(query, Update):
+        return 'update'
+    if isinstance(query, Delete):
+        return 'delete'
+    return 'raw'
+
+
+class QueryMetricsMixin:
+    """
+    Time every statement for rmon_db_query_seconds. Queries built from models are labelled with the table
+    and the operation, raw SQL with 'raw' and its first keyword.
+    """
+    def execute(self, query, *args, **kwargs):
+        model = getattr(query, 'model', None)
+        labels = (model._meta.table_name if model is not None else 'raw', _query_operation(query))
+        previous = getattr(_query_labels, 'labels', None)
+        _query_labels.labels = labels
+        try:
+            return super().execute(query, *args, **kwargs)
+        finally:
+            _query_labels.labels = previous
+
+    def execute_sql(self, sql, *args, **kwargs):
+        labels = getattr(_query_labels, 'labels', None)
+        if labels is None:
+            keyword = sql.split(None, 1)[0].lower() if sql.strip() else 'raw'
+            labels = ('raw', keyword if keyword.isalpha() else 'raw')
+        started = time.perf_counter()
+        try:
+            return super().execute_sql(sql, *args, **kwargs)
+        finally:
+            app_metrics.observe_query(labels[0], labels[1], time.perf_counter() - started)
+
+
+class ReconnectMySQLDatabase(QueryMetricsMixin, ReconnectMixin, MySQLDatabase):
     pass
 
 
-class SafePooledPostgresqlExtDatabase(PooledPostgresqlExtDatabase):
+class InstrumentedSqliteExtDatabase(QueryMetricsMixin, SqliteExtDatabase):
+    pass
+
+
+class SafePooledPostgresqlExtDatabase(QueryMetricsMixin, PooledPostgresqlExtDatabase):
     def execute_sql(self, sql, params=None, commit=True, **kwargs):
         try:
             return super().execute_sql(sql, params=params, commit=commit, **kwargs)
@@ -63,7 +113,7 @@ def connect(get_migrator=None):
         migration = MySQLMigrator(conn)
     else:
         db = "/var/lib/rmon/rmon.db"
-        conn = SqliteExtDatabase(db, pragmas=(
+        conn = InstrumentedSqliteExtDatabase(db, pragmas=(
                 ('cache_size', -1024 * 64),  # 64MB page-cache.
                 ('journal_mode', 'wal'),  # Use WAL-mode (you should always use this!).
                 ('foreign_keys', 1)
@@ -221,6 +271,14 @@ class Setting(BaseModel):
         constraints = [SQL('UNIQUE (param, group_id)')]
 
 
+class SettingsVersion(BaseModel):
+    group_id = IntegerField(primary_key=True)
+    version = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'settings_version'
+
+
 class UserGroups(BaseModel):
     user_id = ForeignKeyField(User, on_delete='Cascade')
     user_group_id = ForeignKeyField(Groups, on_delete='Cascade')
@@ -322,8 +380,9 @@ class MultiCheck(BaseModel):
     check_group_id = ForeignKeyField(SmonGroup, null=True, on_delete='SET NULL')
     runbook = TextField(null=True)
     priority = CharField(constraints=[SQL("DEFAULT 'critical'")])
-    expiration = DateTimeField(null=True)
+    expiration = DateTimeField(null=True, index=True)
     threshold_timeout = IntegerField(default=0)
+    keep_history = IntegerField(null=True)
     name = CharField(null=True)
     description = CharField(null=True)
 
@@ -379,6 +438,24 @@ class RMONAlertsHistory(BaseModel):
 
     class Meta:
         table_name = 'rmon_alerts_history'
+        indexes = (
+            # Keyset pagination of the alerts of a group, newest first
+            (('group_id', 'service', 'date', 'id'), False),
+        )
+
+
+class RMONAlertsHistoryCount(BaseModel):
+    # Kept by database triggers, so the alerts inserted by the agents are counted as well
+    group_id = IntegerField()
+    service = CharField()
+    total = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'rmon_alerts_history_count'
+        primary_key = False
+        indexes = (
+            (('group_id', 'service'), True),
+        )
 
 
 class ActionHistory(BaseModel):
@@ -610,6 +687,8 @@ class AlertEvent(BaseModel):
     level = CharField()
     kwargs = JSONField()
     created_at = DateTimeField(default=datetime.now)
+    attempts = IntegerField(default=0)
+    next_attempt_at = DateTimeField(null=True, index=True)
 
     class Meta:
         table_name = 'alert_event'
@@ -624,12 +703,102 @@ class AggregatorLock(BaseModel):
         table_name = 'aggregator_lock'
 
 
-def create_tables():
-    conn = connect()
-    with conn:
-        conn.create_tables(
-            [Groups, User, Server, Role, Telegram, Slack, UserGroups, Setting, Cred, Version, ActionHistory, Region,
-             SystemInfo, UserName, PD, SmonHistory, SmonAgent, SmonTcpCheck, SmonHttpCheck, SmonPingCheck, SmonDnsCheck, RoxyTool,
-             SmonStatusPage, SmonStatusPageCheck, SMON, SmonGroup, MM, RMONAlertsHistory, SmonSMTPCheck, SmonRabbitCheck,
-             Country, MultiCheck, Email, InstallationTasks, Migration, AlertEvent, AlertState, AggregatorLock, IncidentRelay]
+class JobRun(BaseModel):
+    id = AutoField()
+    job_id = CharField()
+    owner = CharField()
+    started_at = DateTimeField(default=datetime.now)
+    duration = FloatField()
+    status = CharField()
+    error = TextField(null=True)
+
+    class Meta:
+        table_name = 'job_run'
+        indexes = (
+            (('job_id', 'started_at'), False),
         )
+
+
+class SmonAgentManifest(BaseModel):
+    agent_id = ForeignKeyField(SmonAgent, on_delete='Cascade', unique=True)
+    version = IntegerField(default=0)
+    checks = JSONField(null=True)
+    updated_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'smon_agent_manifest'
+        primary_key = False
+
+
+class SmonHistoryRollup(BaseModel):
+    smon_id = ForeignKeyField(SMON, on_delete='Cascade')
+    check_id = IntegerField()
+    tier = CharField(max_length=3)
+    bucket = DateTimeField()
+    count = IntegerField(default=0)
+    up_count = IntegerField(default=0)
+    resp_sum = FloatField(default=0)
+    resp_min = FloatField(null=True)
+    resp_max = FloatField(null=True)
+    resp_histogram = JSONField(null=True)
+
+    class Meta:
+        table_name = 'smon_history_rollup'
+        primary_key = False
+        indexes = (
+            (('smon_id', 'tier', 'bucket'), True),
+            # Used by the rollup job and the retention cleanup, which work on the whole tier
+            (('tier', 'bucket'), False),
+        )
+
+
+class SmonRollupState(BaseModel):
+    tier = CharField(primary_key=True, max_length=3)
+    rolled_up_to = DateTimeField()
+
+    class Meta:
+        table_name = 'smon_rollup_state'
+
+
+class SmonRollupDirty(BaseModel):
+    id = AutoField()
+    date = DateTimeField()
+
+    class Meta:
+        table_name = 'smon_rollup_dirty'
+
+
+class SmonAgentLiveness(BaseModel):
+    agent_id = ForeignKeyField(SmonAgent, on_delete='Cascade', primary_key=True)
+    last_seen = DateTimeField(null=True)
+    alive = BooleanField(default=True)
+    changed_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'smon_agent_liveness'
+
+
+class SmonCheckFailover(BaseModel):
+    smon_id = ForeignKeyField(SMON, on_delete='Cascade', primary_key=True)
+    home_agent_id = ForeignKeyField(SmonAgent, on_delete='Cascade', index=True)
+    moved_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = 'smon_check_failover'
+
+
+def create_tables(database=None):
+    conn = database or connect()
+    models = [
+        Groups, User, Server, Role, Telegram, Slack, UserGroups, Setting, Cred, Version, ActionHistory, Region,
+        SystemInfo, UserName, PD, SmonHistory, SmonAgent, SmonTcpCheck, SmonHttpCheck, SmonPingCheck, SmonDnsCheck, RoxyTool,
+        SmonStatusPage, SmonStatusPageCheck, SMON, SmonGroup, MM, RMONAlertsHistory, SmonSMTPCheck, SmonRabbitCheck,
+        Country, MultiCheck, Email, InstallationTasks, Migration, AlertEvent, AlertState, AggregatorLock, IncidentRelay,
+        SmonAgentManifest, SmonHistoryRollup, SmonRollupState, SmonRollupDirty, SettingsVersion, SmonAgentLiveness, SmonCheckFailover,
+        JobRun, RMONAlertsHistoryCount
+    ]
+    with conn:
+        # On SQLite a partitioned smon_history is a view over day shards, which can not get the model indexes
+        if pgsql_enable != '1' and mysql_enable != '1' and 'smon_history' in [view.name for view in conn.get_views()]:
+            models.remove(SmonHistory)
+        conn.create_tables(models)
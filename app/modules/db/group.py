@@ -2,6 +2,8 @@ from peewee import IntegrityError
 
 from app.modules.db.db_model import Groups, Setting, UserGroups
 from app.modules.db.common import out_error, resource_not_empty
+from app.modules.db.sql import bump_settings_version
+import app.modules.common.identity_cache as identity_cache
 from app.modules.roxywi.exception import RoxywiResourceNotFound
 
 
@@ -52,6 +54,7 @@ def add_setting_for_new_group(group_id):
 		Setting.insert_many(data_source).execute()
 	except Exception as e:
 		out_error(e)
+	bump_settings_version(group_id)
 
 
 def delete_group(group_id):
@@ -63,6 +66,7 @@ def delete_group(group_id):
 		resource_not_empty()
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_all()
 
 
 def delete_group_settings(group_id):
@@ -70,6 +74,7 @@ def delete_group_settings(group_id):
 		Setting.delete().where(Setting.group_id == group_id).execute()
 	except Exception as e:
 		out_error(e)
+	bump_settings_version(group_id)
 
 
 def update_group(name, descript, group_id):
@@ -79,6 +84,7 @@ def update_group(name, descript, group_id):
 		out_error(e)
 		return False
 	else:
+		identity_cache.invalidate_all()
 		return True
 
 
@@ -1,12 +1,19 @@
 from typing import Union
 
-from app.modules.db.db_model import ActionHistory, RMONAlertsHistory, SMON
+from peewee import fn
+
+from app.modules.db.db_model import conn, ActionHistory, RMONAlertsHistory, RMONAlertsHistoryCount, SMON, mysql_enable, pgsql_enable
 from app.modules.db.sql import get_setting
 from app.modules.db.common import out_error
+import app.modules.db.search as search_sql
 import app.modules.roxy_wi_tools as roxy_wi_tools
-from app.modules.roxywi.exception import RoxywiResourceNotFound
+from app.modules.common.common import encode_cursor, decode_cursor
+from app.modules.roxywi.exception import RoxywiResourceNotFound, RoxywiValidationError
 from app.modules.roxywi.class_models import HistoryQuery
 
+# Counting the alerts filtered by name stops at this many rows, larger counts are returned as approximate
+ALERTS_FILTERED_COUNT_LIMIT = 10000
+
 
 def _return_sort_query(query: HistoryQuery) -> Union[str, None]:
 	sort_query = None
@@ -27,20 +34,53 @@ def _return_sort_query(query: HistoryQuery) -> Union[str, None]:
 	return sort_query
 
 
-def alerts_history(service: str, group_id: int, query: HistoryQuery):
-	where_query = (RMONAlertsHistory.service == service) & (RMONAlertsHistory.group_id == group_id)
-	if query.check_name:
-		where_query = where_query & (RMONAlertsHistory.name.contains(query.check_name))
-	sort_query = _return_sort_query(query)
-	if sort_query:
-		query = RMONAlertsHistory.select().where(where_query).order_by(sort_query).paginate(query.offset, query.limit)
+def _history_page(select, query: HistoryQuery) -> tuple[list, Union[str, None]]:
+	"""
+	Return a page of the alerts and the cursor of the next page.
+
+	Pages sorted by date are read by keyset on (date, id): with a cursor the page starts right after the last row
+	of the previous one, so deep pages cost the same as the first one. Other sorts use offset pagination
+	and have no cursor.
+	"""
+	if query.sort_by not in (None, 'date', '-date'):
+		try:
+			return list(select.order_by(_return_sort_query(query)).paginate(query.offset, query.limit)), None
+		except Exception as e:
+			out_error(e)
+
+	is_desc = query.sort_by == '-date'
+	if is_desc:
+		select = select.order_by(RMONAlertsHistory.date.desc(), RMONAlertsHistory.id.desc())
 	else:
-		query = RMONAlertsHistory.select().where(where_query).paginate(query.offset, query.limit)
+		select = select.order_by(RMONAlertsHistory.date.asc(), RMONAlertsHistory.id.asc())
+	if query.cursor:
+		last_date, last_id = decode_cursor(query.cursor, 2)
+		if not isinstance(last_date, str) or not isinstance(last_id, int):
+			raise RoxywiValidationError('Invalid cursor')
+		if is_desc:
+			after = (RMONAlertsHistory.date < last_date) | ((RMONAlertsHistory.date == last_date) & (RMONAlertsHistory.id < last_id))
+		else:
+			after = (RMONAlertsHistory.date > last_date) | ((RMONAlertsHistory.date == last_date) & (RMONAlertsHistory.id > last_id))
+		select = select.where(after)
+	else:
+		select = select.offset(max(query.offset - 1, 0) * query.limit)
 
 	try:
-		return query.execute()
+		# One more row tells if there is a next page
+		rows = list(select.limit(query.limit + 1))
 	except Exception as e:
 		out_error(e)
+	if len(rows) <= query.limit:
+		return rows, None
+	rows = rows[:query.limit]
+	return rows, encode_cursor([rows[-1].date, rows[-1].id])
+
+
+def alerts_history(service: str, group_id: int, query: HistoryQuery) -> tuple[list, Union[str, None]]:
+	where_query = (RMONAlertsHistory.service == service) & (RMONAlertsHistory.group_id == group_id)
+	if query.check_name:
+		where_query = where_query & search_sql.alerts_search(query.check_name)
+	return _history_page(RMONAlertsHistory.select().where(where_query), query)
 
 
 def all_alerts_history(service: str, group_id: int, **kwargs):
@@ -60,28 +100,38 @@ def all_alerts_history(service: str, group_id: int, **kwargs):
 		out_error(e)
 
 
-def total_alerts_history(service: str, group_id: int):
+def total_alerts_history(service: str, group_id: int) -> int:
 	try:
-		return RMONAlertsHistory.select().where(
-			(RMONAlertsHistory.service == service) & (RMONAlertsHistory.group_id == group_id)
-		).count()
+		return RMONAlertsHistoryCount.get(
+			(RMONAlertsHistoryCount.service == service) & (RMONAlertsHistoryCount.group_id == group_id)
+		).total
+	except RMONAlertsHistoryCount.DoesNotExist:
+		return 0
 	except Exception as e:
 		out_error(e)
 
 
-def rmon_multi_check_history(multi_check_id: int, group_id: int, query: HistoryQuery):
-	sort_query = _return_sort_query(query)
-	where_query = (RMONAlertsHistory.service == 'RMON') & (RMONAlertsHistory.group_id == group_id) & (SMON.multi_check_id == multi_check_id)
-	if sort_query:
-		query = RMONAlertsHistory.select().join(SMON).where(where_query).order_by(sort_query).paginate(query.offset, query.limit)
-	else:
-		query = RMONAlertsHistory.select().join(SMON).where(where_query).paginate(query.offset, query.limit)
+def total_filtered_alerts_history(service: str, group_id: int, check_name: str) -> tuple[int, bool]:
+	"""
+	Count the alerts of the group that match the check_name search, up to ALERTS_FILTERED_COUNT_LIMIT.
+
+	Returns the count and whether it is approximate, that is there are more alerts than the limit.
+	"""
+	matched = RMONAlertsHistory.select(RMONAlertsHistory.id).where(
+		(RMONAlertsHistory.service == service) &
+		(RMONAlertsHistory.group_id == group_id) &
+		search_sql.alerts_search(check_name)
+	).limit(ALERTS_FILTERED_COUNT_LIMIT + 1)
 	try:
-		return query.execute()
-	except RMONAlertsHistory.DoesNotExist:
-		raise RoxywiResourceNotFound
+		total = matched.count()
 	except Exception as e:
 		out_error(e)
+	return min(total, ALERTS_FILTERED_COUNT_LIMIT), total > ALERTS_FILTERED_COUNT_LIMIT
+
+
+def rmon_multi_check_history(multi_check_id: int, group_id: int, query: HistoryQuery) -> tuple[list, Union[str, None]]:
+	where_query = (RMONAlertsHistory.service == 'RMON') & (RMONAlertsHistory.group_id == group_id) & (SMON.multi_check_id == multi_check_id)
+	return _history_page(RMONAlertsHistory.select().join(SMON).where(where_query), query)
 
 
 def total_rmon_multi_check_history(multi_check_id: int, group_id: int):
@@ -98,6 +148,82 @@ def total_rmon_multi_check_history(multi_check_id: int, group_id: int):
 		out_error(e)
 
 
+def create_alerts_history_triggers() -> None:
+	"""
+	Create the triggers that keep rmon_alerts_history_count in step with rmon_alerts_history.
+	"""
+	if pgsql_enable == '1':
+		conn.execute_sql(
+			"CREATE OR REPLACE FUNCTION rmon_alerts_history_count() RETURNS trigger AS $$ "
+			"BEGIN "
+			"IF TG_OP = 'INSERT' THEN "
+			"INSERT INTO rmon_alerts_history_count (group_id, service, total) VALUES (NEW.group_id, NEW.service, 1) "
+			"ON CONFLICT (group_id, service) DO UPDATE SET total = rmon_alerts_history_count.total + 1; "
+			"ELSE "
+			"UPDATE rmon_alerts_history_count SET total = total - 1 WHERE group_id = OLD.group_id AND service = OLD.service; "
+			"END IF; "
+			"RETURN NULL; "
+			"END; $$ LANGUAGE plpgsql"
+		)
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count ON rmon_alerts_history')
+		conn.execute_sql(
+			'CREATE TRIGGER rmon_alerts_history_count AFTER INSERT OR DELETE ON rmon_alerts_history '
+			'FOR EACH ROW EXECUTE PROCEDURE rmon_alerts_history_count()'
+		)
+	elif mysql_enable == '1':
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count_insert')
+		conn.execute_sql(
+			'CREATE TRIGGER rmon_alerts_history_count_insert AFTER INSERT ON rmon_alerts_history FOR EACH ROW '
+			'INSERT INTO rmon_alerts_history_count (group_id, service, total) VALUES (NEW.group_id, NEW.service, 1) '
+			'ON DUPLICATE KEY UPDATE total = total + 1'
+		)
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count_delete')
+		conn.execute_sql(
+			'CREATE TRIGGER rmon_alerts_history_count_delete AFTER DELETE ON rmon_alerts_history FOR EACH ROW '
+			'UPDATE rmon_alerts_history_count SET total = total - 1 WHERE group_id = OLD.group_id AND service = OLD.service'
+		)
+	else:
+		conn.execute_sql(
+			'CREATE TRIGGER IF NOT EXISTS rmon_alerts_history_count_insert AFTER INSERT ON rmon_alerts_history '
+			'BEGIN '
+			'INSERT INTO rmon_alerts_history_count (group_id, service, total) VALUES (NEW.group_id, NEW.service, 1) '
+			'ON CONFLICT (group_id, service) DO UPDATE SET total = total + 1; '
+			'END'
+		)
+		conn.execute_sql(
+			'CREATE TRIGGER IF NOT EXISTS rmon_alerts_history_count_delete AFTER DELETE ON rmon_alerts_history '
+			'BEGIN '
+			'UPDATE rmon_alerts_history_count SET total = total - 1 WHERE group_id = OLD.group_id AND service = OLD.service; '
+			'END'
+		)
+
+
+def drop_alerts_history_triggers() -> None:
+	if pgsql_enable == '1':
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count ON rmon_alerts_history')
+		conn.execute_sql('DROP FUNCTION IF EXISTS rmon_alerts_history_count()')
+	else:
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count_insert')
+		conn.execute_sql('DROP TRIGGER IF EXISTS rmon_alerts_history_count_delete')
+
+
+def recount_alerts_history() -> None:
+	"""
+	Rebuild rmon_alerts_history_count from the alerts.
+	"""
+	counts = RMONAlertsHistory.select(
+		RMONAlertsHistory.group_id, RMONAlertsHistory.service, fn.COUNT(RMONAlertsHistory.id)
+	).group_by(RMONAlertsHistory.group_id, RMONAlertsHistory.service)
+	try:
+		with conn.atomic():
+			RMONAlertsHistoryCount.delete().execute()
+			RMONAlertsHistoryCount.insert_from(
+				counts, [RMONAlertsHistoryCount.group_id, RMONAlertsHistoryCount.service, RMONAlertsHistoryCount.total]
+			).execute()
+	except Exception as e:
+		out_error(e)
+
+
 def insert_alerts(check_id, group_id, level, check_name, port, message, service):
 	get_date = roxy_wi_tools.GetDate()
 	cur_date = get_date.return_date('regular')
@@ -121,6 +247,9 @@ def delete_alert_history(keep_interval: int, service: str):
 		).execute()
 	except Exception as e:
 		out_error(e)
+	# MySQL does not fire triggers for rows removed by foreign key cascades, like the alerts of deleted checks
+	if mysql_enable == '1':
+		recount_alerts_history()
 
 
 def insert_action_history(service: str, action: str, server_id: int, user_id: int, user_ip: str, server_ip: str, hostname: str):
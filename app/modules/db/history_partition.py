@@ -0,0 +1,452 @@
+import re
+from datetime import date, datetime, timedelta
+
+from peewee import Table, JOIN, fn
+
+from app.modules.db.db_model import conn, SmonHistory, SMON, MultiCheck, mysql_enable, pgsql_enable
+from app.modules.db.common import out_error
+
+# smon_history is split by day: native range partitions on PostgreSQL and MySQL,
+# and on SQLite per-day shard tables behind a smon_history view, which routes inserts with a trigger
+HISTORY_TABLE = 'smon_history'
+# Partitions are created this many days ahead, so inserts never miss one while the job is late
+PARTITIONS_AHEAD = 3
+# Checks with a shorter retention than the partitions are cleaned a day at a time, with deletes of this span
+RETENTION_DELETE_SPAN = timedelta(hours=1)
+_SHARD_PREFIX = 'smon_history_p'
+_MYSQL_PREFIX = 'p'
+
+
+def _is_sqlite() -> bool:
+	return mysql_enable != '1' and pgsql_enable != '1'
+
+
+def _partition_name(day: date) -> str:
+	if mysql_enable == '1':
+		return f'{_MYSQL_PREFIX}{day:%Y%m%d}'
+	return f'{_SHARD_PREFIX}{day:%Y%m%d}'
+
+
+def _partition_day(name: str):
+	match = re.fullmatch(rf'(?:{_SHARD_PREFIX}|{_MYSQL_PREFIX})(\d{{8}})', name)
+	if not match:
+		return None
+	return datetime.strptime(match.group(1), '%Y%m%d').date()
+
+
+def is_partitioned() -> bool:
+	try:
+		if pgsql_enable == '1':
+			cursor = conn.execute_sql(
+				"SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+				"WHERE c.relname = %s AND n.nspname = current_schema()", (HISTORY_TABLE,)
+			)
+			row = cursor.fetchone()
+			return row is not None and row[0] == 'p'
+		elif mysql_enable == '1':
+			cursor = conn.execute_sql(
+				"SELECT COUNT(*) FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+				"AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL", (HISTORY_TABLE,)
+			)
+			return cursor.fetchone()[0] > 0
+		else:
+			cursor = conn.execute_sql("SELECT type FROM sqlite_master WHERE name = ?", (HISTORY_TABLE,))
+			row = cursor.fetchone()
+			return row is not None and row[0] == 'view'
+	except Exception as e:
+		out_error(e)
+
+
+def select_partitions() -> dict:
+	"""
+	Return {day: partition name} of the day partitions of smon_history.
+	"""
+	try:
+		if pgsql_enable == '1':
+			cursor = conn.execute_sql(
+				"SELECT child.relname FROM pg_inherits i JOIN pg_class parent ON parent.oid = i.inhparent "
+				"JOIN pg_class child ON child.oid = i.inhrelid WHERE parent.relname = %s", (HISTORY_TABLE,)
+			)
+		elif mysql_enable == '1':
+			cursor = conn.execute_sql(
+				"SELECT PARTITION_NAME FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+				"AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL", (HISTORY_TABLE,)
+			)
+		else:
+			cursor = conn.execute_sql(
+				"SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f'{_SHARD_PREFIX}%',)
+			)
+		partitions = {}
+		for (name,) in cursor.fetchall():
+			day = _partition_day(name)
+			if day is not None:
+				partitions[day] = name
+		return partitions
+	except Exception as e:
+		out_error(e)
+
+
+def _history_columns() -> list[str]:
+	return [field.column_name for field in SmonHistory._meta.sorted_fields]
+
+
+def _sqlite_shard_schema(shard: str) -> tuple[str, list[str]]:
+	cursor = conn.execute_sql("SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (shard,))
+	table_sql = ''
+	index_sqls = []
+	for object_type, object_sql in cursor.fetchall():
+		if object_type == 'table':
+			table_sql = object_sql
+		elif object_type == 'index':
+			index_sqls.append(object_sql)
+	return table_sql, index_sqls
+
+
+def _sqlite_create_shard(shard: str, template: str) -> None:
+	table_sql, index_sqls = _sqlite_shard_schema(template)
+	table_sql = re.sub(r'^CREATE TABLE\s+("[^"]+"|\S+)', f'CREATE TABLE IF NOT EXISTS "{shard}"', table_sql, count=1)
+	conn.execute_sql(table_sql)
+	for number, index_sql in enumerate(index_sqls):
+		columns = index_sql[index_sql.index('('):]
+		conn.execute_sql(f'CREATE INDEX IF NOT EXISTS "{shard}_{number}" ON "{shard}" {columns}')
+
+
+def _sqlite_route_shards(shards: dict) -> None:
+	"""
+	Rebuild the smon_history view over the shards and its triggers.
+
+	Inserts go to the shard of their day, older ones to the oldest shard and newer ones to the newest.
+	"""
+	days = sorted(shards)
+	columns = _history_columns()
+	column_list = ', '.join(f'"{column}"' for column in columns)
+	new_values = ', '.join(f'NEW."{column}"' for column in columns)
+	inserts = []
+	for number, day in enumerate(days):
+		conditions = []
+		if number > 0:
+			conditions.append(f"NEW.date >= '{day:%Y-%m-%d}'")
+		if number < len(days) - 1:
+			conditions.append(f"NEW.date < '{days[number + 1]:%Y-%m-%d}'")
+		else:
+			conditions = [f"({' AND '.join(conditions) or '1'} OR NEW.date IS NULL)"]
+		where = ' AND '.join(conditions) or '1'
+		inserts.append(f'INSERT INTO "{shards[day]}" ({column_list}) SELECT {new_values} WHERE {where};')
+	union = ' UNION ALL '.join(f'SELECT {column_list} FROM "{shards[day]}"' for day in days)
+
+	with conn.atomic():
+		conn.execute_sql(f'DROP VIEW IF EXISTS "{HISTORY_TABLE}"')
+		conn.execute_sql(f'CREATE VIEW "{HISTORY_TABLE}" AS {union}')
+		conn.execute_sql(
+			f'CREATE TRIGGER "{HISTORY_TABLE}_insert" INSTEAD OF INSERT ON "{HISTORY_TABLE}" BEGIN {" ".join(inserts)} END'
+		)
+
+
+def _pgsql_create_partition(day: date) -> None:
+	conn.execute_sql(
+		f'CREATE TABLE IF NOT EXISTS "{_partition_name(day)}" PARTITION OF "{HISTORY_TABLE}" '
+		f"FOR VALUES FROM ('{day:%Y-%m-%d}') TO ('{day + timedelta(days=1):%Y-%m-%d}')"
+	)
+
+
+def _mysql_partition_clause(day: date) -> str:
+	return f"PARTITION {_partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}'))"
+
+
+def ensure_partitions(days_ahead: int = PARTITIONS_AHEAD) -> int:
+	"""
+	Create the partitions from today to days_ahead days ahead. Returns the number of created partitions.
+	"""
+	today = date.today()
+	try:
+		if not is_partitioned():
+			return 0
+		partitions = select_partitions()
+		missing = [today + timedelta(days=offset) for offset in range(days_ahead + 1)]
+		missing = [day for day in missing if day not in partitions and (not partitions or day > max(partitions))]
+		if not missing:
+			return 0
+		if pgsql_enable == '1':
+			for day in missing:
+				_pgsql_create_partition(day)
+		elif mysql_enable == '1':
+			conn.execute_sql(
+				f'ALTER TABLE {HISTORY_TABLE} REORGANIZE PARTITION pmax INTO '
+				f'({", ".join(_mysql_partition_clause(day) for day in missing)}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+			)
+		else:
+			template = partitions[max(partitions)]
+			for day in missing:
+				_sqlite_create_shard(_partition_name(day), template)
+				partitions[day] = _partition_name(day)
+			_sqlite_route_shards(partitions)
+		return len(missing)
+	except Exception as e:
+		out_error(e)
+
+
+def drop_partitions_before(day: date) -> int:
+	"""
+	Drop the partitions of the days before day, which is the whole-day history retention.
+
+	The newest partition is never dropped. Returns the number of dropped partitions.
+	"""
+	try:
+		if not is_partitioned():
+			return 0
+		partitions = select_partitions()
+		if not partitions:
+			return 0
+		expired = [partition_day for partition_day in partitions if partition_day < day and partition_day != max(partitions)]
+		if pgsql_enable == '1':
+			for partition_day in expired:
+				conn.execute_sql(f'DROP TABLE IF EXISTS "{partitions[partition_day]}"')
+			# Rows without their day partition land in the default one
+			conn.execute_sql(f"DELETE FROM \"{HISTORY_TABLE}_default\" WHERE date < '{day:%Y-%m-%d}'")
+		elif mysql_enable == '1':
+			if expired:
+				conn.execute_sql(
+					f'ALTER TABLE {HISTORY_TABLE} DROP PARTITION {", ".join(partitions[partition_day] for partition_day in expired)}'
+				)
+		else:
+			remaining = {partition_day: name for partition_day, name in partitions.items() if partition_day not in expired}
+			if expired:
+				_sqlite_route_shards(remaining)
+				for partition_day in expired:
+					conn.execute_sql(f'DROP TABLE IF EXISTS "{partitions[partition_day]}"')
+			# The oldest shard also takes the older rows, like the default partition of PostgreSQL
+			conn.execute_sql(f'DELETE FROM "{remaining[min(remaining)]}" WHERE date < ?', (f'{day:%Y-%m-%d}',))
+		return len(expired)
+	except Exception as e:
+		out_error(e)
+
+
+def _history_tables(start: date, end: date, partitions: dict = None) -> list[str]:
+	"""
+	Return the physical tables that hold the history between start and end.
+
+	partitions is select_partitions() of a partitioned smon_history, None for a plain one.
+	"""
+	if not _is_sqlite() or not partitions:
+		return [HISTORY_TABLE]
+	days = sorted(partitions)
+	tables = []
+	for number, day in enumerate(days):
+		# The oldest shard also takes older rows and the newest one newer rows
+		next_day = days[number + 1] if number < len(days) - 1 else date.max
+		first = day if number > 0 else date.min
+		if first < end and next_day > start:
+			tables.append(partitions[day])
+	return tables
+
+
+def _kept_checks(age: int, default_days: int):
+	"""
+	Query of the ids of the checks that keep their history for at least age days.
+	"""
+	return SMON.select(SMON.id).join(MultiCheck, JOIN.LEFT_OUTER, on=(SMON.multi_check_id == MultiCheck.id)).where(
+		fn.COALESCE(MultiCheck.keep_history, default_days) >= age
+	)
+
+
+def _compact_partition(day: date, partitions: dict, kept, start: datetime, end: datetime) -> None:
+	"""
+	Keep only the rows of the kept checks in the partition of day: they are copied aside, the partition is emptied
+	and they are copied back, so the cost follows the kept rows and not the removed ones.
+	"""
+	columns = _history_columns()
+	column_list = ', '.join(f'"{column}"' for column in columns)
+	compact_table = f'{HISTORY_TABLE}_compact'
+	table_name = HISTORY_TABLE if mysql_enable == '1' else partitions[day]
+	table = Table(table_name, columns=columns).bind(conn)
+	condition = (table.date < start) | (table.date >= end) | (table.smon_id.in_(kept))
+	if mysql_enable == '1':
+		# The first partition also takes the older rows
+		days = sorted(partitions)
+		if day != days[0]:
+			condition &= table.date >= datetime.combine(days[days.index(day) - 1] + timedelta(days=1), datetime.min.time())
+		condition &= table.date < end
+	query_sql, params = table.select(*[getattr(table, column) for column in columns]).where(condition).sql()
+
+	if pgsql_enable == '1':
+		with conn.atomic():
+			conn.execute_sql(f'CREATE TEMP TABLE "{compact_table}" ON COMMIT DROP AS {query_sql}', params)
+			conn.execute_sql(f'TRUNCATE "{table_name}"')
+			conn.execute_sql(f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM "{compact_table}"')
+	elif mysql_enable == '1':
+		# The kept rows go to a plain table that is swapped with the partition
+		conn.execute_sql(f'DROP TABLE IF EXISTS {compact_table}')
+		conn.execute_sql(f'CREATE TABLE {compact_table} LIKE {HISTORY_TABLE}')
+		conn.execute_sql(f'ALTER TABLE {compact_table} REMOVE PARTITIONING')
+		conn.execute_sql(f'INSERT INTO {compact_table} {query_sql}', params)
+		conn.execute_sql(f'ALTER TABLE {HISTORY_TABLE} EXCHANGE PARTITION {partitions[day]} WITH TABLE {compact_table}')
+		conn.execute_sql(f'DROP TABLE {compact_table}')
+	else:
+		with conn.atomic():
+			conn.execute_sql(f'DROP TABLE IF EXISTS temp."{compact_table}"')
+			conn.execute_sql(f'CREATE TEMP TABLE "{compact_table}" AS {query_sql}', params)
+			conn.execute_sql(f'DELETE FROM "{table_name}"')
+			conn.execute_sql(f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM temp."{compact_table}"')
+			conn.execute_sql(f'DROP TABLE temp."{compact_table}"')
+
+
+def expire_day_history(day: date, default_days: int, partitions: dict = None) -> None:
+	"""
+	Remove the history of day of the checks that keep less than its age in days, by their own keep_history
+	or by default_days.
+
+	When most of the checks lose their rows, the day partition is compacted, otherwise the expired rows are deleted
+	RETENTION_DELETE_SPAN at a time. partitions is select_partitions() of a partitioned smon_history, None for a plain one.
+	"""
+	kept = _kept_checks((date.today() - day).days, default_days)
+	start = datetime.combine(day, datetime.min.time())
+	end = start + timedelta(days=1)
+	try:
+		history = Table(HISTORY_TABLE, columns=_history_columns()).bind(conn)
+		if not history.select(history.smon_id).where(
+			(history.date >= start) & (history.date < end) & (history.smon_id.not_in(kept))
+		).limit(1).exists():
+			return
+		kept_count = kept.count()
+		if partitions and day in partitions and kept_count < SMON.select().count() - kept_count:
+			_compact_partition(day, partitions, kept, start, end)
+			return
+		for table_name in _history_tables(day, day + timedelta(days=1), partitions):
+			table = Table(table_name, columns=_history_columns()).bind(conn)
+			span_start = start
+			while span_start < end:
+				span_end = min(span_start + RETENTION_DELETE_SPAN, end)
+				table.delete().where(
+					(table.date >= span_start) & (table.date < span_end) & (table.smon_id.not_in(kept))
+				).execute()
+				span_start = span_end
+	except Exception as e:
+		out_error(e)
+
+
+def select_checks_keep_history() -> dict:
+	"""
+	Return {smon_id: days} of the checks with their own history retention.
+	"""
+	try:
+		query = SMON.select(SMON.id, MultiCheck.keep_history).join(
+			MultiCheck, on=(SMON.multi_check_id == MultiCheck.id)
+		).where(MultiCheck.keep_history.is_null(False)).tuples()
+		return {smon_id: days for smon_id, days in query}
+	except Exception as e:
+		out_error(e)
+
+
+def delete_history_before(before: datetime) -> None:
+	"""
+	Delete the rows older than before from a smon_history that is not partitioned, a day per transaction.
+	"""
+	try:
+		oldest = SmonHistory.select(SmonHistory.date).order_by(SmonHistory.date).limit(1).scalar()
+		if oldest is None:
+			return
+		if isinstance(oldest, str):
+			oldest = datetime.strptime(oldest[:19], '%Y-%m-%d %H:%M:%S')
+		day_end = datetime.combine(oldest.date() + timedelta(days=1), datetime.min.time())
+		while True:
+			SmonHistory.delete().where(SmonHistory.date < min(day_end, before)).execute()
+			if day_end >= before:
+				break
+			day_end += timedelta(days=1)
+	except Exception as e:
+		out_error(e)
+
+
+def partition_history_table(keep_days: int) -> None:
+	"""
+	Convert smon_history to day partitions, keeping the rows of the last keep_days days.
+	"""
+	if is_partitioned():
+		return
+	today = date.today()
+	first_day = today - timedelta(days=keep_days)
+	days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + PARTITIONS_AHEAD + 1)]
+
+	if pgsql_enable == '1':
+		old_table = f'{HISTORY_TABLE}_unpartitioned'
+		columns = ', '.join(f'"{column}"' for column in _history_columns())
+		with conn.atomic():
+			conn.execute_sql(f'ALTER TABLE "{HISTORY_TABLE}" RENAME TO "{old_table}"')
+			conn.execute_sql(
+				f'CREATE TABLE "{HISTORY_TABLE}" (LIKE "{old_table}" INCLUDING DEFAULTS) PARTITION BY RANGE (date)'
+			)
+			conn.execute_sql(
+				f'ALTER TABLE "{HISTORY_TABLE}" ADD FOREIGN KEY ("smon_id") REFERENCES "smon" ("id") ON DELETE CASCADE'
+			)
+			for day in days:
+				_pgsql_create_partition(day)
+			conn.execute_sql(f'CREATE TABLE "{HISTORY_TABLE}_default" PARTITION OF "{HISTORY_TABLE}" DEFAULT')
+		# The kept rows are copied a day per transaction, so the agents write to the new table meanwhile
+		for day in days:
+			if day > today:
+				break
+			condition = f"date >= '{day:%Y-%m-%d}'"
+			if day < today:
+				condition += f" AND date < '{day + timedelta(days=1):%Y-%m-%d}'"
+			with conn.atomic():
+				conn.execute_sql(f'INSERT INTO "{HISTORY_TABLE}" ({columns}) SELECT {columns} FROM "{old_table}" WHERE {condition}')
+		conn.execute_sql(f'DROP TABLE "{old_table}"')
+		# The index names are free once the old table is gone
+		SmonHistory._schema.create_indexes(safe=True)
+	elif mysql_enable == '1':
+		# Partitioned InnoDB tables can not have foreign keys
+		cursor = conn.execute_sql(
+			"SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+			"WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s", (HISTORY_TABLE,)
+		)
+		for (constraint,) in cursor.fetchall():
+			conn.execute_sql(f'ALTER TABLE {HISTORY_TABLE} DROP FOREIGN KEY {constraint}')
+		# The first partition also takes the older rows, they go away when it is dropped
+		conn.execute_sql(
+			f'ALTER TABLE {HISTORY_TABLE} PARTITION BY RANGE (TO_DAYS(date)) '
+			f'({", ".join(_mysql_partition_clause(day) for day in days)}, PARTITION pmax VALUES LESS THAN MAXVALUE)'
+		)
+	else:
+		# The current table becomes the shard of today, its rows older than first_day must not wait for it to be dropped
+		delete_history_before(datetime.combine(first_day, datetime.min.time()))
+		shards = {}
+		with conn.atomic():
+			conn.execute_sql(f'ALTER TABLE "{HISTORY_TABLE}" RENAME TO "{_partition_name(today)}"')
+			shards[today] = _partition_name(today)
+			for day in days:
+				if day > today:
+					_sqlite_create_shard(_partition_name(day), shards[today])
+					shards[day] = _partition_name(day)
+			_sqlite_route_shards(shards)
+
+
+def unpartition_history_table() -> None:
+	"""
+	Move the history back to a plain smon_history table.
+	"""
+	if not is_partitioned():
+		return
+	columns = ', '.join(f'"{column}"' for column in _history_columns())
+	if pgsql_enable == '1':
+		old_table = f'{HISTORY_TABLE}_partitioned'
+		with conn.atomic():
+			conn.execute_sql(f'ALTER TABLE "{HISTORY_TABLE}" RENAME TO "{old_table}"')
+			conn.execute_sql(f'CREATE TABLE "{HISTORY_TABLE}" (LIKE "{old_table}" INCLUDING DEFAULTS)')
+			conn.execute_sql(
+				f'ALTER TABLE "{HISTORY_TABLE}" ADD FOREIGN KEY ("smon_id") REFERENCES "smon" ("id") ON DELETE CASCADE'
+			)
+			conn.execute_sql(f'INSERT INTO "{HISTORY_TABLE}" ({columns}) SELECT {columns} FROM "{old_table}"')
+			conn.execute_sql(f'DROP TABLE "{old_table}" CASCADE')
+			SmonHistory._schema.create_indexes(safe=True)
+	elif mysql_enable == '1':
+		conn.execute_sql(f'ALTER TABLE {HISTORY_TABLE} REMOVE PARTITIONING')
+	else:
+		shards = select_partitions()
+		with conn.atomic():
+			conn.execute_sql(f'DROP VIEW IF EXISTS "{HISTORY_TABLE}"')
+			# Indexes are created after the shards are gone, the first shard still has the original index names
+			SmonHistory._schema.create_table(safe=True)
+			for shard in shards.values():
+				conn.execute_sql(f'INSERT INTO "{HISTORY_TABLE}" ({columns}) SELECT {columns} FROM "{shard}"')
+				conn.execute_sql(f'DROP TABLE "{shard}"')
+			SmonHistory._schema.create_indexes(safe=True)
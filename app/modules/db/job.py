@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from peewee import IntegrityError
+
+from app.modules.db.db_model import conn, AggregatorLock, JobRun
+from app.modules.db.common import out_error
+
+
+def acquire_lock(lock_name: str, owner: str, ttl: int) -> bool:
+	"""
+	Take or renew a lease on the lock for ttl seconds. A lock held by another owner can be taken once it has expired.
+
+	Returns True if the owner holds the lock now.
+	"""
+	now = datetime.now()
+	expires_at = now + timedelta(seconds=ttl)
+	try:
+		with conn.atomic():
+			AggregatorLock.insert(lock_name=lock_name, owner=owner, expires_at=expires_at).execute()
+		return True
+	except IntegrityError:
+		pass
+	except Exception as e:
+		out_error(e)
+	try:
+		return AggregatorLock.update(owner=owner, expires_at=expires_at).where(
+			(AggregatorLock.lock_name == lock_name) &
+			((AggregatorLock.owner == owner) | (AggregatorLock.expires_at < now))
+		).execute() == 1
+	except Exception as e:
+		out_error(e)
+
+
+def release_lock(lock_name: str, owner: str) -> None:
+	try:
+		AggregatorLock.delete().where((AggregatorLock.lock_name == lock_name) & (AggregatorLock.owner == owner)).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def insert_job_run(job_id: str, owner: str, started_at: datetime, duration: float, status: str, error: str = None) -> None:
+	try:
+		JobRun.insert(
+			job_id=job_id, owner=owner, started_at=started_at, duration=duration, status=status, error=error
+		).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def delete_job_runs_before(date: datetime) -> None:
+	try:
+		JobRun.delete().where(JobRun.started_at < date).execute()
+	except Exception as e:
+		out_error(e)
@@ -25,6 +25,15 @@ def get_region_with_group(region_id: int, group_id: int) -> Region:
         out_error(e)
 
 
+def get_region(region_id: int) -> Region:
+    try:
+        return Region.get(Region.id == region_id)
+    except Region.DoesNotExist:
+        raise RoxywiResourceNotFound
+    except Exception as e:
+        out_error(e)
+
+
 def create_region(body: RegionRequest) -> int:
     try:
         last_id = Region.insert(**body.model_dump(mode='json', exclude={'agents'})).execute()
@@ -0,0 +1,141 @@
+from datetime import datetime
+from typing import Union, Iterator
+
+from peewee import fn, chunked, Case
+
+from app.modules.db.db_model import conn, SmonHistory, SmonHistoryRollup, SmonRollupState, SmonRollupDirty
+from app.modules.db.common import out_error
+
+
+def get_rollup_watermarks() -> dict:
+	try:
+		return {state.tier: state.rolled_up_to for state in SmonRollupState.select().execute()}
+	except Exception as e:
+		out_error(e)
+
+
+def select_rollup_dirty() -> tuple[list[int], Union[datetime, None]]:
+	"""
+	Return the ids of the late history marks and the date of the oldest one.
+	"""
+	try:
+		marks = list(SmonRollupDirty.select().tuples())
+	except Exception as e:
+		out_error(e)
+	return [mark_id for mark_id, _ in marks], min((date for _, date in marks), default=None)
+
+
+def select_history_for_rollup(start: datetime, end: datetime) -> Iterator[tuple]:
+	try:
+		return SmonHistory.select(
+			SmonHistory.smon_id, SmonHistory.check_id, SmonHistory.date, SmonHistory.status, SmonHistory.response_time
+		).where(
+			(SmonHistory.date >= start) & (SmonHistory.date < end)
+		).tuples().iterator()
+	except Exception as e:
+		out_error(e)
+
+
+def select_rollups_for_rollup(tier: str, start: datetime, end: datetime) -> Iterator[SmonHistoryRollup]:
+	try:
+		return SmonHistoryRollup.select().where(
+			(SmonHistoryRollup.tier == tier) & (SmonHistoryRollup.bucket >= start) & (SmonHistoryRollup.bucket < end)
+		).iterator()
+	except Exception as e:
+		out_error(e)
+
+
+def get_oldest_history_date() -> Union[datetime, None]:
+	try:
+		return SmonHistory.select(fn.MIN(SmonHistory.date)).scalar()
+	except Exception as e:
+		out_error(e)
+
+
+def get_oldest_rollup_date(tier: str) -> Union[datetime, None]:
+	try:
+		return SmonHistoryRollup.select(fn.MIN(SmonHistoryRollup.bucket)).where(SmonHistoryRollup.tier == tier).scalar()
+	except Exception as e:
+		out_error(e)
+
+
+def replace_rollups(
+		tier: str, rows: list[dict], start: datetime, end: datetime, rewind: dict = None, dirty_ids: list = None
+) -> None:
+	"""
+	Replace the tier buckets in [start, end) with rows and move the tier watermark to end in one transaction,
+	so a job that is interrupted or run twice never leaves a bucket counted twice.
+
+	rewind is {tier: bucket}, the watermarks of these tiers are moved back to their bucket, so they are rolled up
+	again over the replaced buckets. dirty_ids are the late history marks handled by this replace.
+	"""
+	try:
+		with conn.atomic():
+			for rewind_tier, bucket in (rewind or {}).items():
+				SmonRollupState.update(rolled_up_to=bucket).where(
+					(SmonRollupState.tier == rewind_tier) & (SmonRollupState.rolled_up_to > bucket)
+				).execute()
+			for batch in chunked(dirty_ids or [], 500):
+				SmonRollupDirty.delete().where(SmonRollupDirty.id.in_(batch)).execute()
+			SmonHistoryRollup.delete().where(
+				(SmonHistoryRollup.tier == tier) & (SmonHistoryRollup.bucket >= start) & (SmonHistoryRollup.bucket < end)
+			).execute()
+			for batch in chunked(rows, 500):
+				SmonHistoryRollup.insert_many(batch).execute()
+			updated = SmonRollupState.update(rolled_up_to=end).where(SmonRollupState.tier == tier).execute()
+			if not updated:
+				SmonRollupState.insert(tier=tier, rolled_up_to=end).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def select_check_rollups(smon_id: int, tier: str, start: datetime, end: datetime = None) -> SmonHistoryRollup:
+	where = (SmonHistoryRollup.smon_id == smon_id) & (SmonHistoryRollup.tier == tier) & (SmonHistoryRollup.bucket >= start)
+	if end:
+		where &= (SmonHistoryRollup.bucket < end)
+	try:
+		return SmonHistoryRollup.select().where(where).order_by(SmonHistoryRollup.bucket).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def sum_checks_rollups(smon_ids: list, tier: str, start: datetime, end: datetime) -> dict:
+	"""
+	Return {smon_id: (count, up_count, resp_sum)} of the checks buckets in [start, end).
+	"""
+	try:
+		query = SmonHistoryRollup.select(
+			SmonHistoryRollup.smon_id,
+			fn.SUM(SmonHistoryRollup.count), fn.SUM(SmonHistoryRollup.up_count), fn.SUM(SmonHistoryRollup.resp_sum)
+		).where(
+			(SmonHistoryRollup.smon_id.in_(smon_ids)) & (SmonHistoryRollup.tier == tier)
+			& (SmonHistoryRollup.bucket >= start) & (SmonHistoryRollup.bucket < end)
+		).group_by(SmonHistoryRollup.smon_id).tuples()
+		return {row[0]: row[1:] for row in query}
+	except Exception as e:
+		out_error(e)
+
+
+def sum_checks_history(smon_ids: list, start: datetime) -> dict:
+	"""
+	Return {smon_id: (count, up_count, resp_sum)} of the raw checks history since start.
+	"""
+	try:
+		query = SmonHistory.select(
+			SmonHistory.smon_id,
+			fn.COUNT(SmonHistory.smon_id),
+			fn.SUM(Case(None, [(SmonHistory.status == 1, 1)], 0)),
+			fn.SUM(SmonHistory.response_time)
+		).where(
+			(SmonHistory.smon_id.in_(smon_ids)) & (SmonHistory.date >= start)
+		).group_by(SmonHistory.smon_id).tuples()
+		return {row[0]: row[1:] for row in query}
+	except Exception as e:
+		out_error(e)
+
+
+def delete_old_rollups(tier: str, before: datetime) -> None:
+	try:
+		SmonHistoryRollup.delete().where((SmonHistoryRollup.tier == tier) & (SmonHistoryRollup.bucket < before)).execute()
+	except Exception as e:
+		out_error(e)
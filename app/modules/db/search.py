@@ -0,0 +1,205 @@
+import re
+import operator
+from functools import reduce
+
+from peewee import SQL, NodeList, fn
+
+from app.modules.db.db_model import conn, RMONAlertsHistory, MultiCheck, SmonGroup, mysql_enable, pgsql_enable
+
+# Search text is split into words and every word must match one of the searched columns: the beginning of a word
+# on SQLite and MySQL, any part of the text on PostgreSQL. SQLite searches FTS5 tables kept by triggers, PostgreSQL
+# uses trigram GIN indexes and MySQL FULLTEXT indexes, the last two are kept by the database itself.
+MAX_SEARCH_TERMS = 8
+# Words shorter than innodb_ft_min_token_size are not in MySQL FULLTEXT indexes, they are matched with LIKE
+MYSQL_MIN_TOKEN_SIZE = 3
+ALERTS_FTS = 'rmon_alerts_history_fts'
+CHECKS_FTS = 'multi_check_fts'
+
+_SQLITE_ALERTS_COLUMNS = 'name, message'
+_SQLITE_CHECKS_GROUP = '(SELECT name FROM smon_groups WHERE id = NEW.check_group_id)'
+_PGSQL_INDEXES = {
+	'rmon_alerts_history_name_trgm': ('rmon_alerts_history', 'name'),
+	'rmon_alerts_history_message_trgm': ('rmon_alerts_history', 'message'),
+	'multi_check_name_trgm': ('multi_check', 'name'),
+	'multi_check_description_trgm': ('multi_check', 'description'),
+	'smon_groups_name_trgm': ('smon_groups', 'name'),
+}
+_MYSQL_INDEXES = {
+	'rmon_alerts_history_fulltext': ('rmon_alerts_history', 'name, message'),
+	'multi_check_fulltext': ('multi_check', 'name, description'),
+	'smon_groups_fulltext': ('smon_groups', 'name'),
+}
+
+
+def _is_sqlite() -> bool:
+	return mysql_enable != '1' and pgsql_enable != '1'
+
+
+def search_terms(text: str) -> list[str]:
+	"""
+	Split the search text into lowercase words, the characters that are not letters or digits are dropped.
+	"""
+	return re.findall(r'\w+', (text or '').lower())[:MAX_SEARCH_TERMS]
+
+
+def _fts_query(terms: list[str]) -> str:
+	return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _mysql_match(columns: tuple, terms: list[str]):
+	"""
+	MATCH ... AGAINST in boolean mode for the long words, LIKE for the words that are too short for the index.
+	"""
+	conditions = []
+	long_terms = [term for term in terms if len(term) >= MYSQL_MIN_TOKEN_SIZE]
+	if long_terms:
+		against = ' '.join(f'+{term}*' for term in long_terms)
+		conditions.append(NodeList((fn.MATCH(*columns), fn.AGAINST(NodeList((against, SQL('IN BOOLEAN MODE')))))))
+	for term in terms:
+		if len(term) < MYSQL_MIN_TOKEN_SIZE:
+			conditions.append(reduce(operator.or_, [column.contains(term) for column in columns]))
+	return reduce(operator.and_, conditions)
+
+
+def alerts_search(text: str):
+	"""
+	Condition for the alerts whose check name or message match the search text.
+	"""
+	terms = search_terms(text)
+	if not terms:
+		return RMONAlertsHistory.name.contains(text)
+	if pgsql_enable == '1':
+		return reduce(operator.and_, [
+			RMONAlertsHistory.name.contains(term) | RMONAlertsHistory.message.contains(term) for term in terms
+		])
+	if mysql_enable == '1':
+		return _mysql_match((RMONAlertsHistory.name, RMONAlertsHistory.message), terms)
+	return RMONAlertsHistory.id.in_(SQL(f'(SELECT rowid FROM {ALERTS_FTS} WHERE {ALERTS_FTS} MATCH ?)', (_fts_query(terms),)))
+
+
+def multi_checks_search(text: str, model=MultiCheck):
+	"""
+	Condition for the multi checks whose name, description or check group match the search text.
+	model can be an alias of MultiCheck.
+	"""
+	terms = search_terms(text)
+	if not terms:
+		return fn.LOWER(model.name).contains((text or '').lower())
+	if pgsql_enable == '1':
+		return reduce(operator.and_, [
+			model.name.contains(term) | model.description.contains(term) |
+			model.check_group_id.in_(SmonGroup.select(SmonGroup.id).where(SmonGroup.name.contains(term)))
+			for term in terms
+		])
+	if mysql_enable == '1':
+		# Every word can match the check or its group, like on the other databases
+		return reduce(operator.and_, [
+			_mysql_match((model.name, model.description), [term]) |
+			model.check_group_id.in_(SmonGroup.select(SmonGroup.id).where(_mysql_match((SmonGroup.name,), [term])))
+			for term in terms
+		])
+	return model.id.in_(SQL(f'(SELECT rowid FROM {CHECKS_FTS} WHERE {CHECKS_FTS} MATCH ?)', (_fts_query(terms),)))
+
+
+def _sqlite_create_search_indexes() -> None:
+	# The alerts index reads its text from rmon_alerts_history, the checks one keeps a copy with the check group name
+	conn.execute_sql(
+		f"CREATE VIRTUAL TABLE IF NOT EXISTS {ALERTS_FTS} USING fts5("
+		f"{_SQLITE_ALERTS_COLUMNS}, content='rmon_alerts_history', content_rowid='id')"
+	)
+	conn.execute_sql(f'CREATE VIRTUAL TABLE IF NOT EXISTS {CHECKS_FTS} USING fts5(name, description, check_group)')
+	triggers = {
+		f'{ALERTS_FTS}_insert': (
+			'AFTER INSERT ON rmon_alerts_history',
+			f'INSERT INTO {ALERTS_FTS} (rowid, {_SQLITE_ALERTS_COLUMNS}) VALUES (NEW.id, NEW.name, NEW.message);'
+		),
+		f'{ALERTS_FTS}_delete': (
+			'AFTER DELETE ON rmon_alerts_history',
+			f"INSERT INTO {ALERTS_FTS} ({ALERTS_FTS}, rowid, {_SQLITE_ALERTS_COLUMNS}) "
+			f"VALUES ('delete', OLD.id, OLD.name, OLD.message);"
+		),
+		f'{ALERTS_FTS}_update': (
+			'AFTER UPDATE OF name, message ON rmon_alerts_history',
+			f"INSERT INTO {ALERTS_FTS} ({ALERTS_FTS}, rowid, {_SQLITE_ALERTS_COLUMNS}) "
+			f"VALUES ('delete', OLD.id, OLD.name, OLD.message); "
+			f'INSERT INTO {ALERTS_FTS} (rowid, {_SQLITE_ALERTS_COLUMNS}) VALUES (NEW.id, NEW.name, NEW.message);'
+		),
+		f'{CHECKS_FTS}_insert': (
+			'AFTER INSERT ON multi_check',
+			f'INSERT INTO {CHECKS_FTS} (rowid, name, description, check_group) '
+			f'VALUES (NEW.id, NEW.name, NEW.description, {_SQLITE_CHECKS_GROUP});'
+		),
+		f'{CHECKS_FTS}_delete': (
+			'AFTER DELETE ON multi_check',
+			f'DELETE FROM {CHECKS_FTS} WHERE rowid = OLD.id;'
+		),
+		f'{CHECKS_FTS}_update': (
+			'AFTER UPDATE OF name, description, check_group_id ON multi_check',
+			f'DELETE FROM {CHECKS_FTS} WHERE rowid = OLD.id; '
+			f'INSERT INTO {CHECKS_FTS} (rowid, name, description, check_group) '
+			f'VALUES (NEW.id, NEW.name, NEW.description, {_SQLITE_CHECKS_GROUP});'
+		),
+		f'{CHECKS_FTS}_group_update': (
+			'AFTER UPDATE OF name ON smon_groups',
+			f'UPDATE {CHECKS_FTS} SET check_group = NEW.name '
+			f'WHERE rowid IN (SELECT id FROM multi_check WHERE check_group_id = NEW.id);'
+		),
+	}
+	for name, (event, body) in triggers.items():
+		conn.execute_sql(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+def create_search_indexes() -> None:
+	"""
+	Create the full-text search indexes of the alerts and the multi checks.
+	"""
+	if pgsql_enable == '1':
+		conn.execute_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+		for index, (table, column) in _PGSQL_INDEXES.items():
+			conn.execute_sql(f'CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin ({column} gin_trgm_ops)')
+	elif mysql_enable == '1':
+		cursor = conn.execute_sql(
+			"SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND INDEX_TYPE = 'FULLTEXT'"
+		)
+		existing = {row[0] for row in cursor.fetchall()}
+		for index, (table, columns) in _MYSQL_INDEXES.items():
+			if index not in existing:
+				conn.execute_sql(f'ALTER TABLE {table} ADD FULLTEXT INDEX {index} ({columns})')
+	else:
+		_sqlite_create_search_indexes()
+
+
+def rebuild_search_indexes() -> None:
+	"""
+	Fill the SQLite search tables from the alerts and the multi checks. The indexes of the other databases are
+	built when they are created.
+	"""
+	if not _is_sqlite():
+		return
+	with conn.atomic():
+		conn.execute_sql(f"INSERT INTO {ALERTS_FTS} ({ALERTS_FTS}) VALUES ('rebuild')")
+		conn.execute_sql(f'DELETE FROM {CHECKS_FTS}')
+		conn.execute_sql(
+			f'INSERT INTO {CHECKS_FTS} (rowid, name, description, check_group) '
+			f'SELECT multi_check.id, multi_check.name, multi_check.description, smon_groups.name '
+			f'FROM multi_check LEFT JOIN smon_groups ON smon_groups.id = multi_check.check_group_id'
+		)
+
+
+def drop_search_indexes() -> None:
+	if pgsql_enable == '1':
+		for index in _PGSQL_INDEXES:
+			conn.execute_sql(f'DROP INDEX IF EXISTS {index}')
+	elif mysql_enable == '1':
+		for index, (table, _columns) in _MYSQL_INDEXES.items():
+			try:
+				conn.execute_sql(f'ALTER TABLE {table} DROP INDEX {index}')
+			except Exception as e:
+				print(f'error: cannot drop index {index}: {e}')
+	else:
+		for table in (ALERTS_FTS, CHECKS_FTS):
+			for event in ('insert', 'delete', 'update'):
+				conn.execute_sql(f'DROP TRIGGER IF EXISTS {table}_{event}')
+		conn.execute_sql(f'DROP TRIGGER IF EXISTS {CHECKS_FTS}_group_update')
+		conn.execute_sql(f'DROP TABLE IF EXISTS {ALERTS_FTS}')
+		conn.execute_sql(f'DROP TABLE IF EXISTS {CHECKS_FTS}')
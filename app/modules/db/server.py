@@ -2,6 +2,7 @@ from peewee import IntegrityError
 
 from app.modules.db.db_model import mysql_enable, connect, Server, SystemInfo
 from app.modules.db.common import out_error, not_unique_error, resource_not_empty
+import app.modules.common.identity_cache as identity_cache
 from app.modules.roxywi.exception import RoxywiResourceNotFound
 
 
@@ -15,6 +16,7 @@ def add_server(hostname, ip, group, enabled, cred_id, port, desc):
 		not_unique_error(e)
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_all()
 
 
 def delete_server(server_id):
@@ -26,6 +28,7 @@ def delete_server(server_id):
 	except Exception as e:
 		out_error(e)
 	else:
+		identity_cache.invalidate_all()
 		return True
 
 
@@ -37,6 +40,7 @@ def update_server(hostname, group, enabled, server_id, cred_id, port, desc):
 		server_update.execute()
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_all()
 
 
 def get_server_by_ip(server_ip: str) -> Server:
@@ -1,19 +1,22 @@
+import re
 import uuid
-from datetime import datetime, timedelta
+import sqlite3
+from datetime import datetime
 from typing import Union, Literal
 
-from peewee import fn, IntegrityError, Case, Select
+from peewee import fn, IntegrityError, Case, Select, JOIN, chunked
 
 from app.modules.db.db_model import (
-	SmonAgent, Server, SMON, SmonTcpCheck, SmonHttpCheck, SmonDnsCheck, SmonPingCheck, SmonHistory, SmonStatusPageCheck,
-	SmonStatusPage, SmonGroup, SmonSMTPCheck, SmonRabbitCheck, mysql_enable, MultiCheck, pgsql_enable
+	conn, SmonAgent, Server, SMON, SmonTcpCheck, SmonHttpCheck, SmonDnsCheck, SmonPingCheck, SmonHistory, SmonStatusPageCheck,
+	SmonStatusPage, SmonGroup, SmonSMTPCheck, SmonRabbitCheck, mysql_enable, MultiCheck, pgsql_enable, SmonAgentManifest,
+	SmonAgentLiveness, SmonCheckFailover, SmonRollupDirty
 )
 from app.modules.db.common import out_error, resource_not_empty
-import app.modules.roxy_wi_tools as roxy_wi_tools
+import app.modules.db.search as search_sql
 import app.modules.tools.common as tool_common
+from app.modules.common.common import encode_cursor, decode_cursor
 from app.modules.roxywi.class_models import CheckFiltersQuery
-from app.modules.roxywi.exception import RoxywiResourceNotFound
-from app.modules.tools.smon import disable_multi_check
+from app.modules.roxywi.exception import RoxywiResourceNotFound, RoxywiValidationError
 
 
 def get_agents(group_id: int):
@@ -139,33 +142,171 @@ def get_agent_id_by_ip(agent_ip) -> int:
 		raise out_error(e, SmonAgent)
 
 
-def get_randon_agent(region_id: int) -> int:
+def select_region_agents(region_id: int) -> list[SmonAgent]:
 	try:
-		if mysql_enable == '1':
-			random_func = fn.Rand()  # MySQL uses Rand()
-		else:
-			random_func = fn.Random()
+		return list(SmonAgent.select().where(SmonAgent.region_id == region_id).order_by(SmonAgent.id))
+	except Exception as e:
+		out_error(e)
 
-		agent = SmonAgent.select().where(SmonAgent.region_id == region_id).order_by(random_func)
-		return agent.get()
+
+def select_region_checks_for_placement(region_id: int) -> list[dict]:
+	"""
+	Return the id, agent_id, check_type, check_timeout and interval of the enabled checks of the region agents.
+	"""
+	checks = []
+	try:
+		for check_type in ('tcp', 'http', 'dns', 'ping', 'smtp', 'rabbitmq'):
+			model = tool_common.get_model_for_check(check_type=check_type)
+			query = model.select(
+				SMON.id, SMON.agent_id, SMON.check_type, SMON.check_timeout, model.interval
+			).join_from(model, SMON).join_from(SMON, SmonAgent).where(
+				(SmonAgent.region_id == region_id) & (SMON.enabled == 1)
+			).dicts()
+			checks.extend(query)
 	except Exception as e:
-		raise out_error(e, SmonAgent)
+		out_error(e)
+	return checks
 
 
-def get_less_check_agent(region_id: int) -> int:
+def select_all_agents() -> list[SmonAgent]:
 	try:
-		result = (
-			SmonAgent
-			.select(SmonAgent, fn.COUNT(SMON.id).alias('checks_count'))
-			.join(SMON)
-			.where(SmonAgent.region_id == region_id)
-			.group_by(SmonAgent.id)
-			.order_by(fn.COUNT(SMON.id).asc())
-			.limit(1)
-		)
-		return result.get()
+		return list(SmonAgent.select().order_by(SmonAgent.id))
 	except Exception as e:
-		raise out_error(e, SmonAgent)
+		out_error(e)
+
+
+def touch_agent(agent_id: int) -> None:
+	"""
+	Record a heartbeat of the agent.
+	"""
+	try:
+		updated = SmonAgentLiveness.update(last_seen=datetime.now()).where(SmonAgentLiveness.agent_id == agent_id).execute()
+		if not updated:
+			SmonAgentLiveness.insert(agent_id=agent_id, last_seen=datetime.now()).execute()
+	except IntegrityError:
+		pass
+	except Exception as e:
+		out_error(e)
+
+
+def select_agents_liveness() -> dict:
+	try:
+		return {row.agent_id_id: row for row in SmonAgentLiveness.select()}
+	except Exception as e:
+		out_error(e)
+
+
+def set_agent_alive(agent_id: int, alive: bool) -> None:
+	try:
+		updated = SmonAgentLiveness.update(alive=alive, changed_at=datetime.now()).where(
+			SmonAgentLiveness.agent_id == agent_id
+		).execute()
+		if not updated:
+			SmonAgentLiveness.insert(agent_id=agent_id, alive=alive, changed_at=datetime.now()).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def select_dead_agent_ids() -> set:
+	try:
+		return {row.agent_id_id for row in SmonAgentLiveness.select(SmonAgentLiveness.agent_id).where(SmonAgentLiveness.alive == False)}
+	except Exception as e:
+		out_error(e)
+
+
+def select_agents_last_history(since: datetime) -> dict:
+	"""
+	Return {agent_id: date of the newest history row of its checks} for the agents with results since the date.
+	"""
+	try:
+		query = SmonHistory.select(SMON.agent_id, fn.MAX(SmonHistory.date)).join(SMON).where(
+			SmonHistory.date >= since
+		).group_by(SMON.agent_id).tuples()
+		return {agent_id: date for agent_id, date in query if agent_id}
+	except Exception as e:
+		out_error(e)
+
+
+def select_agents_min_interval() -> dict:
+	"""
+	Return {agent_id: the shortest interval of its enabled checks}.
+	"""
+	intervals = {}
+	try:
+		for check_type in ('tcp', 'http', 'dns', 'ping', 'smtp', 'rabbitmq'):
+			model = tool_common.get_model_for_check(check_type=check_type)
+			query = model.select(SMON.agent_id, fn.MIN(model.interval)).join_from(model, SMON).where(
+				SMON.enabled == 1
+			).group_by(SMON.agent_id).tuples()
+			for agent_id, interval in query:
+				if agent_id and interval:
+					intervals[agent_id] = min(intervals.get(agent_id, interval), interval)
+	except Exception as e:
+		out_error(e)
+	return intervals
+
+
+def select_enabled_checks_for_agent(agent_id: int) -> list[SMON]:
+	try:
+		return list(SMON.select(SMON.id, SMON.check_type, SMON.agent_id).where((SMON.agent_id == agent_id) & (SMON.enabled == 1)))
+	except Exception as e:
+		out_error(e)
+
+
+def select_enabled_check_ids(smon_ids: list[int]) -> set[int]:
+	"""
+	Return the ids of the enabled checks among smon_ids.
+	"""
+	enabled = set()
+	try:
+		for i in range(0, len(smon_ids), 500):
+			query = SMON.select(SMON.id).where((SMON.id.in_(smon_ids[i:i + 500])) & (SMON.enabled == 1)).tuples()
+			enabled.update(smon_id for smon_id, in query)
+	except Exception as e:
+		out_error(e)
+	return enabled
+
+
+def failover_checks(moves: dict, home_agent_id: int) -> None:
+	"""
+	Reassign checks of a dark agent in one transaction, moves is {new_agent_id: [smon_id, ...]}.
+
+	The home agent is remembered for every check, a check that already failed over keeps its first home agent.
+	"""
+	try:
+		with conn.atomic():
+			for new_agent_id, smon_ids in moves.items():
+				for batch in chunked(smon_ids, 500):
+					SMON.update(agent_id=new_agent_id).where(SMON.id.in_(batch)).execute()
+					SmonCheckFailover.insert_many(
+						[{'smon_id': smon_id, 'home_agent_id': home_agent_id} for smon_id in batch]
+					).on_conflict_ignore().execute()
+	except Exception as e:
+		out_error(e)
+
+
+def select_check_failovers(home_agent_id: int) -> list[SMON]:
+	try:
+		return list(SMON.select(SMON.id, SMON.check_type, SMON.agent_id).join(
+			SmonCheckFailover, on=(SmonCheckFailover.smon_id == SMON.id)
+		).where(SmonCheckFailover.home_agent_id == home_agent_id))
+	except Exception as e:
+		out_error(e)
+
+
+def select_failover_home_agents() -> set:
+	try:
+		return {row.home_agent_id_id for row in SmonCheckFailover.select(SmonCheckFailover.home_agent_id).distinct()}
+	except Exception as e:
+		out_error(e)
+
+
+def delete_check_failovers(smon_ids: list) -> None:
+	try:
+		for batch in chunked(smon_ids, 500):
+			SmonCheckFailover.delete().where(SmonCheckFailover.smon_id.in_(batch)).execute()
+	except Exception as e:
+		out_error(e)
 
 
 def select_server_ip_by_agent_id(agent_id: int) -> str:
@@ -178,11 +319,40 @@ def select_server_ip_by_agent_id(agent_id: int) -> str:
 def select_en_smon(agent_id: int, check_type: str) -> Union[SmonTcpCheck, SmonPingCheck, SmonDnsCheck, SmonHttpCheck, SmonSMTPCheck]:
 	model = tool_common.get_model_for_check(check_type=check_type)
 	try:
-		return model.select(model, SMON).join_from(model, SMON).where((SMON.enabled == '1') & (SMON.agent_id == agent_id)).execute()
+		return model.select(model, SMON, MultiCheck).join_from(model, SMON).join_from(
+			SMON, MultiCheck, JOIN.LEFT_OUTER
+		).where((SMON.enabled == '1') & (SMON.agent_id == agent_id)).execute()
 	except Exception as e:
 		raise out_error(e, model)
 
 
+def get_agent_manifest(agent_id: int) -> Union[SmonAgentManifest, None]:
+	try:
+		return SmonAgentManifest.get(SmonAgentManifest.agent_id == agent_id)
+	except SmonAgentManifest.DoesNotExist:
+		return None
+	except Exception as e:
+		out_error(e)
+
+
+def save_agent_manifest(agent_id: int, version: int, checks: dict) -> None:
+	try:
+		updated = SmonAgentManifest.update(
+			version=version, checks=checks, updated_at=datetime.now()
+		).where(SmonAgentManifest.agent_id == agent_id).execute()
+		if not updated:
+			SmonAgentManifest.insert(agent_id=agent_id, version=version, checks=checks).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def delete_agent_manifest(agent_id: int) -> None:
+	try:
+		SmonAgentManifest.delete().where(SmonAgentManifest.agent_id == agent_id).execute()
+	except Exception as e:
+		out_error(e)
+
+
 def change_status(status: int, smon_id: int, time: str) -> None:
 	try:
 		SMON.update(status=status, time_state=time).where(SMON.id == smon_id).execute()
@@ -208,6 +378,65 @@ def insert_smon_history(**kwargs) -> None:
 		out_error(e)
 
 
+def select_agent_check_statuses(agent_id: int, smon_ids: set) -> dict:
+	"""
+	Return {smon_id: status} of the checks of the agent among smon_ids.
+	"""
+	statuses = {}
+	try:
+		for batch in chunked(list(smon_ids), 500):
+			query = SMON.select(SMON.id, SMON.status).where((SMON.agent_id == agent_id) & (SMON.id.in_(batch))).tuples()
+			statuses.update({smon_id: status for smon_id, status in query})
+	except Exception as e:
+		out_error(e)
+	return statuses
+
+
+def select_checks_alert_info(smon_ids: set) -> dict:
+	"""
+	Return {smon_id: {multi_check_id, name, check_type, priority}} of the checks among smon_ids.
+	"""
+	checks = {}
+	try:
+		for batch in chunked(list(smon_ids), 500):
+			query = SMON.select(
+				SMON.id, SMON.multi_check_id, MultiCheck.name, SMON.check_type, MultiCheck.priority
+			).join(MultiCheck).where(SMON.id.in_(batch)).tuples()
+			for smon_id, multi_check_id, name, check_type, priority in query:
+				checks[smon_id] = {'multi_check_id': multi_check_id, 'name': name, 'check_type': check_type, 'priority': priority}
+	except Exception as e:
+		out_error(e)
+	return checks
+
+
+def save_check_results(history: list[dict], status_changes: dict, response_times: dict, late_since: datetime = None) -> None:
+	"""
+	Write check results in one transaction.
+
+	history rows are inserted with multi-row inserts. status_changes is {smon_id: (status, time_state)},
+	response_times is {smon_id: response_time}. Both update SMON with one CASE statement per chunk of checks.
+	late_since is the date of the oldest row that may be rolled up already, the rollup job rolls up again from it.
+	"""
+	try:
+		with conn.atomic():
+			if late_since is not None:
+				SmonRollupDirty.insert(date=late_since).execute()
+			# Chunks stay below the SQLite limit of 999 bound parameters per statement
+			for batch in chunked(history, 70):
+				SmonHistory.insert_many(batch).execute()
+			for batch in chunked(list(response_times.items()), 200):
+				SMON.update(
+					response_time=Case(SMON.id, [(smon_id, str(value)) for smon_id, value in batch])
+				).where(SMON.id.in_([smon_id for smon_id, _ in batch])).execute()
+			for batch in chunked(list(status_changes.items()), 200):
+				SMON.update(
+					status=Case(SMON.id, [(smon_id, status) for smon_id, (status, _) in batch]),
+					time_state=Case(SMON.id, [(smon_id, time_state) for smon_id, (_, time_state) in batch]),
+				).where(SMON.id.in_([smon_id for smon_id, _ in batch])).execute()
+	except Exception as e:
+		out_error(e)
+
+
 def select_one_smon(smon_id: int, check_type_id: int) -> tuple:
 	correct_model = tool_common.get_model_for_check(check_type_id=check_type_id)
 	try:
@@ -218,6 +447,13 @@ def select_one_smon(smon_id: int, check_type_id: int) -> tuple:
 		raise out_error(e)
 
 
+def select_group_check_ids(group_id: int, smon_ids: list[int]) -> list[int]:
+	try:
+		return [check.id for check in SMON.select(SMON.id).where((SMON.group_id == group_id) & (SMON.id.in_(smon_ids)))]
+	except Exception as e:
+		raise out_error(e, SMON)
+
+
 def select_check_with_group(check_id: int, group_id: int) -> SMON:
 	try:
 		return SMON.get((SMON.group_id == group_id) & (SMON.id == check_id))
@@ -322,7 +558,7 @@ def delete_multi_check(check_id: int, group_id: int) -> None:
 
 def select_multi_check(multi_check_id: int, group_id: int) -> SMON:
 	try:
-		return SMON.select().join(MultiCheck).where(
+		return SMON.select(SMON, MultiCheck).join(MultiCheck).where(
 			(SMON.group_id == group_id) &
 			(SMON.multi_check_id == multi_check_id)
 		).order_by(MultiCheck.check_group_id).execute()
@@ -332,6 +568,25 @@ def select_multi_check(multi_check_id: int, group_id: int) -> SMON:
 		raise out_error(e, MultiCheck)
 
 
+def select_checks_by_smon_ids(smon_ids: list, check_type_id: int) -> dict:
+	"""
+	Return the type-specific checks of the SMON ids with their SMON rows, as {smon_id: [check, ...]}, in one query.
+	"""
+	correct_model = tool_common.get_model_for_check(check_type_id=check_type_id)
+	checks = {}
+	if not smon_ids:
+		return checks
+	try:
+		query = correct_model.select(correct_model, SMON).join_from(correct_model, SMON).where(
+			SMON.id.in_(list(smon_ids))
+		).order_by(SMON.id)
+		for check in query:
+			checks.setdefault(check.smon_id.id, []).append(check)
+	except Exception as e:
+		out_error(e)
+	return checks
+
+
 def select_one_smon_by_multi_check(multi_check_id: int) -> SMON:
 	try:
 		return SMON.select().join(MultiCheck).where(SMON.multi_check_id == multi_check_id).order_by(MultiCheck.check_group_id).limit(1).execute()
@@ -339,6 +594,28 @@ def select_one_smon_by_multi_check(multi_check_id: int) -> SMON:
 		raise out_error(e, SMON)
 
 
+def select_multi_checks_page(group_id: int, after_id: int, limit: int, check_type: str = None) -> list[MultiCheck]:
+	"""
+	Return the next multi checks of the group by id, for walking over all of them without OFFSET.
+	"""
+	where_expr = (MultiCheck.group_id == group_id) & (MultiCheck.id > after_id)
+	if check_type:
+		where_expr &= MultiCheck.id.in_(SMON.select(SMON.multi_check_id).where(SMON.check_type == check_type))
+	try:
+		return list(MultiCheck.select().where(where_expr).order_by(MultiCheck.id).limit(limit))
+	except Exception as e:
+		out_error(e)
+
+
+def select_smon_by_multi_checks(multi_check_ids: list) -> list[SMON]:
+	if not multi_check_ids:
+		return []
+	try:
+		return list(SMON.select().where(SMON.multi_check_id.in_(list(multi_check_ids))).order_by(SMON.id))
+	except Exception as e:
+		out_error(e)
+
+
 def select_multi_checks(group_id: int) -> SMON:
 	try:
 		if pgsql_enable == '1':
@@ -352,13 +629,13 @@ def select_multi_checks(group_id: int) -> SMON:
 def select_multi_checks_with_type(check_type: int, group_id: int) -> SMON:
 	try:
 		if pgsql_enable == '1':
-			return SMON.select().join(MultiCheck).where(
+			return SMON.select(SMON, MultiCheck).join(MultiCheck).where(
 				(SMON.group_id == group_id) &
 				(SMON.check_type == check_type)
 			).order_by(
 				SMON.multi_check_id.desc()
 			).distinct(SMON.multi_check_id)
-		return SMON.select().join(MultiCheck).where(
+		return SMON.select(SMON, MultiCheck).join(MultiCheck).where(
 			(SMON.group_id == group_id) &
 			(SMON.check_type == check_type)
 		).order_by(MultiCheck.check_group_id.desc()).group_by(SMON.multi_check_id)
@@ -366,14 +643,29 @@ def select_multi_checks_with_type(check_type: int, group_id: int) -> SMON:
 		raise out_error(e, SMON)
 
 
-def select_multi_check_with_filters(group_id: int, query: CheckFiltersQuery) -> SMON:
+def select_multi_check_with_filters(group_id: int, query: CheckFiltersQuery, limit: int = None) -> SMON:
+	"""
+	Select the first check of every multi check that matches the filters, a page of query.limit or limit rows.
+
+	With query.cursor the page starts after the multi check of the cursor instead of at query.offset.
+	"""
 	sort_expr = None
 	MC = MultiCheck.alias()
 	where_expr = (SMON.group_id == group_id)
+	limit = limit or query.limit
+	# Without sort_by PostgreSQL returns the newest multi checks first, the other databases the oldest ones
+	if query.cursor:
+		(after_id,) = decode_cursor(query.cursor, 1)
+		if not isinstance(after_id, int):
+			raise RoxywiValidationError('Invalid cursor')
+		if pgsql_enable == '1':
+			where_expr &= (SMON.multi_check_id < after_id)
+		else:
+			where_expr &= (SMON.multi_check_id > after_id)
 
 	if any((query.check_name, query.check_group, query.check_type)):
 		if query.check_name:
-			where_expr &= fn.LOWER(MC.name).contains(query.check_name.lower())
+			where_expr &= search_sql.multi_checks_search(query.check_name, MC)
 
 		if query.check_type:
 			where_expr &= (SMON.check_type == query.check_type)
@@ -456,26 +748,40 @@ def select_multi_check_with_filters(group_id: int, query: CheckFiltersQuery) ->
 				q = q.order_by(col.desc() if is_desc else col.asc())
 			else:
 				q = q.order_by(ranked.c.multi_check_id.desc())
-
-			q = q.paginate(query.offset, query.limit)
 		else:
-			base = (SMON
-					.select(SMON, MC)
-					.join(MC, on=(SMON.multi_check_id == MC.id))
-					.where(where_expr)
-					.group_by(SMON.multi_check_id))
+			q = (SMON
+				.select(SMON, MC)
+				.join(MC, on=(SMON.multi_check_id == MC.id))
+				.where(where_expr)
+				.group_by(SMON.multi_check_id))
 			if sort_expr is not None:
-				base = base.order_by(sort_expr)
+				q = q.order_by(sort_expr)
 			else:
-				base = base.order_by(SMON.multi_check_id)
-			q = base.paginate(query.offset, query.limit)
+				q = q.order_by(SMON.multi_check_id)
 
-		return q
+		if query.cursor:
+			return q.limit(limit)
+		return q.limit(limit).offset(max(query.offset - 1, 0) * query.limit)
 
 	except Exception as e:
 		raise out_error(e, SMON)
 
 
+def select_multi_check_page(group_id: int, query: CheckFiltersQuery) -> tuple[list, Union[str, None]]:
+	"""
+	Return a page of select_multi_check_with_filters and the cursor of the next page, if there is one.
+	Only pages without sort_by have a cursor.
+	"""
+	# One more row tells if there is a next page
+	checks = list(select_multi_check_with_filters(group_id, query, query.limit + 1))
+	if len(checks) <= query.limit:
+		return checks, None
+	checks = checks[:query.limit]
+	if query.sort_by:
+		return checks, None
+	return checks, encode_cursor([checks[-1].multi_check_id_id])
+
+
 def get_count_multi_with_status_checks(group_id: int, status: int) -> int:
 	try:
 		if pgsql_enable == '1':
@@ -621,6 +927,37 @@ def select_status_page_checks(page_id: int):
 		raise out_error(e, SmonStatusPage)
 
 
+def select_status_page_smon(page_id: int) -> list[SMON]:
+	"""
+	Return one SMON row with its MultiCheck for every check of the status page, in one query.
+	"""
+	try:
+		query = SMON.select(SMON, MultiCheck).join(MultiCheck).join(
+			SmonStatusPageCheck, on=(SmonStatusPageCheck.multi_check_id == MultiCheck.id)
+		).where(SmonStatusPageCheck.page_id == page_id).order_by(MultiCheck.check_group_id, SMON.id)
+		checks = {}
+		for check in query:
+			checks.setdefault(check.multi_check_id_id, check)
+		return list(checks.values())
+	except Exception as e:
+		raise out_error(e, SMON)
+
+
+def get_status_page_state(page_id: int) -> tuple:
+	"""
+	Return a fingerprint of the state of the status page checks, it changes when any check changes its status.
+	"""
+	multi_check_ids = SmonStatusPageCheck.select(SmonStatusPageCheck.multi_check_id).where(
+		SmonStatusPageCheck.page_id == page_id
+	)
+	try:
+		return SMON.select(
+			fn.COUNT(SMON.id), fn.SUM(SMON.status), fn.SUM(SMON.enabled), fn.MAX(SMON.time_state), fn.MAX(SMON.updated_at)
+		).where(SMON.multi_check_id.in_(multi_check_ids)).scalar(as_tuple=True)
+	except Exception as e:
+		out_error(e)
+
+
 def delete_status_page(page_id):
 	try:
 		SmonStatusPage.delete().where(SmonStatusPage.id == page_id).execute()
@@ -647,6 +984,16 @@ def get_last_smon_status_by_multi_check(multi_check_id: int) -> object:
 		raise out_error(e, SMON)
 
 
+def get_last_history_dates(smon_ids: set) -> dict:
+	try:
+		query = SmonHistory.select(SmonHistory.smon_id, fn.MAX(SmonHistory.date)).where(
+			SmonHistory.smon_id.in_(list(smon_ids))
+		).group_by(SmonHistory.smon_id).tuples()
+		return {smon_id: date for smon_id, date in query}
+	except Exception as e:
+		out_error(e)
+
+
 def get_last_smon_res_time_by_check(smon_id: int, check_id: int) -> int:
 	query = SmonHistory.select().where(
 		(SmonHistory.smon_id == smon_id) &
@@ -728,6 +1075,71 @@ def select_smon_history(smon_id: int, limit: int = 40) -> SmonHistory:
 		raise out_error(e, SmonHistory)
 
 
+_mysql_window_functions = {}
+
+
+def _window_functions_supported() -> bool:
+	if pgsql_enable == '1':
+		return True
+	if mysql_enable == '1':
+		# MySQL has window functions since 8.0 and MariaDB since 10.2
+		if 'supported' not in _mysql_window_functions:
+			version = conn.execute_sql('SELECT VERSION()').fetchone()[0]
+			numbers = tuple(int(number) for number in re.findall(r'\d+', version)[:2])
+			_mysql_window_functions['supported'] = numbers >= ((10, 2) if 'mariadb' in version.lower() else (8, 0))
+		return _mysql_window_functions['supported']
+	# SQLite has window functions since 3.25
+	return sqlite3.sqlite_version_info >= (3, 25, 0)
+
+
+def select_checks_last_statuses(smon_ids: list[int], limit: int = 40) -> dict[int, list[dict]]:
+	"""
+	Get the last statuses of many checks, newest first, as {smon_id: [{'status', 'mes', 'date'}]}.
+
+	Uses one ROW_NUMBER() query, or one query per check on databases without window functions.
+	"""
+	smon_ids = list(set(smon_ids))
+	statuses = {smon_id: [] for smon_id in smon_ids}
+	if not smon_ids:
+		return statuses
+
+	try:
+		if _window_functions_supported():
+			rn = fn.ROW_NUMBER().over(
+				partition_by=[SmonHistory.smon_id],
+				order_by=[SmonHistory.date.desc()],
+			).alias('rn')
+			ranked = (
+				SmonHistory
+				.select(SmonHistory.smon_id, SmonHistory.status, SmonHistory.mes, SmonHistory.date, rn)
+				.where(SmonHistory.smon_id.in_(smon_ids))
+				.cte('ranked')
+			)
+			rows = list(
+				ranked
+				.select_from(ranked.c.smon_id, ranked.c.status, ranked.c.mes, ranked.c.date)
+				.where(ranked.c.rn <= limit)
+				.order_by(ranked.c.smon_id, ranked.c.date.desc())
+				.bind(conn)
+				.dicts()
+			)
+			# Columns read from a CTE skip the field converters, SQLite returns the dates as strings
+			for row in rows:
+				row['date'] = SmonHistory.date.python_value(row['date'])
+		else:
+			rows = []
+			for smon_id in smon_ids:
+				rows.extend(SmonHistory.select(
+					SmonHistory.smon_id, SmonHistory.status, SmonHistory.mes, SmonHistory.date
+				).where(SmonHistory.smon_id == smon_id).order_by(SmonHistory.date.desc()).limit(limit).dicts())
+	except Exception as e:
+		raise out_error(e, SmonHistory)
+
+	for row in rows:
+		statuses[row['smon_id']].append(row)
+	return statuses
+
+
 def get_history(smon_id: int) -> SmonHistory:
 	try:
 		return SmonHistory.select().where(SmonHistory.smon_id == smon_id).order_by(SmonHistory.date.desc()).get()
@@ -801,15 +1213,6 @@ def count_checks() -> int:
 		out_error(e)
 
 
-def delete_smon_history():
-	get_date = roxy_wi_tools.GetDate()
-	cur_date = get_date.return_date('regular', timedelta_minus=1)
-	try:
-		SmonHistory.delete().where(SmonHistory.date < cur_date).execute()
-	except Exception as e:
-		out_error(e)
-
-
 def delete_smon(smon_id: int, group_id: int) -> None:
 	try:
 		SMON.delete().where((SMON.id == smon_id) & (SMON.group_id == group_id)).execute()
@@ -868,6 +1271,17 @@ def get_smon_group_by_id(check_group_id: int) -> SmonGroup:
 		out_error(e)
 
 
+def get_smon_group_names(check_group_ids) -> dict:
+	check_group_ids = {check_group_id for check_group_id in check_group_ids if check_group_id}
+	if not check_group_ids:
+		return {}
+	try:
+		query = SmonGroup.select(SmonGroup.id, SmonGroup.name).where(SmonGroup.id.in_(list(check_group_ids)))
+		return {check_group.id: check_group.name for check_group in query}
+	except Exception as e:
+		out_error(e)
+
+
 def get_smon_group_by_id_with_group(check_group_id: int, group_id: int) -> SmonGroup:
 	try:
 		return SmonGroup.get((SmonGroup.id == check_group_id) & (SmonGroup.group_id == group_id))
@@ -923,47 +1337,31 @@ def update_check_current_retries(multi_check_id: int, current_retries: int) -> N
 		out_error(e)
 
 
-def disable_expired_check() -> None:
-	try:
-		multi_checks = MultiCheck.select(MultiCheck, SMON).join_from(MultiCheck, SMON).where(
-			(SMON.enabled == 1) &
-			(MultiCheck.expiration < datetime.now()) &
-			(MultiCheck.expiration > datetime.now() - timedelta(minutes=5))
-		)
-	except Exception as e:
-		out_error(e)
+def select_expired_checks(now: datetime) -> list[SMON]:
+	"""
+	Return the enabled checks whose multi-check expired before now, with their agent ids.
+	"""
 	try:
-		for multi_check in multi_checks:
-			disable_multi_check(multi_check.id, multi_check.group_id)
+		return list(SMON.select(SMON.id, SMON.agent_id, SMON.multi_check_id).join(MultiCheck).where(
+			(MultiCheck.expiration <= now) &
+			(SMON.enabled == 1)
+		))
 	except Exception as e:
 		out_error(e)
 
 
-def disable_check(multi_check_id: int) -> None:
+def disable_checks(smon_ids: list) -> int:
+	updated = 0
 	try:
-		SMON.update(enabled=0).where(SMON.multi_check_id == multi_check_id).execute()
+		with conn.atomic():
+			for chunk in chunked(smon_ids, 500):
+				updated += SMON.update(enabled=0).where((SMON.id.in_(chunk)) & (SMON.enabled == 1)).execute()
 	except Exception as e:
 		out_error(e)
+	return updated
 
 
-def get_uptime_and_status(multi_check_id: int, group_id: int = None) -> dict:
-	# Найти все SMON с этим multi_check_id
-	if group_id is None:
-		smon_q = SMON.select(SMON.id).where(SMON.multi_check_id == multi_check_id)
-	else:
-		smon_q = SMON.select(SMON.id).where((SMON.multi_check_id == multi_check_id) & (SMON.group_id == group_id))
-
-	# Найти последние 40 записей из SmonHistory по этим SMON
-	history_q = (
-		SmonHistory
-		.select()
-		.where(SmonHistory.smon_id.in_(smon_q))
-		.order_by(SmonHistory.date.desc())
-		.limit(40)
-	)
-
-	history_entries = list(history_q)
-
+def _uptime_and_status(history_entries: list[dict]) -> dict:
 	if not history_entries:
 		return {
 			'uptime': 0,
@@ -973,11 +1371,11 @@ def get_uptime_and_status(multi_check_id: int, group_id: int = None) -> dict:
 
 	# Посчитать средний uptime (status == 1)
 	total = len(history_entries)
-	ok_count = sum(1 for entry in history_entries if entry.status == 1)
+	ok_count = sum(1 for entry in history_entries if entry['status'] == 1)
 	uptime = ok_count / total
 
 	# Определить общее состояние
-	statuses = set(entry.status for entry in history_entries)
+	statuses = set(entry['status'] for entry in history_entries)
 
 	if statuses == {1}:
 		state = 1
@@ -989,5 +1387,45 @@ def get_uptime_and_status(multi_check_id: int, group_id: int = None) -> dict:
 	return {
 		'uptime': round(uptime * 100, 2),  # в процентах
 		'status': state,
-		'history': [{'date': h.date, 'status': h.status, 'error': h.mes} for h in history_entries]
+		'history': [{'date': h['date'], 'status': h['status'], 'error': h['mes']} for h in history_entries]
 	}
+
+
+def get_uptime_and_status(multi_check_id: int, group_id: int = None) -> dict:
+	# Найти все SMON с этим multi_check_id
+	if group_id is None:
+		smon_q = SMON.select(SMON.id).where(SMON.multi_check_id == multi_check_id)
+	else:
+		smon_q = SMON.select(SMON.id).where((SMON.multi_check_id == multi_check_id) & (SMON.group_id == group_id))
+
+	# Найти последние 40 записей из SmonHistory по этим SMON
+	history_q = (
+		SmonHistory
+		.select(SmonHistory.status, SmonHistory.date, SmonHistory.mes)
+		.where(SmonHistory.smon_id.in_(smon_q))
+		.order_by(SmonHistory.date.desc())
+		.limit(40)
+	)
+
+	return _uptime_and_status(list(history_q.dicts()))
+
+
+def get_uptime_and_status_by_multi_checks(multi_check_ids: list[int]) -> dict[int, dict]:
+	"""
+	get_uptime_and_status of many multi checks, with one query for their checks and one for the history.
+	"""
+	smon_ids = {}
+	try:
+		query = SMON.select(SMON.id, SMON.multi_check_id).where(SMON.multi_check_id.in_(list(multi_check_ids))).tuples()
+		for smon_id, multi_check_id in query:
+			smon_ids.setdefault(multi_check_id, []).append(smon_id)
+	except Exception as e:
+		out_error(e)
+	# The last 40 results of a multi check are among the last 40 results of each of its checks
+	statuses = select_checks_last_statuses([smon_id for ids in smon_ids.values() for smon_id in ids], 40)
+	results = {}
+	for multi_check_id in multi_check_ids:
+		entries = [entry for smon_id in smon_ids.get(multi_check_id, []) for entry in statuses[smon_id]]
+		entries.sort(key=lambda entry: entry['date'], reverse=True)
+		results[multi_check_id] = _uptime_and_status(entries[:40])
+	return results
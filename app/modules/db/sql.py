@@ -1,50 +1,125 @@
+import time
+import threading
+from typing import Union
+
+from flask import g, has_request_context
 from flask_jwt_extended import get_jwt, verify_jwt_in_request
 
-from app.modules.db.db_model import Setting, Role
+from app.modules.db.db_model import Setting, Role, SettingsVersion
 from app.modules.db.common import out_error
 
 
-def get_setting(param, **kwargs):
-	if kwargs.get('group_id'):
-		user_group_id = kwargs.get('group_id')
-	else:
-		try:
-			verify_jwt_in_request()
-			claims = get_jwt()
-			user_group_id = claims['group']
-		except Exception:
-			user_group_id = 1
-
-	if param in (
-			'proxy', 'agent_port', 'master_port', 'master_ip', 'rmon_name', 'use_victoria_metrics',
-			'victoria_metrics_select', 'rabbitmq_enabled', 'json_format'
-	):
+# Settings that are global and always read from the first group
+GLOBAL_SETTINGS = (
+	'proxy', 'agent_port', 'master_port', 'master_ip', 'rmon_name', 'use_victoria_metrics',
+	'victoria_metrics_select', 'rabbitmq_enabled', 'json_format', 'smon_keep_history_raw_range',
+	'smon_keep_rollup_1m_range', 'smon_keep_rollup_5m_range', 'smon_keep_rollup_1h_range', 'smon_keep_rollup_1d_range'
+)
+INT_SETTINGS = (
+	'session_ttl', 'token_ttl', 'ldap_type', 'ldap_port', 'ldap_enable', 'log_time_storage', 'syslog_server_enable',
+	'keep_history_range', 'ssl_expire_warning_alert', 'ssl_expire_critical_alert', 'action_keep_history_range',
+	'use_victoria_metrics', 'mail_enabled', 'mail_send_hello_message', 'rabbitmq_enabled', 'json_format',
+	'smon_keep_history_raw_range', 'smon_keep_rollup_1m_range', 'smon_keep_rollup_5m_range',
+	'smon_keep_rollup_1h_range', 'smon_keep_rollup_1d_range'
+)
+# How long cached settings of a group are used before their version is checked against the database again
+SETTINGS_VERSION_CHECK_INTERVAL = 5
+
+_settings_cache: dict[int, dict] = {}
+_settings_cache_lock = threading.Lock()
+
+
+def _get_user_group_id() -> int:
+	if has_request_context() and 'settings_group_id' in g:
+		return g.settings_group_id
+	try:
+		verify_jwt_in_request()
+		claims = get_jwt()
+		user_group_id = claims['group']
+	except Exception:
 		user_group_id = 1
+	if has_request_context():
+		g.settings_group_id = user_group_id
+	return user_group_id
 
-	if kwargs.get('all'):
-		query = Setting.select().where(Setting.group_id == user_group_id).order_by(Setting.section.desc())
-	elif kwargs.get('section'):
-		query = Setting.select().where((Setting.group_id == user_group_id) & (Setting.section == kwargs.get('section')))
-	else:
-		query = Setting.select().where((Setting.param == param) & (Setting.group_id == user_group_id))
 
+def _return_typed_setting(param: str, value: str) -> Union[str, int, None]:
+	if param in INT_SETTINGS:
+		try:
+			return int(value)
+		except (TypeError, ValueError):
+			return value
+	return value
+
+
+def _get_settings_version(group_id: int) -> int:
 	try:
-		query_res = query.execute()
+		return SettingsVersion.select(SettingsVersion.version).where(SettingsVersion.group_id == group_id).scalar() or 0
 	except Exception as e:
 		out_error(e)
+
+
+def _get_group_settings(group_id: int) -> dict:
+	"""
+	Return all settings of the group as {param: typed value}.
+
+	Settings are loaded in bulk and cached per process. The cache is checked against the group settings version
+	at most every SETTINGS_VERSION_CHECK_INTERVAL seconds, so a change made by another worker is picked up quickly.
+	"""
+	now = time.monotonic()
+	cached = _settings_cache.get(group_id)
+	if cached and now - cached['checked_at'] < SETTINGS_VERSION_CHECK_INTERVAL:
+		return cached['values']
+
+	version = _get_settings_version(group_id)
+	if cached and cached['version'] == version:
+		cached['checked_at'] = now
+		return cached['values']
+
+	try:
+		query_res = Setting.select(Setting.param, Setting.value).where(Setting.group_id == group_id).tuples().execute()
+	except Exception as e:
+		out_error(e)
+	values = {param: _return_typed_setting(param, value) for param, value in query_res}
+	with _settings_cache_lock:
+		_settings_cache[group_id] = {'version': version, 'checked_at': now, 'values': values}
+	return values
+
+
+def bump_settings_version(group_id: int) -> None:
+	"""
+	Mark the settings of the group as changed, so every worker reloads them.
+	"""
+	with _settings_cache_lock:
+		_settings_cache.pop(int(group_id), None)
+	try:
+		updated = SettingsVersion.update(version=SettingsVersion.version + 1).where(SettingsVersion.group_id == group_id).execute()
+		if not updated:
+			SettingsVersion.insert(group_id=group_id, version=1).on_conflict_ignore().execute()
+	except Exception as e:
+		out_error(e)
+
+
+def get_setting(param, **kwargs):
+	if kwargs.get('group_id'):
+		user_group_id = kwargs.get('group_id')
 	else:
-		if kwargs.get('all') or kwargs.get('section'):
-			return query_res
+		user_group_id = _get_user_group_id()
+
+	if param in GLOBAL_SETTINGS:
+		user_group_id = 1
+
+	if kwargs.get('all') or kwargs.get('section'):
+		if kwargs.get('all'):
+			query = Setting.select().where(Setting.group_id == user_group_id).order_by(Setting.section.desc())
 		else:
-			for setting in query_res:
-				if param in (
-					'session_ttl', 'token_ttl', 'ldap_type', 'ldap_port', 'ldap_enable', 'log_time_storage', 'syslog_server_enable',
-					'keep_history_range', 'ssl_expire_warning_alert', 'ssl_expire_critical_alert', 'action_keep_history_range',
-					'use_victoria_metrics', 'mail_enabled', 'mail_send_hello_message', 'rabbitmq_enabled', 'json_format'
-				):
-					return int(setting.value)
-				else:
-					return setting.value
+			query = Setting.select().where((Setting.group_id == user_group_id) & (Setting.section == kwargs.get('section')))
+		try:
+			return query.execute()
+		except Exception as e:
+			out_error(e)
+
+	return _get_group_settings(int(user_group_id)).get(param)
 
 
 def update_setting(param: str, val: str, user_group: int) -> None:
@@ -53,6 +128,7 @@ def update_setting(param: str, val: str, user_group: int) -> None:
 		query.execute()
 	except Exception as e:
 		out_error(e)
+	bump_settings_version(user_group)
 
 
 def select_roles():
@@ -4,6 +4,7 @@ from app.modules.db.db_model import User, UserGroups, Groups, pgsql_enable
 from app.modules.db.sql import get_setting
 from app.modules.db.common import out_error
 import app.modules.roxy_wi_tools as roxy_wi_tools
+import app.modules.common.identity_cache as identity_cache
 from app.modules.roxywi.exception import RoxywiResourceNotFound
 
 
@@ -34,6 +35,7 @@ def update_user_from_admin_area(user, email, user_id, enabled):
 		User.update(username=user, email=email, enabled=enabled).where(User.user_id == user_id).execute()
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_user(user_id)
 
 
 def delete_user_groups(user_id):
@@ -43,6 +45,7 @@ def delete_user_groups(user_id):
 		out_error(e)
 		return False
 	else:
+		identity_cache.invalidate_user(user_id)
 		return True
 
 
@@ -51,6 +54,7 @@ def update_user_current_groups(group_id: int, user_id: int) -> None:
 		User.update(group_id=group_id).where(User.user_id == user_id).execute()
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_user(user_id)
 
 
 def update_user_password(password, user_id):
@@ -71,6 +75,7 @@ def delete_user(user_id):
 		out_error(e)
 		return False
 	else:
+		identity_cache.invalidate_user(user_id)
 		return True
 
 
@@ -80,6 +85,7 @@ def update_user_role(user_id: int, group_id: int, role_id: int) -> None:
 		UserGroups.insert(user_id=user_id, user_group_id=group_id, user_role_id=role_id).execute()
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_user(user_id)
 
 
 def delete_user_from_group(group_id: int, user_id):
@@ -89,6 +95,7 @@ def delete_user_from_group(group_id: int, user_id):
 		raise RoxywiResourceNotFound
 	except Exception as e:
 		out_error(e)
+	identity_cache.invalidate_user(user_id)
 
 
 def select_users(**kwargs):
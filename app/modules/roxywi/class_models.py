@@ -1,6 +1,6 @@
 import re
 import json
-from annotated_types import Gt, Le
+from annotated_types import Gt, Le, Len
 from typing import Optional, Annotated, Union, Literal, Any, List
 
 from shlex import quote
@@ -90,6 +90,7 @@ class BaseCheckRequest(BaseModel):
     priority: Literal['info', 'warning', 'error', 'critical'] = 'critical'
     expiration: Optional[str] = None
     threshold_timeout: Optional[float] = 0
+    keep_history: Optional[Annotated[int, Gt(0), Le(3650)]] = None
 
     @model_validator(mode="after")
     def validate_threshold_timeout(self) -> "BaseCheckRequest":
@@ -375,6 +376,37 @@ class CheckFiltersQuery(GroupQuery):
         'name', 'status', 'check_type', 'check_group', 'created_at', 'updated_at',
         '-name', '-status', '-check_type', '-check_group', '-created_at', '-updated_at']
     ] = None
+    cursor: Optional[str] = None
+
+    @model_validator(mode="after")
+    def validate_cursor(self) -> "CheckFiltersQuery":
+        if self.cursor and self.sort_by:
+            raise ValueError('cursor can not be used with sort_by')
+        return self
+
+
+class ChecksStatusesQuery(CheckFiltersQuery):
+    check_id: Optional[Annotated[List[int], Len(max_length=500)]] = None
+    last: Annotated[int, Gt(0), Le(100)] = 40
+
+    @field_validator('check_id', mode='before')
+    @classmethod
+    def split_check_ids(cls, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, (list, tuple)):
+            value = ','.join(str(v) for v in value)
+        return [v for v in str(value).split(',') if v.strip()]
+
+
+class ChecksImportQuery(GroupQuery):
+    format: Optional[Literal['jsonl', 'csv']] = None
+    dry_run: Optional[bool] = False
+
+
+class ChecksExportQuery(GroupQuery):
+    format: Literal['jsonl', 'csv'] = 'jsonl'
+    check_type: Optional[Literal['http', 'tcp', 'ping', 'dns', 'rabbitmq', 'smtp']] = None
 
 
 class HistoryQuery(GroupQuery):
@@ -382,6 +414,13 @@ class HistoryQuery(GroupQuery):
     limit: int = 25
     sort_by: Optional[Literal['name', 'id', 'date', '-name', '-id', '-date']] = None
     check_name: Optional[EscapedString] = None
+    cursor: Optional[str] = None
+
+    @model_validator(mode="after")
+    def validate_cursor(self) -> "HistoryQuery":
+        if self.cursor and self.sort_by not in (None, 'date', '-date'):
+            raise ValueError('cursor can only be used with sorting by date')
+        return self
 
 
 class UserSearchRequest(GroupQuery):
@@ -474,8 +513,31 @@ class NettoolsRequest(BaseModel):
     netmask: Optional[int] = None
 
 
+class CheckResult(BaseModel):
+    smon_id: int
+    check_id: int
+    status: int
+    response_time: Optional[float] = 0
+    mes: Optional[str] = ''
+    date: Optional[datetime] = None
+    name_lookup: Optional[str] = None
+    connect: Optional[str] = None
+    app_connect: Optional[str] = None
+    pre_transfer: Optional[str] = None
+    redirect: Optional[str] = None
+    start_transfer: Optional[str] = None
+    download: Optional[str] = None
+
+
+class CheckResultsRequest(BaseModel):
+    uuid: str
+    results: Annotated[List[CheckResult], Len(max_length=10000)]
+
+
 class CheckMetricsQuery(GroupQuery):
     step: Optional[str] = '30s'
+    tier: Optional[Literal['1m', '5m', '1h', '1d']] = None
+    format: Literal['string', 'columnar', 'columnar_f32'] = 'string'
     start: Optional[str] = (datetime.now() - timedelta(hours=0, minutes=30)).strftime("%Y-%m-%dT%H:%M:%S%z")
     end: Optional[str] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S%z")
 
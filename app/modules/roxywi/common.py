@@ -13,6 +13,7 @@ import app.modules.db.group as group_sql
 import app.modules.db.server as server_sql
 import app.modules.db.history as history_sql
 import app.modules.roxy_wi_tools as roxy_wi_tools
+import app.modules.common.identity_cache as identity_cache
 from app.modules.roxywi.exception import RoxywiGroupMismatch
 from app.modules.roxywi.class_models import ErrorResponse
 from app.modules.roxywi.error_handler import handle_exception
@@ -24,33 +25,53 @@ get_config_var = roxy_wi_tools.GetConfigVar()
 def get_jwt_token_claims() -> dict:
 	verify_jwt_in_request()
 	claims = get_jwt()
-	claim = {'user_id': claims['user_id'], 'group': claims['group']}
+	claim = {'user_id': claims['user_id'], 'group': claims['group'], 'jti': claims.get('jti')}
 	return claim
 
 
+def _identity_key(claims: dict, name: str, *args) -> tuple:
+	return (claims['user_id'], claims['group'], claims['jti'], name) + args
+
+
+def _get_username(claims: dict) -> str:
+	return identity_cache.get_or_load(
+		_identity_key(claims, 'username'), lambda: user_sql.get_user_id(user_id=claims['user_id']).username
+	)
+
+
 def get_user_group(**kwargs) -> int:
 	user_group = ''
 
 	try:
 		claims = get_jwt_token_claims()
 		user_group_id = claims['group']
-		group = group_sql.get_group(user_group_id)
-		if group.group_id == int(user_group_id):
+		group_id, group_name = identity_cache.get_or_load(
+			_identity_key(claims, 'group'), lambda: _return_group_id_and_name(user_group_id)
+		)
+		if group_id == int(user_group_id):
 			if kwargs.get('id'):
-				user_group = group.group_id
+				user_group = group_id
 			else:
-				user_group = group.name
+				user_group = group_name
 	except Exception as e:
 		raise Exception(f'error: {e}')
 	return user_group
 
 
+def _return_group_id_and_name(group_id: int) -> tuple:
+	group = group_sql.get_group(group_id)
+	return group.group_id, group.name
+
+
 def check_user_group_for_flask():
 	claims = get_jwt_token_claims()
 	user_id = claims['user_id']
 	group_id = claims['group']
+	is_in_group = identity_cache.get_or_load(
+		_identity_key(claims, 'user_group'), lambda: user_sql.check_user_group(user_id, group_id)
+	)
 
-	if user_sql.check_user_group(user_id, group_id):
+	if is_in_group:
 		return True
 	else:
 		logger('Has tried to actions in not his group', 'warning')
@@ -105,8 +126,7 @@ def get_files(folder, file_format, server_ip=None) -> list:
 
 def logger(action: str, level: str = 'info', additional_extra: dict = None, **kwargs) -> None:
 	claims = get_jwt_token_claims()
-	user_id = claims['user_id']
-	login = user_sql.get_user_id(user_id=user_id).username
+	login = _get_username(claims)
 	hostname = socket.gethostname()
 	ip = ""
 	extra = {}
@@ -186,10 +206,19 @@ def get_dick_permit(**kwargs):
 
 def get_users_params(**kwargs):
 	user_data = get_jwt_token_claims()
+	key = _identity_key(user_data, 'user_params', bool(kwargs.get('disable')))
+	user_params = identity_cache.get_or_load(key, lambda: _load_users_params(user_data, **kwargs))
+	# Copy, so callers that change g.user_params do not change the cached one
+	user_params = dict(user_params)
+	user_params['lang'] = get_user_lang_for_flask()
+
+	return user_params
+
 
+def _load_users_params(user_data: dict, **kwargs) -> dict:
 	try:
 		user_id = user_data['user_id']
-		user = user_sql.get_user_id(user_id)
+		username = _get_username(user_data)
 	except Exception:
 		raise Exception('Cannot get user id')
 
@@ -204,10 +233,9 @@ def get_users_params(**kwargs):
 		servers = get_dick_permit()
 
 	user_params = {
-		'user': user.username,
+		'user': username,
 		'role': role,
 		'servers': servers,
-		'lang': get_user_lang_for_flask(),
 		'user_id': user_id,
 		'group_id': user_data['group']
 	}
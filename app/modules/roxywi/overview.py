@@ -8,6 +8,7 @@ import app.modules.db.user as user_sql
 import app.modules.db.smon as smon_sql
 import app.modules.db.server as server_sql
 import app.modules.tools.common as tools_common
+import app.modules.tools.service_status as service_status
 import app.modules.roxywi.common as roxywi_common
 import app.modules.tools.smon_agent as smon_agent
 
@@ -44,10 +45,10 @@ def show_services_overview():
             servers_group.append(s[2])
 
     roxy_tools = roxy_sql.get_roxy_tools()
+    statuses = service_status.get_statuses()
     roxy_tools_status = {}
     for tool in roxy_tools:
-        status = tools_common.is_tool_active(tool)
-        roxy_tools_status.setdefault(tool, status)
+        roxy_tools_status.setdefault(tool, statuses.get(tool) or tools_common.is_tool_active(tool))
 
     return render_template(
         'ajax/show_services_ovw.html', role=user_params['role'], roxy_tools_status=roxy_tools_status, lang=lang
@@ -13,8 +13,18 @@ import app.modules.roxywi.common as roxywi_common
 import app.modules.server.server as server_mod
 from app.version import get_service_version
 
+# RMON does not move in or out of a container while it runs, so this is checked once per process
+_is_docker = None
+
 
 def is_docker() -> bool:
+	global _is_docker
+	if _is_docker is None:
+		_is_docker = _detect_docker()
+	return _is_docker
+
+
+def _detect_docker() -> bool:
 	path = "/proc/self/cgroup"
 	if not os.path.isfile(path):
 		return False
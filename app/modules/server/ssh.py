@@ -1,5 +1,7 @@
 import os
 import base64
+import hashlib
+import threading
 from cryptography.fernet import Fernet
 
 from flask import render_template
@@ -7,7 +9,6 @@ from playhouse.shortcuts import model_to_dict
 
 import app.modules.db.cred as cred_sql
 import app.modules.db.group as group_sql
-import app.modules.db.server as server_sql
 from app.modules.server import ssh_connection
 from app.modules.db.db_model import Cred
 import app.modules.roxywi.common as roxywi_common
@@ -16,8 +17,34 @@ from app.modules.roxywi.class_models import IdResponse, IdDataResponse, CredRequ
 
 get_config = roxy_wi_tools.GetConfigVar()
 
+# Decrypted SSH settings per server, reused until the credentials or the port of the server change
+_ssh_settings_cache: dict[str, tuple[str, dict]] = {}
+_ssh_settings_lock = threading.Lock()
+
+
+def _invalidate_ssh_settings() -> None:
+	with _ssh_settings_lock:
+		_ssh_settings_cache.clear()
+	ssh_connection.close_connections()
+
 
 def return_ssh_keys_path(server_ip: str) -> dict:
+	"""
+	Return the decrypted SSH settings of the server.
+
+	Only the still encrypted credentials are read on every call: decryption and the key file are skipped
+	as long as they did not change.
+	"""
+	try:
+		server_ssh = cred_sql.select_server_ssh(server_ip)
+	except Exception as e:
+		raise Exception(f'error: Cannot get SSH port: {e}')
+	fingerprint = hashlib.sha256(repr(sorted(server_ssh.items())).encode()).hexdigest()
+
+	cached = _ssh_settings_cache.get(server_ip)
+	if cached and cached[0] == fingerprint and (not cached[1].get('key') or os.path.isfile(cached[1]['key'])):
+		return dict(cached[1])
+
 	ssh_settings = {}
 	sshs = cred_sql.select_ssh(serv=server_ip)
 
@@ -47,11 +74,10 @@ def return_ssh_keys_path(server_ip: str) -> dict:
 		ssh_settings.setdefault('key', ssh_key)
 		ssh_settings.setdefault('passphrase', passphrase)
 
-	try:
-		server = server_sql.get_server_by_ip(server_ip)
-		ssh_settings.setdefault('port', server.port)
-	except Exception as e:
-		raise Exception(f'error: Cannot get SSH port: {e}')
+	ssh_settings.setdefault('port', server_ssh['port'])
+	ssh_settings['fingerprint'] = fingerprint
+	with _ssh_settings_lock:
+		_ssh_settings_cache[server_ip] = (fingerprint, dict(ssh_settings))
 
 	return ssh_settings
 
@@ -113,6 +139,7 @@ def upload_ssh_key(ssh_id: int, key: str, passphrase: str) -> None:
 		cred_sql.update_ssh_passphrase(ssh_id, passphrase)
 	except Exception as e:
 		raise Exception(e)
+	_invalidate_ssh_settings()
 
 	roxywi_common.logger("A new SSH cert has been uploaded", service='server', keep_history=1)
 
@@ -126,6 +153,7 @@ def update_ssh_key(body: CredRequest, group_id: int, ssh_id: int) -> None:
 
 	try:
 		cred_sql.update_ssh(ssh_id, body.name, body.key_enabled, group_id, body.username, body.password, body.shared)
+		_invalidate_ssh_settings()
 		roxywi_common.logger(f'The SSH credentials {body.name} has been updated ', service='server', keep_history=1)
 	except Exception as e:
 		raise Exception(e)
@@ -142,6 +170,7 @@ def delete_ssh_key(ssh_id: int) -> None:
 			pass
 	try:
 		cred_sql.delete_ssh(ssh_id)
+		_invalidate_ssh_settings()
 		roxywi_common.logger(f'The SSH credentials {sshs.name} has deleted', service='server', keep_history=1)
 	except Exception as e:
 		raise e
@@ -1,13 +1,80 @@
+import time
 import select
+import hashlib
+import threading
 
 import paramiko
 
+# Authenticated transports are kept open and reused, every command gets its own channel
+SSH_KEEPALIVE = 30
+# A pooled transport nobody used for this long is closed, in seconds
+SSH_POOL_IDLE_TTL = 300
+SSH_POOL_MAX_SIZE = 100
+
+
+class _PooledClient:
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+    def is_active(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+_pool: dict[tuple, _PooledClient] = {}
+_connect_locks: dict[tuple, threading.Lock] = {}
+_pool_lock = threading.Lock()
+
+
+def _close_client(pooled: _PooledClient) -> None:
+    try:
+        pooled.client.close()
+    except Exception:
+        pass
+
+
+def close_idle_connections(idle_ttl: int = SSH_POOL_IDLE_TTL) -> int:
+    """
+    Close the pooled transports that are not in use and were idle for longer than idle_ttl seconds, or are dead.
+
+    Returns the number of closed transports.
+    """
+    now = time.monotonic()
+    with _pool_lock:
+        expired = [
+            key for key, pooled in _pool.items()
+            if pooled.in_use == 0 and (now - pooled.last_used >= idle_ttl or not pooled.is_active())
+        ]
+        closed = [_pool.pop(key) for key in expired]
+        for key in expired:
+            _connect_locks.pop(key, None)
+    for pooled in closed:
+        _close_client(pooled)
+    return len(closed)
+
+
+def close_connections(server_ip: str = None) -> None:
+    """
+    Close the idle pooled transports of a server, or of all servers, after their credentials were changed.
+
+    Transports in use are closed once released.
+    """
+    with _pool_lock:
+        keys = [key for key in _pool if server_ip is None or key[0] == str(server_ip)]
+        closed = []
+        for key in keys:
+            pooled = _pool.pop(key)
+            if pooled.in_use == 0:
+                closed.append(pooled)
+    for pooled in closed:
+        _close_client(pooled)
+
 
 class SshConnection:
     def __init__(self, server_ip: str, ssh_settings: dict):
-        self.ssh = paramiko.SSHClient()
-        self.ssh.load_system_host_keys()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh = None
         self.server_ip = str(server_ip)
         self.ssh_port = ssh_settings['port']
         self.ssh_user_name = ssh_settings['user']
@@ -15,9 +82,18 @@ class SshConnection:
         self.ssh_enable = ssh_settings['enabled']
         self.ssh_key_name = ssh_settings['key']
         self.ssh_passphrase = ssh_settings['passphrase']
+        fingerprint = ssh_settings.get('fingerprint') or hashlib.sha256(repr(
+            (self.ssh_user_name, self.ssh_user_password, self.ssh_enable, self.ssh_key_name, self.ssh_passphrase)
+        ).encode()).hexdigest()
+        self._pool_key = (self.server_ip, self.ssh_port, self.ssh_user_name, fingerprint)
+        self._pooled = None
+        self._reused = False
 
     # noinspection PyExceptClausesOrder
-    def __enter__(self):
+    def _connect(self) -> paramiko.SSHClient:
+        ssh = paramiko.SSHClient()
+        ssh.load_system_host_keys()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         kwargs = {
             'hostname': self.server_ip,
             'port': self.ssh_port,
@@ -33,7 +109,7 @@ class SshConnection:
         else:
             kwargs.setdefault('password', self.ssh_user_password)
         try:
-            self.ssh.connect(**kwargs)
+            ssh.connect(**kwargs)
         except paramiko.AuthenticationException:
             raise paramiko.SSHException(f'{self.server_ip} Authentication failed, please verify your credentials')
         except paramiko.SSHException as sshException:
@@ -49,10 +125,66 @@ class SshConnection:
                 raise paramiko.SSHException(f'{self.server_ip} Check the IP of the server')
             else:
                 raise paramiko.SSHException(f'{self.server_ip} {e}')
+        ssh.get_transport().set_keepalive(SSH_KEEPALIVE)
+        return ssh
+
+    def _acquire(self) -> None:
+        """
+        Take the pooled transport of the server or open a new one. Only one thread per server does the handshake.
+        """
+        with _pool_lock:
+            pooled = _pool.get(self._pool_key)
+            if pooled is not None and pooled.is_active():
+                pooled.in_use += 1
+                self._pooled, self.ssh, self._reused = pooled, pooled.client, True
+                return
+            connect_lock = _connect_locks.setdefault(self._pool_key, threading.Lock())
+
+        with connect_lock:
+            with _pool_lock:
+                pooled = _pool.get(self._pool_key)
+                if pooled is not None and pooled.is_active():
+                    pooled.in_use += 1
+                    self._pooled, self.ssh, self._reused = pooled, pooled.client, True
+                    return
+                if pooled is not None:
+                    del _pool[self._pool_key]
+                    if pooled.in_use == 0:
+                        _close_client(pooled)
+            pooled = _PooledClient(self._connect())
+            pooled.in_use = 1
+            with _pool_lock:
+                if len(_pool) < SSH_POOL_MAX_SIZE:
+                    _pool[self._pool_key] = pooled
+            self._pooled, self.ssh, self._reused = pooled, pooled.client, False
+
+    def _release(self) -> None:
+        pooled, self._pooled = self._pooled, None
+        if pooled is None:
+            return
+        with _pool_lock:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            # Transports dropped from the pool while in use, or dead ones, are closed by the last user
+            close = pooled.in_use == 0 and (_pool.get(self._pool_key) is not pooled or not pooled.is_active())
+            if close and _pool.get(self._pool_key) is pooled:
+                del _pool[self._pool_key]
+        if close:
+            _close_client(pooled)
+
+    def _reconnect(self) -> None:
+        with _pool_lock:
+            if _pool.get(self._pool_key) is self._pooled:
+                del _pool[self._pool_key]
+        self._release()
+        self._acquire()
+
+    def __enter__(self):
+        self._acquire()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.ssh.close()
+        self._release()
 
     def run_command(self, command, **kwargs):
         if kwargs.get('timeout'):
@@ -62,7 +194,14 @@ class SshConnection:
         try:
             stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True, timeout=timeout)
         except Exception as e:
-            raise paramiko.SSHException(str(e))
+            # A pooled transport may have been dropped by the server since its last use
+            if not self._reused:
+                raise paramiko.SSHException(str(e))
+            self._reconnect()
+            try:
+                stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True, timeout=timeout)
+            except Exception as e:
+                raise paramiko.SSHException(str(e))
 
         return stdin, stdout, stderr
 
@@ -152,4 +291,3 @@ class SshConnection:
             # close all the pseudofiles
             stdout.close()
             stderr.close()
-            self.ssh.close()
@@ -0,0 +1,203 @@
+import time
+import threading
+import contextvars
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import app.modules.db.alert as alert_sql
+import app.modules.tools.alerting as alerting
+import app.modules.roxywi.common as roxywi_common
+import app.modules.common.metrics as app_metrics
+from app.modules.db.db_model import conn, AlertEvent
+
+# How many queued alerts one run takes from alert_event
+ALERT_DISPATCH_BATCH = 500
+# How long one run waits for the channel workers, unfinished deliveries are retried
+ALERT_DISPATCH_DEADLINE = 50
+# Taken alerts are hidden from other runs for this long, so a crashed run does not lose them
+ALERT_LEASE = timedelta(minutes=5)
+ALERT_CHANNEL_WORKERS = 4
+# A channel with this many unfinished deliveries gets no new ones until it catches up
+ALERT_CHANNEL_MAX_PENDING = 50
+ALERT_MAX_ATTEMPTS = 8
+ALERT_RETRY_BASE = 10
+ALERT_RETRY_MAX = 900
+# Above this many alerts for one destination in one run, they are sent as a single message
+ALERT_COALESCE_THRESHOLD = 3
+ALERT_COALESCE_MAX_LINES = 50
+
+SENDERS = {
+    'telegram': alerting.telegram_send_mess,
+    'slack': alerting.slack_send_mess,
+    'pd': alerting.pd_send_mess,
+    'mm': alerting.mm_send_mess,
+    'email': alerting.email_send_mess,
+    'incidentrelay': alerting.incidentrelay_send_mess,
+}
+# PagerDuty and Incident Relay deduplicate by check and state, so their alerts are never merged
+COALESCED_CHANNELS = ('telegram', 'slack', 'mm', 'email')
+_LEVEL_ORDER = {'info': 0, 'warning': 1}
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_pending: dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def queue_alert(multi_check_id: int, message: str, level: str, entity_name: str = '', alert_key: str = '', **kwargs) -> int:
+    """
+    Queue an alert for the dispatcher instead of sending it from the caller.
+
+    kwargs are passed to the channel senders, like state_id, ip or check_type.
+    """
+    return alert_sql.insert_alert_event(multi_check_id, message, level, entity_name, alert_key, kwargs)
+
+
+def _get_executor(channel_type: str) -> ThreadPoolExecutor:
+    with _lock:
+        if channel_type not in _executors:
+            _executors[channel_type] = ThreadPoolExecutor(
+                max_workers=ALERT_CHANNEL_WORKERS, thread_name_prefix=f'rmon-alert-{channel_type}'
+            )
+        return _executors[channel_type]
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(ALERT_RETRY_BASE * 2 ** (attempts - 1), ALERT_RETRY_MAX))
+
+
+def _sender_kwargs(event: AlertEvent, channel_id: int) -> dict:
+    kwargs = {key: value for key, value in (event.kwargs or {}).items() if key != 'channels'}
+    kwargs['channel_id'] = channel_id
+    kwargs['multi_check_id'] = event.multi_check_id_id
+    return kwargs
+
+
+def _coalesce(events: list[AlertEvent]) -> tuple[str, str, int]:
+    level = max((event.level for event in events), key=lambda event_level: _LEVEL_ORDER.get(event_level, 2))
+    lines = [f'{event.level}: {event.message}' for event in events[:ALERT_COALESCE_MAX_LINES]]
+    if len(events) > ALERT_COALESCE_MAX_LINES:
+        lines.append(f'... and {len(events) - ALERT_COALESCE_MAX_LINES} more')
+    multi_check_ids = {event.multi_check_id_id for event in events}
+    multi_check_id = multi_check_ids.pop() if len(multi_check_ids) == 1 else None
+    return f'{len(events)} alerts:\n' + '\n'.join(lines), level, multi_check_id
+
+
+def _send(channel_type: str, mess: str, level: str, **kwargs) -> None:
+    started = time.perf_counter()
+    failed = True
+    try:
+        SENDERS[channel_type](mess, level, **kwargs)
+        failed = False
+    finally:
+        app_metrics.observe_alert_delivery(channel_type, time.perf_counter() - started, failed)
+
+
+def _deliver(channel_type: str, channel_id: int, events: list[AlertEvent]) -> list[int]:
+    """
+    Send the alerts of one destination. Returns the ids of the events that were not delivered.
+    """
+    failed = []
+    try:
+        if channel_type in COALESCED_CHANNELS and len(events) > ALERT_COALESCE_THRESHOLD:
+            mess, level, multi_check_id = _coalesce(events)
+            try:
+                _send(channel_type, mess, level, channel_id=channel_id, multi_check_id=multi_check_id)
+            except Exception as e:
+                roxywi_common.logging_without_user(f'Cannot send {len(events)} alerts to {channel_type} {channel_id}: {e}', 'error')
+                failed = [event.id for event in events]
+            return failed
+        for event in events:
+            try:
+                _send(channel_type, event.message, event.level, **_sender_kwargs(event, channel_id))
+            except Exception as e:
+                roxywi_common.logging_without_user(f'Cannot send alert {event.id} to {channel_type} {channel_id}: {e}', 'error')
+                failed.append(event.id)
+        return failed
+    finally:
+        with _lock:
+            _pending[channel_type] -= 1
+        # Worker threads keep their own DB connection, give it back like teardown_request does
+        if not conn.is_closed():
+            conn.close()
+
+
+def _event_destinations(event: AlertEvent, channels: dict) -> list[tuple[str, int]]:
+    # Retried alerts only go to the destinations that did not get them yet
+    if (event.kwargs or {}).get('channels') is not None:
+        return [(channel_type, channel_id) for channel_type, channel_id in event.kwargs['channels']]
+    return [
+        (channel_type, channel_id) for channel_type, channel_id in channels.get(event.multi_check_id_id, {}).items()
+        if channel_type in SENDERS
+    ]
+
+
+def dispatch_alerts() -> dict:
+    """
+    Deliver the queued alerts of alert_event over the per-channel workers.
+
+    Alerts are grouped per destination, so an alert storm sends one message per channel instead of one per alert.
+    Delivered alerts are deleted, failed ones are retried with exponential backoff up to ALERT_MAX_ATTEMPTS.
+    Returns the number of delivered, retried and dropped alerts.
+    """
+    stats = {'delivered': 0, 'retried': 0, 'dropped': 0}
+    now = datetime.now()
+    events = alert_sql.claim_due_alert_events(ALERT_DISPATCH_BATCH, now + ALERT_LEASE)
+    if not events:
+        return stats
+    channels = alert_sql.select_alert_channels({event.multi_check_id_id for event in events})
+
+    deliveries: dict[tuple[str, int], list[AlertEvent]] = {}
+    for event in events:
+        for destination in _event_destinations(event, channels):
+            deliveries.setdefault(tuple(destination), []).append(event)
+
+    # Every event keeps the destinations that did not get it; failed ones count as an attempt, deferred ones do not
+    undelivered = {event.id: set() for event in events}
+    failed_events = set()
+    futures = {}
+    for (channel_type, channel_id), channel_events in deliveries.items():
+        with _lock:
+            busy = _pending.get(channel_type, 0) >= ALERT_CHANNEL_MAX_PENDING
+            if not busy:
+                _pending[channel_type] = _pending.get(channel_type, 0) + 1
+        if busy:
+            for event in channel_events:
+                undelivered[event.id].add((channel_type, channel_id))
+            continue
+        future = _get_executor(channel_type).submit(
+            contextvars.copy_context().run, _deliver, channel_type, channel_id, channel_events
+        )
+        futures[future] = (channel_type, channel_id, channel_events)
+
+    done, _ = wait(futures, timeout=ALERT_DISPATCH_DEADLINE)
+    for future, (channel_type, channel_id, channel_events) in futures.items():
+        if future in done and future.exception() is None:
+            failed_ids = set(future.result())
+        else:
+            failed_ids = {event.id for event in channel_events}
+        for event_id in failed_ids:
+            undelivered[event_id].add((channel_type, channel_id))
+            failed_events.add(event_id)
+
+    delivered = []
+    for event in events:
+        destinations = undelivered[event.id]
+        if not destinations:
+            delivered.append(event.id)
+            continue
+        attempts = event.attempts + 1 if event.id in failed_events else event.attempts
+        if attempts >= ALERT_MAX_ATTEMPTS:
+            roxywi_common.logging_without_user(f'Dropped alert {event.id} after {attempts} attempts: {event.message}', 'error')
+            delivered.append(event.id)
+            stats['dropped'] += 1
+            continue
+        kwargs = dict(event.kwargs or {})
+        kwargs['channels'] = sorted(destinations)
+        next_attempt_at = now + _retry_delay(attempts) if event.id in failed_events else now
+        alert_sql.update_alert_event_retry(event.id, attempts, next_attempt_at, kwargs)
+        stats['retried'] += 1
+
+    if delivered:
+        alert_sql.delete_alert_events(delivered)
+    stats['delivered'] = len(delivered) - stats['dropped']
+    return stats
@@ -1,5 +1,7 @@
 import json
-from typing import Union
+import threading
+from smtplib import SMTP
+from typing import Union, Callable
 
 import pika
 import pagerduty
@@ -18,6 +20,35 @@ import app.modules.db.channel as channel_sql
 import app.modules.common.common as common
 import app.modules.roxywi.common as roxywi_common
 
+# Clients of the alert channels are created once per token and reused by every message
+_clients = {}
+_clients_lock = threading.Lock()
+# BlockingConnection is not thread-safe, the connection is shared under a lock
+_rabbit = {'key': None, 'connection': None, 'channel': None, 'queues': set()}
+_rabbit_lock = threading.Lock()
+
+
+def _get_client(key: tuple, factory: Callable):
+	with _clients_lock:
+		client = _clients.get(key)
+		if client is None:
+			client = factory()
+			_clients[key] = client
+	return client
+
+
+def _get_http_session() -> requests.Session:
+	return _get_client(('http',), requests.Session)
+
+
+def _close_rabbit_connection() -> None:
+	try:
+		if _rabbit['connection'] is not None and _rabbit['connection'].is_open:
+			_rabbit['connection'].close()
+	except Exception:
+		pass
+	_rabbit.update({'key': None, 'connection': None, 'channel': None, 'queues': set()})
+
 
 def send_message_to_rabbit(message: str, **kwargs) -> None:
 	rabbit_user = sql.get_setting('rabbitmq_user')
@@ -30,48 +61,84 @@ def send_message_to_rabbit(message: str, **kwargs) -> None:
 	else:
 		rabbit_queue = sql.get_setting('rabbitmq_queue')
 
-	credentials = pika.PlainCredentials(rabbit_user, rabbit_password)
-	parameters = pika.ConnectionParameters(
-		rabbit_host,
-		rabbit_port,
-		rabbit_vhost,
-		credentials
-	)
-
-	connection = pika.BlockingConnection(parameters)
-	channel = connection.channel()
-	channel.queue_declare(queue=rabbit_queue)
-	channel.basic_publish(exchange='', routing_key=rabbit_queue, body=message)
-
-	connection.close()
+	key = (rabbit_host, rabbit_port, rabbit_vhost, rabbit_user, rabbit_password)
+
+	with _rabbit_lock:
+		# The broker may have dropped an idle connection, reconnect once before giving up
+		for attempt in range(2):
+			try:
+				if _rabbit['key'] != key or _rabbit['connection'] is None or not _rabbit['connection'].is_open:
+					_close_rabbit_connection()
+					credentials = pika.PlainCredentials(rabbit_user, rabbit_password)
+					parameters = pika.ConnectionParameters(
+						rabbit_host,
+						rabbit_port,
+						rabbit_vhost,
+						credentials
+					)
+					connection = pika.BlockingConnection(parameters)
+					_rabbit.update({'key': key, 'connection': connection, 'channel': connection.channel()})
+				channel = _rabbit['channel']
+				if rabbit_queue not in _rabbit['queues']:
+					channel.queue_declare(queue=rabbit_queue)
+					_rabbit['queues'].add(rabbit_queue)
+				channel.basic_publish(exchange='', routing_key=rabbit_queue, body=message)
+				return
+			except Exception:
+				_close_rabbit_connection()
+				if attempt:
+					raise
 
 
 def send_email_to_server_group(subject: str, mes: str, level: str, group_id: int) -> None:
 	if not sql.get_setting('mail_enabled'):
 		return
+	smtp_obj = None
 	try:
 		users_email = user_sql.select_users_emails_by_group_id(group_id)
+		smtp_obj = smtp_connect()
 
 		for user_email in users_email:
-			send_email(user_email.email, subject, f'{level}: {mes}')
+			send_email(user_email.email, subject, f'{level}: {mes}', smtp_obj=smtp_obj)
 	except Exception as e:
 		roxywi_common.logger(f'Unable to send email: {e}', "error")
+	finally:
+		smtp_quit(smtp_obj)
+
+
+def smtp_connect() -> SMTP:
+	"""
+	Open an SMTP connection with the mail settings, to send several emails over one login.
+	"""
+	mail_ssl = sql.get_setting('mail_ssl', group_id=1)
+	mail_smtp_host = sql.get_setting('mail_smtp_host', group_id=1)
+	mail_smtp_port = sql.get_setting('mail_smtp_port', group_id=1)
+	mail_smtp_user = sql.get_setting('mail_smtp_user', group_id=1)
+	mail_smtp_password = sql.get_setting('mail_smtp_password', group_id=1).replace("'", "")
 
+	smtp_obj = SMTP(mail_smtp_host, mail_smtp_port)
+	if mail_ssl:
+		smtp_obj.starttls()
+	smtp_obj.login(mail_smtp_user, mail_smtp_password)
+	return smtp_obj
 
-def send_email(email_to: str, subject: str, message: str) -> None:
-	from smtplib import SMTP
 
+def smtp_quit(smtp_obj: Union[SMTP, None]) -> None:
+	if smtp_obj is None:
+		return
+	try:
+		smtp_obj.quit()
+	except Exception:
+		pass
+
+
+def send_email(email_to: str, subject: str, message: str, smtp_obj: SMTP = None) -> None:
 	try:
 		from email.MIMEText import MIMEText
 	except Exception:
 		from email.mime.text import MIMEText
 
-	mail_ssl = sql.get_setting('mail_ssl', group_id=1)
 	mail_from = sql.get_setting('mail_from', group_id=1)
-	mail_smtp_host = sql.get_setting('mail_smtp_host', group_id=1)
-	mail_smtp_port = sql.get_setting('mail_smtp_port', group_id=1)
-	mail_smtp_user = sql.get_setting('mail_smtp_user', group_id=1)
-	mail_smtp_password = sql.get_setting('mail_smtp_password', group_id=1).replace("'", "")
 	rmon_name = sql.get_setting('rmon_name')
 
 	msg = MIMEText(message)
@@ -79,14 +146,16 @@ def send_email(email_to: str, subject: str, message: str) -> None:
 	msg['From'] = f'{rmon_name} <{mail_from}>'
 	msg['To'] = email_to
 
+	own_connection = smtp_obj is None
 	try:
-		smtp_obj = SMTP(mail_smtp_host, mail_smtp_port)
-		if mail_ssl:
-			smtp_obj.starttls()
-		smtp_obj.login(mail_smtp_user, mail_smtp_password)
+		if own_connection:
+			smtp_obj = smtp_connect()
 		smtp_obj.send_message(msg)
 	except Exception as e:
 		roxywi_common.logger(f'unable to send email: {e}', "error")
+	finally:
+		if own_connection:
+			smtp_quit(smtp_obj)
 
 
 def telegram_send_mess(mess, o_level, **kwargs):
@@ -121,7 +190,7 @@ def telegram_send_mess(mess, o_level, **kwargs):
 	if proxy is not None and proxy != '' and proxy != 'None':
 		apihelper.proxy = {'https': proxy}
 
-	if o_level != 'info':
+	if o_level != 'info' and kwargs.get('multi_check_id'):
 		try:
 			check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
 			if check.runbook:
@@ -130,7 +199,7 @@ def telegram_send_mess(mess, o_level, **kwargs):
 			roxywi_common.logger(f'unable to get check: {e}')
 
 	try:
-		bot = telebot.TeleBot(token=token_bot)
+		bot = _get_client(('telegram', token_bot), lambda: telebot.TeleBot(token=token_bot))
 		bot.send_message(chat_id=channel_name, text=f'[{rmon_name}] {level}: {mess} {runbook}')
 		return 'ok'
 	except Exception as e:
@@ -160,11 +229,11 @@ def slack_send_mess(mess, level, **kwargs):
 
 	if proxy is not None and proxy != '' and proxy != 'None':
 		proxies = dict(https=proxy, http=proxy)
-		client = WebClient(token=slack_token, proxies=proxies)
+		client = _get_client(('slack', slack_token, proxy), lambda: WebClient(token=slack_token, proxies=proxies))
 	else:
-		client = WebClient(token=slack_token)
+		client = _get_client(('slack', slack_token), lambda: WebClient(token=slack_token))
 
-	if level != 'info':
+	if level != 'info' and kwargs.get('multi_check_id'):
 		try:
 			check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
 			if check.runbook:
@@ -204,7 +273,7 @@ def pd_send_mess(mess, level, **kwargs):
 
 	try:
 		proxy = sql.get_setting('proxy')
-		session = pagerduty.EventsApiV2Client(token)
+		session = _get_client(('pd', token), lambda: pagerduty.EventsApiV2Client(token))
 		dedup_key = f'{kwargs.get("multi_check_id")} {kwargs.get("state_id")}'
 	except Exception as e:
 		roxywi_common.logger(str(e), "error")
@@ -214,7 +283,7 @@ def pd_send_mess(mess, level, **kwargs):
 		proxies = dict(https=proxy, http=proxy)
 		session.proxies.update(proxies)
 
-	if level != 'info':
+	if level != 'info' and kwargs.get('multi_check_id'):
 		try:
 			check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
 			if check.runbook:
@@ -260,7 +329,7 @@ def mm_send_mess(mess, level, **kwargs):
 		token = pd.token
 		channel = pd.channel_name.lower()
 
-	if level != 'info':
+	if level != 'info' and kwargs.get('multi_check_id'):
 		try:
 			check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
 			if check.runbook:
@@ -298,7 +367,7 @@ def mm_send_mess(mess, level, **kwargs):
 	values = f'{{"channel": "{channel}", "username": "{rmon_name}", "attachments": [{attach}]}}'
 	proxy_dict = common.return_proxy_dict()
 	try:
-		response = requests.post(token, headers=headers, data=str(values), timeout=15, proxies=proxy_dict)
+		response = _get_http_session().post(token, headers=headers, data=str(values), timeout=15, proxies=proxy_dict)
 		if response.status_code != 200:
 			res = json.loads(response.text)
 			roxywi_common.logger(res["message"].encode('utf-8'))
@@ -474,7 +543,7 @@ def incidentrelay_send_mess(mess, level, **kwargs):
 		}
 
 		try:
-			response = requests.post(
+			response = _get_http_session().post(
 				f'{base_url}/api/integrations/rmon',
 				headers=headers,
 				json=payload,
@@ -534,19 +603,26 @@ def email_send_mess(mess, o_level, **kwargs):
 	else:
 		emails = channel_sql.get_receiver_by_ip('email', kwargs.get('ip'))
 
-	for e in emails:
-		emails_raw = e.token
-		emails = [email.strip() for email in emails_raw.replace(',', ' ').split()]
-		for email in emails:
-			email = email.replace("'", "")
-			if o_level != 'info':
-				try:
-					check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
-					if check.runbook:
-						runbook = f'.\n Runbook: {check.runbook}'
-				except Exception as e:
-					roxywi_common.logger(f'unable to get check: {e}')
-			send_email(email, f'{rmon_name}: {level}: {mess} {runbook}', f'{level}: {mess}')
+	if o_level != 'info' and kwargs.get('multi_check_id'):
+		try:
+			check = smon_sql.get_one_multi_check(kwargs.get('multi_check_id'))
+			if check.runbook:
+				runbook = f'.\n Runbook: {check.runbook}'
+		except Exception as e:
+			roxywi_common.logger(f'unable to get check: {e}')
+
+	smtp_obj = None
+	try:
+		for e in emails:
+			emails_raw = e.token
+			recipients = [email.strip() for email in emails_raw.replace(',', ' ').split()]
+			for email in recipients:
+				email = email.replace("'", "")
+				if smtp_obj is None:
+					smtp_obj = smtp_connect()
+				send_email(email, f'{rmon_name}: {level}: {mess} {runbook}', f'{level}: {mess}', smtp_obj=smtp_obj)
+	finally:
+		smtp_quit(smtp_obj)
 
 
 def check_email_alert() -> str:
@@ -3,8 +3,8 @@ from typing import Union, Type
 import distro
 
 import app.modules.db.roxy as roxy_sql
-import app.modules.roxywi.roxy as roxywi_mod
 import app.modules.server.server as server_mod
+import app.modules.tools.service_status as service_status
 from app.modules.db.db_model import SmonTcpCheck, SmonHttpCheck, SmonDnsCheck, SmonPingCheck, SmonSMTPCheck, \
     SmonRabbitCheck
 
@@ -20,8 +20,9 @@ def get_services_status(update_cur_ver=0):
             raise Exception(f'error: Cannot update current versions: {e}')
 
     try:
+        statuses = service_status.get_statuses()
         for s, v in services_name.items():
-            status = is_tool_active(s)
+            status = statuses.get(s) or service_status.get_status(s)
             services.append([s, status, v])
     except Exception as e:
         raise Exception(f'error: Cannot get tools status: {e}')
@@ -46,6 +47,7 @@ def update_roxy_wi(service: str) -> str:
 
     output, stderr = server_mod.subprocess_execute(cmd)
     update_cur_tool_version(service)
+    service_status.invalidate()
 
     if stderr != '':
         return str(stderr)
@@ -54,13 +56,7 @@ def update_roxy_wi(service: str) -> str:
 
 
 def is_tool_active(tool_name: str) -> str:
-    is_in_docker = roxywi_mod.is_docker()
-    if is_in_docker:
-        cmd = f"sudo supervisorctl status {tool_name}|awk '{{print $2}}'"
-    else:
-        cmd = f"systemctl is-active {tool_name}"
-    status, stderr = server_mod.subprocess_execute(cmd)
-    return status[0]
+    return service_status.get_status(tool_name)
 
 
 def update_cur_tool_versions() -> None:
@@ -0,0 +1,121 @@
+import os
+import time
+import uuid
+import atexit
+import socket
+import functools
+import threading
+from datetime import datetime
+
+from app import scheduler
+import app.modules.db.job as job_sql
+import app.modules.roxywi.common as roxywi_common
+import app.modules.common.metrics as app_metrics
+
+LEADER_LOCK = 'scheduler_leader'
+# The leader holds the lease for this long and renews it every LEADER_RENEW seconds
+LEADER_LEASE = 30
+LEADER_RENEW = 10
+JOB_RUNS_KEEP_DAYS = 7
+# Every run is observed in the rmon_job_seconds histogram, only failed runs and runs slower than this go to job_run
+JOB_RUN_SLOW = 10
+
+_state = {'pid': None, 'owner': None, 'leader_until': 0.0}
+_lock = threading.Lock()
+
+
+def get_owner() -> str:
+    pid = os.getpid()
+    with _lock:
+        if _state['pid'] != pid:
+            # A forked worker must not inherit the lease of its parent
+            _state.update(pid=pid, owner=f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}', leader_until=0.0)
+        return _state['owner']
+
+
+def is_leader() -> bool:
+    get_owner()
+    with _lock:
+        return time.monotonic() < _state['leader_until']
+
+
+def renew_lease() -> bool:
+    """
+    Take or renew the scheduler leader lease. Every worker calls it on a heartbeat, so when the leader dies,
+    another one takes over once the lease has expired.
+
+    This worker stops acting as leader LEADER_RENEW seconds before its lease expires, so two workers never
+    run jobs at the same time, even if a renewal is late.
+    """
+    owner = get_owner()
+    started = time.monotonic()
+    try:
+        acquired = job_sql.acquire_lock(LEADER_LOCK, owner, LEADER_LEASE)
+    except Exception as e:
+        roxywi_common.logging_without_user(f'Cannot renew the scheduler leader lease: {e}', 'error')
+        return is_leader()
+    with _lock:
+        was_leader = _state['leader_until'] > started
+        _state['leader_until'] = started + LEADER_LEASE - LEADER_RENEW if acquired else 0.0
+    if acquired and not was_leader:
+        roxywi_common.logging_without_user(f'{owner} is the scheduler leader now', 'info')
+    elif was_leader and not acquired:
+        roxywi_common.logging_without_user(f'{owner} has lost the scheduler leader lease', 'warning')
+    return acquired
+
+
+def release_lease() -> None:
+    if not is_leader():
+        return
+    with _lock:
+        _state['leader_until'] = 0.0
+    try:
+        job_sql.release_lock(LEADER_LOCK, get_owner())
+    except Exception:
+        pass
+
+
+def run_job(job_id: str, func) -> None:
+    """
+    Run the job and observe its duration and outcome, failed and slow runs are also recorded in job_run.
+    """
+    started_at = datetime.now()
+    started = time.perf_counter()
+    status = 'ok'
+    error = None
+    try:
+        func()
+    except Exception as e:
+        status = 'error'
+        error = str(e)
+        print(f'error: job {job_id}: {e}')
+    duration = time.perf_counter() - started
+    app_metrics.observe_job(job_id, status, duration)
+    if status == 'ok' and duration < JOB_RUN_SLOW:
+        return
+    try:
+        job_sql.insert_job_run(job_id, get_owner(), started_at, round(duration, 3), status, error)
+    except Exception as e:
+        print(f'error: cannot record the run of job {job_id}: {e}')
+
+
+def job(job_id: str, leader_only: bool = True):
+    """
+    Make a scheduler function a recorded job that runs in the app context.
+
+    Jobs that change shared state run only on the scheduler leader. Jobs that work on the local process
+    or host, like caches or files, pass leader_only=False and run on every worker.
+    Call the job with force=True to run it on this worker, leader or not.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(force: bool = False):
+            if leader_only and not force and not is_leader():
+                return
+            with scheduler.app.app_context():
+                run_job(job_id, func)
+        return wrapper
+    return decorator
+
+
+atexit.register(release_lease)
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import fcntl
+
+import app.modules.db.roxy as roxy_sql
+import app.modules.roxywi.roxy as roxywi_mod
+import app.modules.server.server as server_mod
+import app.modules.common.metrics as app_metrics
+import app.modules.roxy_wi_tools as roxy_wi_tools
+
+get_config = roxy_wi_tools.GetConfigVar()
+
+# The status of the RMON services is refreshed by a job this often, page renders only read it, in seconds
+SERVICE_STATUS_TTL = 10
+# A cache older than this means the job is not running, the request refreshes it itself
+SERVICE_STATUS_MAX_AGE = 60
+# Services shown by the views even when they are not in the tools table
+DEFAULT_SERVICES = ('rmon-server',)
+# The statuses are kept in a file, so all the workers of the host share them and only one of them queries the services
+SERVICE_STATUS_FILE = 'service_status.json'
+
+
+def _cache_path() -> str:
+    return os.path.join(get_config.get_config_var('main', 'lib_path'), SERVICE_STATUS_FILE)
+
+
+def _query_statuses(services: list[str]) -> dict[str, str]:
+    """
+    Get the status of all the services with one command.
+    """
+    if not services:
+        return {}
+    if roxywi_mod.is_docker():
+        output, stderr = server_mod.subprocess_execute('sudo supervisorctl status')
+        found = {}
+        for line in output:
+            fields = line.split()
+            if len(fields) > 1:
+                found[fields[0]] = fields[1]
+        return {service: found.get(service, 'ERROR') for service in services}
+
+    # systemctl prints one state per unit, in the order of the units
+    output, stderr = server_mod.subprocess_execute(f'systemctl is-active {" ".join(services)}')
+    statuses = dict(zip(services, output))
+    return {service: statuses.get(service, 'unknown') for service in services}
+
+
+def _read_cache() -> tuple[dict[str, str], float]:
+    """
+    Return the shared ({service: status}, refreshed_at), an empty cache when there is no file or it is broken.
+    """
+    try:
+        with open(_cache_path()) as f:
+            cache = json.load(f)
+        return cache['statuses'], cache['refreshed_at']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, 0.0
+
+
+def _write_cache(statuses: dict[str, str]) -> None:
+    path = _cache_path()
+    tmp_path = f'{path}.{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump({'statuses': statuses, 'refreshed_at': time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _is_fresh(refreshed_at: float, max_age: float) -> bool:
+    return 0 <= time.time() - refreshed_at < max_age
+
+
+def refresh(force: bool = True) -> dict[str, str]:
+    """
+    Query the status of the RMON tools and of DEFAULT_SERVICES and save it in the shared cache.
+
+    Only one worker queries the services at a time. Without force, a cache that another worker refreshed
+    less than SERVICE_STATUS_TTL ago is returned as is.
+    """
+    with open(f'{_cache_path()}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        statuses, refreshed_at = _read_cache()
+        if not force and statuses and _is_fresh(refreshed_at, SERVICE_STATUS_TTL):
+            return statuses
+        services = list(dict.fromkeys([*DEFAULT_SERVICES, *roxy_sql.get_all_tools()]))
+        statuses = _query_statuses(services)
+        _write_cache(statuses)
+        return statuses
+
+
+def get_statuses() -> dict[str, str]:
+    """
+    Return the cached {service: status} of the RMON services, refreshing it only when the job did not.
+    """
+    statuses, refreshed_at = _read_cache()
+    if statuses and _is_fresh(refreshed_at, SERVICE_STATUS_MAX_AGE):
+        app_metrics.count_cache_lookup('service_status', True)
+        return statuses
+    app_metrics.count_cache_lookup('service_status', False)
+    return refresh(force=False)
+
+
+def get_status(service: str) -> str:
+    statuses = get_statuses()
+    if service not in statuses:
+        statuses.update(_query_statuses([service]))
+    return statuses[service]
+
+
+def invalidate() -> None:
+    """
+    Make the next read query the services again, after one of them was started or stopped.
+    """
+    try:
+        os.remove(_cache_path())
+    except FileNotFoundError:
+        pass
@@ -1,10 +1,7 @@
-import json
 from keyword import kwlist
 from typing import Union, Optional
 
-import pytz
-import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import render_template, abort
 
 import app.modules.db.sql as sql
@@ -12,11 +9,16 @@ import app.modules.db.smon as smon_sql
 import app.modules.common.common as common
 import app.modules.server.server as server_mod
 import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_rollup as smon_rollup
+import app.modules.tools.status_page_cache as status_page_cache
+import app.modules.tools.victoria_metrics as victoria_metrics
 import app.modules.roxywi.common as roxywi_common
 from app.modules.roxywi.exception import RoxywiCheckLimits
 from app.modules.roxywi.class_models import HttpCheckRequest, DnsCheckRequest, PingCheckRequest, TcpCheckRequest, \
     SmtpCheckRequest, RabbitCheckRequest, CheckMetricsQuery
 
+CHECKS_LIMITS = {'free': 10, 'home': 30, 'enterprise': 100}
+
 
 def create_check(
         json_data, group_id, check_type, multi_check_id: int, agent_id: int, region_id: int = None, country_id: int = None
@@ -140,7 +142,7 @@ def create_tcp_check(data: TcpCheckRequest, last_id: int) -> Optional[tuple[dict
         return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot create TCP check')
 
 
-def update_smon(smon_id, json_data) -> None:
+def update_smon(smon_id, json_data, delete_from_agent: bool = True) -> None:
     try:
         kwargs = {
             'enabled': json_data.enabled,
@@ -157,12 +159,13 @@ def update_smon(smon_id, json_data) -> None:
     except Exception as e:
         raise Exception(f'wrong data: {e}')
 
-    try:
-        agent_id_old = smon_sql.get_agent_id_by_check_id(smon_id)
-        agent_ip = smon_sql.get_agent_ip_by_id(agent_id_old)
-        smon_agent.delete_check(agent_id_old, agent_ip, smon_id)
-    except Exception:
-        pass
+    if delete_from_agent:
+        try:
+            agent_id_old = smon_sql.get_agent_id_by_check_id(smon_id)
+            agent_ip = smon_sql.get_agent_ip_by_id(agent_id_old)
+            smon_agent.delete_check(agent_id_old, agent_ip, smon_id)
+        except Exception:
+            pass
 
     try:
         smon_sql.update_check(smon_id, **kwargs)
@@ -170,11 +173,49 @@ def update_smon(smon_id, json_data) -> None:
         raise Exception(f'here: {e}')
 
 
-def disable_multi_check(multi_check_id: int, group_id: int) -> None:
-    checks = smon_sql.select_multi_check(multi_check_id, group_id)
+def resend_check(smon_id: int, data, agent_id: int) -> None:
+    agent_ip = smon_sql.get_agent_ip_by_id(agent_id)
+    smon_agent.delete_check(agent_id, agent_ip, smon_id)
+    send_new_check(smon_id, data, agent_id)
+
+
+def delete_checks_from_agents(checks) -> None:
+    calls = [(check.agent_id_id, delete_check_from_agent, (check.id,)) for check in checks]
+    results = smon_agent.run_on_agents(calls)
+    smon_agent.raise_for_agent_errors(results, 'Cannot delete checks from agents')
+
+
+def disable_checks(checks) -> list[dict]:
+    """
+    Disable the checks with one update and remove them from their agents with one batched call per agent.
+
+    Returns the run_on_agents() results of the removals.
+    """
+    smon_sql.disable_checks([check.id for check in checks])
+    agent_checks = {}
     for check in checks:
-        delete_check_from_agent(check.id)
-    smon_sql.disable_check(multi_check_id)
+        if check.agent_id_id:
+            agent_checks.setdefault(check.agent_id_id, []).append(check.id)
+    return smon_agent.run_on_agents(
+        [(agent_id, smon_agent.delete_checks, (agent_id, check_ids)) for agent_id, check_ids in agent_checks.items()]
+    )
+
+
+def disable_expired_checks() -> int:
+    """
+    Disable every enabled check whose multi-check has expired, no matter how late the job runs.
+
+    Agents that could not be reached drop the checks on their next sync, as the checks are disabled already.
+    Returns the number of disabled checks.
+    """
+    checks = smon_sql.select_expired_checks(datetime.now())
+    if not checks:
+        return 0
+    for result in disable_checks(checks):
+        if result['error']:
+            roxywi_common.logging_without_user(f'Cannot delete expired checks from agent {result["agent_id"]}: {result["error"]}', 'error')
+    roxywi_common.logging_without_user(f'{len(checks)} expired checks have been disabled', 'info')
+    return len(checks)
 
 
 def delete_check_from_agent(smon_id: int) -> None:
@@ -195,100 +236,146 @@ def delete_multi_check(smon_id: int, user_group: int):
         multi_check = smon_sql.select_multi_check(smon_id, user_group)
     except Exception as e:
         raise e
-    for m in multi_check:
-        delete_check_from_agent(m.id)
+    delete_checks_from_agents(multi_check)
     try:
         smon_sql.delete_multi_check(smon_id, user_group)
     except Exception as e:
         raise e
 
 
+def get_metrics_range(query: CheckMetricsQuery) -> tuple[datetime, datetime]:
+    """
+    Return the start and the end of the metrics query, the last 30 minutes up to the end by default.
+    """
+    # Defaults of start and end are computed once at import, so only the passed ones are used
+    end = datetime.now()
+    if 'end' in query.model_fields_set:
+        end = datetime.strptime(query.end[:19], '%Y-%m-%dT%H:%M:%S')
+    start = end - timedelta(minutes=30)
+    if 'start' in query.model_fields_set:
+        start = datetime.strptime(query.start[:19], '%Y-%m-%dT%H:%M:%S')
+    return start, end
+
+
 def get_metrics(check_id: int, query: CheckMetricsQuery) -> dict:
     vm_select = sql.get_setting('victoria_metrics_select')
     rmon_name = sql.get_setting('rmon_name')
-    req = f'{vm_select}/query_range?query={rmon_name}_metrics{{check_id="{check_id}"}}&step={query.step}&start={query.start}&end={query.end}'
-    response = requests.get(req)
+    start, end = get_metrics_range(query)
+    step, result = victoria_metrics.query_range(
+        vm_select, f'{rmon_name}_metrics{{check_id="{check_id}"}}', start.timestamp(), end.timestamp(),
+        victoria_metrics.parse_step(query.step)
+    )
+    return result
+
 
-    return json.loads(response.text)
+def _join_points(points: list) -> str:
+    return ','.join(str(point) for point in points) + ',' if points else ''
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
 
 def history_metrics_from_vm(check_id: int, query: CheckMetricsQuery) -> dict:
+    columns = victoria_metrics.series_columns(get_metrics(check_id, query))
+    if query.format != 'string':
+        timestamps = sorted({timestamp for series_timestamps, _values in columns.values() for timestamp in series_timestamps})
+        series = {}
+        for metric, (series_timestamps, values) in columns.items():
+            points = dict(zip(series_timestamps, values))
+            series[metric] = [_to_float(points.get(timestamp)) for timestamp in timestamps]
+        return common.metrics_to_columns(timestamps, series, query.format)
+
     metrics = {'chartData': {}}
-    metrics['chartData']['labels'] = ''
-    metrics_from_vm = get_metrics(check_id, query)
-    rmon_name = sql.get_setting('rmon_name')
-    if metrics_from_vm['status'] == 'error':
-        raise Exception(metrics_from_vm['error'])
-    for metric in metrics_from_vm['data']['result']:
-        labels = ''
-
-        if metric['metric']['__name__'] == f'{rmon_name}_metrics':
-            metrics['chartData'][metric['metric']['metric']] = ''
-            for value in metric['values']:
-                date_time = datetime.fromtimestamp(value[0], tz=pytz.UTC).strftime('%Y-%m-%d %H:%M:%S%z')
-                labels += f'{date_time},'
-                metrics['chartData'][metric['metric']['metric']] += f'{value[1]},'
-        metrics['chartData']['labels'] = labels
+    timestamps = max((series_timestamps for series_timestamps, _values in columns.values()), key=len, default=[])
+    metrics['chartData']['labels'] = _join_points(victoria_metrics.format_timestamps(timestamps))
+    for metric, (_timestamps, values) in columns.items():
+        metrics['chartData'][metric] = _join_points(values)
     return metrics
 
 
-def history_metrics(server_id: int, check_type_id: int) -> dict:
-    metric = smon_sql.select_smon_history(server_id)
+# Series of the raw history metrics and their SmonHistory fields
+HISTORY_METRIC_FIELDS = {
+    'response_time': 'response_time',
+    'namelookup': 'name_lookup',
+    'connect': 'connect',
+    'appconnect': 'app_connect',
+    'pretransfer': 'pre_transfer',
+    'redirect': 'redirect',
+    'starttransfer': 'start_transfer',
+    'download': 'download',
+}
+# Curl reports these as -1 when there was no redirect or transfer
+_NOT_NEGATIVE_METRICS = ('redirect', 'starttransfer')
+
+
+def _history_metric_names(check_type_id: int) -> list[str]:
+    if check_type_id == 2:
+        return list(HISTORY_METRIC_FIELDS)
+    if check_type_id == 3:
+        return ['response_time', 'namelookup', 'connect', 'appconnect']
+    return ['response_time']
+
+
+def _history_point(row, name: str, numeric: bool):
+    value = getattr(row, HISTORY_METRIC_FIELDS[name])
+    if name in _NOT_NEGATIVE_METRICS:
+        number = _to_float(value)
+        if number is None or number <= 0:
+            return 0
+        return number if numeric else value
+    return _to_float(value) if numeric else value
+
+
+def history_metrics(server_id: int, check_type_id: int, fmt: str = 'string') -> dict:
+    rows = list(smon_sql.select_smon_history(server_id))[::-1]
+    names = _history_metric_names(check_type_id)
+
+    if fmt != 'string':
+        return common.metrics_to_columns(
+            [common.to_epoch(row.date) for row in rows],
+            {name: [_history_point(row, name, True) for row in rows] for name in names},
+            fmt
+        )
+
+    time_zone = sql.get_setting('time_zone')
     metrics = {'chartData': {}}
-    metrics['chartData']['labels'] = {}
-    labels = ''
-    response_time = ''
-    name_lookup = ''
-    connect = ''
-    app_connect = ''
-    pre_transfer = ''
-    redirect = ''
-    start_transfer = ''
-    download = ''
-
-    for i in reversed(metric):
-        date_time = common.get_time_zoned_date(i.date, '%H:%M:%S')
-        labels += f'{date_time},'
-        response_time += f'{i.response_time},'
-        if check_type_id in (2, 3):
-            name_lookup += f'{i.name_lookup},'
-            connect += f'{i.connect},'
-            app_connect += f'{i.app_connect},'
-            if check_type_id == 2:
-                pre_transfer += f'{i.pre_transfer},'
-                try:
-                    if float(i.redirect) <= 0:
-                        redirect += '0,'
-                    else:
-                        redirect += f'{i.redirect},'
-                except Exception:
-                    redirect += '0,'
-                try:
-                    if float(i.start_transfer) <= 0:
-                        start_transfer += '0,'
-                    else:
-                        start_transfer += f'{i.start_transfer},'
-                except Exception:
-                    start_transfer += '0,'
-                download += f'{i.download},'
-
-    metrics['chartData']['labels'] = labels
-    metrics['chartData']['response_time'] = response_time
-    if check_type_id in (2, 3):
-        metrics['chartData']['namelookup'] = name_lookup
-        metrics['chartData']['connect'] = connect
-        metrics['chartData']['appconnect'] = app_connect
-        if check_type_id == 2:
-            metrics['chartData']['pretransfer'] = pre_transfer
-            metrics['chartData']['redirect'] = redirect
-            metrics['chartData']['starttransfer'] = start_transfer
-            metrics['chartData']['download'] = download
-
+    metrics['chartData']['labels'] = _join_points([common.get_time_zoned_date(row.date, '%H:%M:%S', time_zone) for row in rows])
+    for name in names:
+        metrics['chartData'][name] = _join_points([_history_point(row, name, False) for row in rows])
     return metrics
 
 
+def _get_history_since() -> datetime:
+    keep_days = sql.get_setting('smon_keep_history_raw_range') or 1
+    return datetime.now() - timedelta(days=keep_days)
+
+
+def _get_check_totals(smon_id: int) -> dict:
+    return smon_rollup.get_check_totals(smon_id, _get_history_since())
+
+
+def get_checks_uptime_and_avg_resp_time(smon_ids: list) -> dict:
+    """
+    Return {smon_id: {'uptime', 'average_response_time'}} for all checks with a fixed number of queries.
+    """
+    stats = {}
+    for smon_id, totals in smon_rollup.get_checks_totals(smon_ids, _get_history_since()).items():
+        if totals['total']:
+            uptime = round(totals['up'] * 100 / totals['total'], 2)
+            average_response_time = round(totals['resp_sum'] / totals['total'], 2)
+        else:
+            uptime = 0
+            average_response_time = 0
+        stats[smon_id] = {'uptime': float(uptime), 'average_response_time': average_response_time}
+    return stats
+
+
 def check_uptime(smon_id: int) -> float:
-    count_checks = smon_sql.get_smon_history_count_checks(smon_id)
+    count_checks = _get_check_totals(smon_id)
     try:
         uptime = round(count_checks['up'] * 100 / count_checks['total'], 2)
     except Exception:
@@ -312,63 +399,65 @@ def edit_status_page(page_id: int, name: str, slug: str, desc: str, checks: list
         smon_sql.edit_status_page(page_id, name, slug, desc, styles)
     except Exception as e:
         raise e
+    finally:
+        status_page_cache.invalidate()
 
 
-def show_status_page(slug: str) -> str:
+def _build_status_page(slug: str) -> tuple[int, str]:
     page = smon_sql.get_status_page(slug)
     checks_status = {}
     if not page:
         abort(404, 'Not found status page')
 
-    checks = smon_sql.select_status_page_checks(page.id)
+    checks = smon_sql.select_status_page_smon(page.id)
+    group_names = smon_sql.get_smon_group_names(s.multi_check_id.check_group_id_id for s in checks)
+    check_stats = get_checks_uptime_and_avg_resp_time([s.id for s in checks])
+
+    for s in checks:
+        multi_check_id = s.multi_check_id
+        checks_status[s.id] = {
+            'uptime': check_stats[s.id]['uptime'], 'name': multi_check_id.name,
+            'description': multi_check_id.description,
+            'group': group_names.get(multi_check_id.check_group_id_id, 'No group'),
+            'check_type': s.check_type, 'en': s.enabled, 'multi_check_id': multi_check_id
+        }
 
-    for check in checks:
-        name = ''
-        desc = ''
-        group = ''
-        check_type = ''
-        multi_check_id = int(check.multi_check_id.id)
-        smon = smon_sql.select_one_smon_by_multi_check(multi_check_id)
-        en = ''
-        for s in smon:
-            name = s.multi_check_id.name
-            check_id = s.id
-            uptime = check_uptime(check_id)
-            desc = s.multi_check_id.description
-            check_type = s.check_type
-            en = s.enabled
-            multi_check_id = s.multi_check_id
-            if multi_check_id.check_group_id:
-                group = smon_sql.get_smon_group_by_id(multi_check_id.check_group_id).name
-            else:
-                group = 'No group'
-
-        checks_status[check_id] = {'uptime': uptime, 'name': name, 'description': desc, 'group': group,
-                                   'check_type': check_type, 'en': en, 'multi_check_id': multi_check_id}
-
-    return render_template('smon/status_page.html', page=page, checks_status=checks_status)
-
-
-def avg_status_page_status(page_id: int) -> str:
+    return page.id, render_template('smon/status_page.html', page=page, checks_status=checks_status)
+
+
+def show_status_page(slug: str):
+    snapshot = status_page_cache.get_snapshot(('html', slug), lambda: _build_status_page(slug))
+    return status_page_cache.make_snapshot_response(snapshot, 'text/html')
+
+
+def _build_avg_status_page_status(page_id: int) -> tuple[int, str]:
     checks = smon_sql.select_status_page_checks(page_id)
 
     for check in checks:
-        check_id = int(check.multi_check_id.id)
+        check_id = int(check.multi_check_id_id)
         if not smon_sql.get_last_smon_status_by_multi_check(check_id):
-            return '0'
+            return page_id, '0'
+
+    return page_id, '1'
 
-    return '1'
+
+def avg_status_page_status(page_id: int):
+    snapshot = status_page_cache.get_snapshot(('avg', page_id), lambda: _build_avg_status_page_status(page_id))
+    return status_page_cache.make_snapshot_response(snapshot, 'text/html')
+
+
+def get_checks_limit() -> tuple[str, Union[int, None]]:
+    """
+    Return the plan of the subscription and how many checks it allows, None for no limit.
+    """
+    user_plan = roxywi_common.return_user_subscription()['user_plan']
+    return user_plan, CHECKS_LIMITS.get(user_plan)
 
 
 def check_checks_limit():
-    user_subscription = roxywi_common.return_user_subscription()
-    count_checks = smon_sql.count_checks()
-    if user_subscription['user_plan'] == 'free' and count_checks >= 10:
-        raise RoxywiCheckLimits('You have reached limit for Free plan')
-    elif user_subscription['user_plan'] == 'home' and count_checks >= 30:
-        raise RoxywiCheckLimits('You have reached limit for Home plan')
-    elif user_subscription['user_plan'] == 'enterprise' and count_checks >= 100:
-        raise RoxywiCheckLimits('You have reached limit for Enterprise plan')
+    user_plan, limit = get_checks_limit()
+    if limit is not None and smon_sql.count_checks() >= limit:
+        raise RoxywiCheckLimits(f'You have reached limit for {user_plan.capitalize()} plan')
 
 
 def get_check_id_by_name(name: str) -> int:
@@ -406,7 +495,10 @@ def get_average_response_time(check_id: int, check_type_id: int) -> float:
     - float: The average response time in seconds.
     """
     try:
-        return round(smon_sql.get_avg_resp_time(check_id, check_type_id), 2)
+        totals = _get_check_totals(check_id)
+        if not totals['total']:
+            return 0
+        return round(totals['resp_sum'] / totals['total'], 2)
     except Exception as e:
         roxywi_common.logger(f'Failed to get avg resp time: {e}', 'error')
         return 0
@@ -1,16 +1,38 @@
+import re
+import json
+import time
 import uuid
-from typing import Union
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Union, Callable
+from urllib.parse import urlsplit
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
 
 import app.modules.db.sql as sql
 import app.modules.db.smon as smon_sql
 import app.modules.db.server as server_sql
 import app.modules.roxywi.common as roxywi_common
+import app.modules.common.metrics as app_metrics
 from app.modules.service.installation import run_ansible_thread
 from app.modules.roxywi.class_models import RmonAgent
 from app.modules.roxywi.exception import RoxywiResourceNotFound
+from app.modules.db.db_model import conn
+
+SYNC_CHUNK_SIZE = 500
+AGENT_POOL_WORKERS = 16
+AGENT_CONNECT_TIMEOUT = 3
+AGENT_FAN_OUT_DEADLINE = 60
+AGENT_SESSION_TTL = 300
+
+_agent_sessions: dict[int, tuple[requests.Session, int, float]] = {}
+_agent_sessions_lock = threading.Lock()
+_agent_executor: Union[ThreadPoolExecutor, None] = None
+_ID_PATTERN = re.compile(r'/\d+')
 
 
 def generate_agent_inv(server_ip: str, action: str, agent_uuid: uuid, agent_port=5101) -> object:
@@ -82,6 +104,7 @@ def delete_agent(agent_id: int):
     except Exception as e:
         raise e
     agent_uuid = ''
+    close_agent_session(agent_id)
     try:
         inv, server_ips = generate_agent_inv(server_ip, 'uninstall', agent_uuid)
         return run_ansible_thread(inv, server_ips, 'rmon_agent', 'Agent', 'delete')
@@ -96,6 +119,7 @@ def update_agent(agent_id: int, data: RmonAgent):
         smon_sql.update_agent(agent_id, **json_data)
     except Exception as e:
         raise e
+    close_agent_session(agent_id)
 
     if data.reconfigure:
         return reconfigure_agent(agent_id)
@@ -122,11 +146,109 @@ def get_agent_headers(agent_id: int) -> dict:
     return {'Agent-UUID': str(agent_uuid), 'Content-Type': 'application/json'}
 
 
-def send_get_request_to_agent(agent_id: int, server_ip: str, api_path: str) -> bytes:
+class AgentSession(requests.Session):
+    """
+    Session of one agent that records the latency and the errors of its requests per endpoint.
+    """
+
+    def __init__(self, agent_id: int):
+        super().__init__()
+        self.agent_id = agent_id
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = f'{method.upper()} {_ID_PATTERN.sub("/<id>", urlsplit(url).path)}'
+        started = time.perf_counter()
+        error = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            app_metrics.observe_agent_request(self.agent_id, endpoint, time.perf_counter() - started, error)
+
+
+def get_agent_session(agent_id: int) -> tuple[requests.Session, int]:
+    """
+    Return a keep-alive session with the agent headers already set, and the agent port.
+    Sessions are shared between requests and threads. They are dropped when the agent is changed or deleted
+    and refreshed after AGENT_SESSION_TTL, so other workers pick up agent changes too.
+    """
+    with _agent_sessions_lock:
+        agent_session = _agent_sessions.get(agent_id)
+    if agent_session and time.monotonic() - agent_session[2] < AGENT_SESSION_TTL:
+        return agent_session[0], agent_session[1]
+
     headers = get_agent_headers(agent_id)
     agent = smon_sql.get_agent_data(agent_id)
+    session = AgentSession(agent_id)
+    session.headers.update(headers)
+    session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=AGENT_POOL_WORKERS))
+    with _agent_sessions_lock:
+        _agent_sessions[agent_id] = (session, agent.port, time.monotonic())
+    return session, agent.port
+
+
+def close_agent_session(agent_id: int) -> None:
+    with _agent_sessions_lock:
+        agent_session = _agent_sessions.pop(agent_id, None)
+    if agent_session:
+        agent_session[0].close()
+
+
+def _get_agent_executor() -> ThreadPoolExecutor:
+    global _agent_executor
+    with _agent_sessions_lock:
+        if _agent_executor is None:
+            _agent_executor = ThreadPoolExecutor(max_workers=AGENT_POOL_WORKERS, thread_name_prefix='rmon-agent')
+    return _agent_executor
+
+
+def _run_agent_call(func: Callable, args: tuple):
+    try:
+        return func(*args)
+    finally:
+        # Worker threads keep their own DB connection, give it back like teardown_request does
+        if not conn.is_closed():
+            conn.close()
+
+
+def run_on_agents(calls: list[tuple[int, Callable, tuple]], deadline: int = AGENT_FAN_OUT_DEADLINE) -> list[dict]:
+    """
+    Run agent calls concurrently on the shared worker pool.
+
+    Every call is a tuple of (agent_id, func, args) and runs with a copy of the caller's Flask context.
+    Calls that did not finish before the deadline are reported as errors.
+    Returns one {'agent_id', 'result', 'error'} dict per call, in the order of the calls.
+    """
+    if not calls:
+        return []
+    executor = _get_agent_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_agent_call, func, args) for _, func, args in calls
+    ]
+    done, _ = wait(futures, timeout=deadline)
+    results = []
+    for (agent_id, _, _), future in zip(calls, futures):
+        if future not in done:
+            future.cancel()
+            results.append({'agent_id': agent_id, 'result': None, 'error': f'deadline of {deadline}s exceeded'})
+        elif future.exception() is not None:
+            results.append({'agent_id': agent_id, 'result': None, 'error': str(future.exception())})
+        else:
+            results.append({'agent_id': agent_id, 'result': future.result(), 'error': None})
+    return results
+
+
+def raise_for_agent_errors(results: list[dict], message: str) -> None:
+    errors = [f'agent {result["agent_id"]}: {result["error"]}' for result in results if result['error']]
+    if errors:
+        raise Exception(f'{message}: {"; ".join(errors)}')
+
+
+def send_get_request_to_agent(agent_id: int, server_ip: str, api_path: str) -> bytes:
+    session, port = get_agent_session(agent_id)
     try:
-        req = requests.get(f'http://{server_ip}:{agent.port}/{api_path}', headers=headers, timeout=5)
+        req = session.get(f'http://{server_ip}:{port}/{api_path}', timeout=(AGENT_CONNECT_TIMEOUT, 5))
         return req.content
     except Exception as e:
         roxywi_common.logger(f'Cannot get agent status: {e}', 'error')
@@ -134,20 +256,18 @@ def send_get_request_to_agent(agent_id: int, server_ip: str, api_path: str) -> b
 
 
 def send_post_request_to_agent(agent_id: int, server_ip: str, api_path: str, json_data: object) -> Response:
-    headers = get_agent_headers(agent_id)
-    agent = smon_sql.get_agent_data(agent_id)
+    session, port = get_agent_session(agent_id)
     try:
-        req = requests.post(f'http://{server_ip}:{agent.port}/{api_path}', headers=headers, json=json_data, timeout=15)
+        req = session.post(f'http://{server_ip}:{port}/{api_path}', json=json_data, timeout=(AGENT_CONNECT_TIMEOUT, 15))
         return req
     except Exception as e:
         raise e
 
 
 def delete_check(agent_id: int, server_ip: str, check_id: int) -> None:
-    headers = get_agent_headers(agent_id)
-    agent = smon_sql.get_agent_data(agent_id)
+    session, port = get_agent_session(agent_id)
     try:
-        requests.delete(f'http://{server_ip}:{agent.port}/check/{check_id}', headers=headers, timeout=5)
+        session.delete(f'http://{server_ip}:{port}/check/{check_id}', timeout=(AGENT_CONNECT_TIMEOUT, 5))
     except requests.exceptions.HTTPError as e:
         roxywi_common.logger(f'Cannot delete check from agent: http error {e}', 'error')
     except requests.exceptions.ConnectTimeout:
@@ -158,6 +278,39 @@ def delete_check(agent_id: int, server_ip: str, check_id: int) -> None:
         raise Exception(f' Cannot delete check from Agent {server_ip}: {e}')
 
 
+def _sync_or_run(agent_id: int, action: str, fallback: Callable[[], None]) -> None:
+    """
+    Apply the changed checks to the agent as one incremental sync if it acknowledged a checks manifest,
+    otherwise, or when the sync fails, call fallback() that makes a request per check.
+    """
+    manifest = smon_sql.get_agent_manifest(agent_id)
+    if manifest is not None:
+        try:
+            sync_checks(agent_id, manifest.version)
+            return
+        except Exception as e:
+            roxywi_common.logging_without_user(
+                f'Cannot sync checks with agent {agent_id}, {action} them one by one: {e}', 'warning', extra={'agent_id': agent_id}
+            )
+    fallback()
+
+
+def _delete_checks_by_ids(agent_id: int, check_ids: list) -> None:
+    server_ip = smon_sql.get_agent_ip_by_id(agent_id)
+    for check_id in check_ids:
+        delete_check(agent_id, server_ip, check_id)
+
+
+def delete_checks(agent_id: int, check_ids: list) -> None:
+    """
+    Remove the checks from the agent in as few requests as possible.
+
+    The checks must be disabled or deleted in the database already. Agents that acknowledged a checks manifest
+    get the removals as one incremental sync, the others get a delete request per check.
+    """
+    _sync_or_run(agent_id, 'deleting', lambda: _delete_checks_by_ids(agent_id, check_ids))
+
+
 def send_check_to_agent(agent_id: int, server_ip: str, check_id: int, multi_check_id: int, request_data: dict) -> None:
     status_created = 201  # Introduced constant for clarity
     endpoint = f'check/{check_id}'  # Renamed variable for better clarity
@@ -192,172 +345,203 @@ def send_check_to_agent(agent_id: int, server_ip: str, check_id: int, multi_chec
             raise Exception(response.text)
 
 
-def send_tcp_checks(agent_id: int, server_ip: str, check_id=None) -> None:
-    if check_id:
-        checks = smon_sql.select_one_smon(check_id, 1)
-    else:
-        checks = smon_sql.select_en_smon(agent_id, 'tcp')
-    for check in checks:
-        json_data = {
-            'check_type': 'tcp',
-            'name': check.smon_id.multi_check_id.name,
-            'server_ip': check.ip,
-            'port': check.port,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout
-        }
+def _return_tcp_check_json(check) -> dict:
+    return {
+        'check_type': 'tcp',
+        'name': check.smon_id.multi_check_id.name,
+        'server_ip': check.ip,
+        'port': check.port,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout
+    }
+
+
+def _return_ping_check_json(check) -> dict:
+    return {
+        'check_type': 'ping',
+        'name': check.smon_id.multi_check_id.name,
+        'server_ip': check.ip,
+        'packet_size': check.packet_size,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout,
+        'count_packets': check.count_packets,
+        'use_kernel_timestamp': check.use_kernel_timestamp
+    }
+
+
+def _return_dns_check_json(check) -> dict:
+    return {
+        'check_type': 'dns',
+        'name': check.smon_id.multi_check_id.name,
+        'server_ip': check.ip,
+        'port': check.port,
+        'record_type': check.record_type,
+        'resolver': check.resolver,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout
+    }
+
+
+def _return_http_check_json(check) -> dict:
+    body = check.body
+    if body:
         try:
-            send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
+            body = check.body.replace("'", "")
         except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send TCP check: {e}',
-                                               'error',
-                                               extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
-                                               )
+            roxywi_common.logger(f'Cannot parse body for check {check.id}: {e}', 'error', additional_extra={'check_id': check.id})
+    return {
+        'check_type': 'http',
+        'name': check.smon_id.multi_check_id.name,
+        'url': check.url,
+        'http_method': check.method,
+        'body': body,
+        'body_json': check.body_json,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout,
+        'accepted_status_codes': check.accepted_status_codes,
+        'ignore_ssl_error': check.ignore_ssl_error,
+        'body_req': check.body_req,
+        'header_req': check.header_req,
+        'redirects': check.redirects,
+        'auth': check.auth,
+        'proxy': check.proxy,
+        'headers_response': check.headers_response,
+        'http_version': check.http_version,
+        'accept_cookies': check.accept_cookies,
+        'resole_to_ip': check.resole_to_ip,
+    }
 
 
-def send_ping_checks(agent_id: int, server_ip: str, check_id=None) -> None:
+def _return_smtp_check_json(check) -> dict:
+    return {
+        'check_type': 'smtp',
+        'name': check.smon_id.multi_check_id.name,
+        'server': check.ip,
+        'port': check.port,
+        'username': check.username,
+        'password': check.password,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout,
+        'ignore_ssl_error': check.ignore_ssl_error,
+    }
+
+
+def _return_rabbit_check_json(check) -> dict:
+    return {
+        'check_type': 'rabbitmq',
+        'name': check.smon_id.multi_check_id.name,
+        'server': check.ip,
+        'port': check.port,
+        'username': check.username,
+        'password': check.password,
+        'vhost': check.vhost,
+        'interval': check.interval,
+        'timeout': check.smon_id.check_timeout,
+        'ignore_ssl_error': check.ignore_ssl_error,
+    }
+
+
+CHECK_JSON_BUILDERS = {
+    'tcp': _return_tcp_check_json,
+    'ping': _return_ping_check_json,
+    'dns': _return_dns_check_json,
+    'http': _return_http_check_json,
+    'smtp': _return_smtp_check_json,
+    'rabbitmq': _return_rabbit_check_json,
+}
+
+
+def _send_checks_by_type(agent_id: int, server_ip: str, check_type: str, check_type_id: int, check_name: str, check_id=None) -> None:
     if check_id:
-        checks = smon_sql.select_one_smon(check_id, 4)
+        checks = smon_sql.select_one_smon(check_id, check_type_id)
     else:
-        checks = smon_sql.select_en_smon(agent_id, 'ping')
+        checks = smon_sql.select_en_smon(agent_id, check_type)
     for check in checks:
-        json_data = {
-            'check_type': 'ping',
-            'name': check.smon_id.multi_check_id.name,
-            'server_ip': check.ip,
-            'packet_size': check.packet_size,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout,
-            'count_packets': check.count_packets,
-            'use_kernel_timestamp': check.use_kernel_timestamp
-        }
+        json_data = CHECK_JSON_BUILDERS[check_type](check)
         try:
             send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
         except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send Ping check: {e}',
+            roxywi_common.logging_without_user(f'Cannot send {check_name} check: {e}',
                                                'error',
                                                extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
                                                )
 
 
+def send_tcp_checks(agent_id: int, server_ip: str, check_id=None) -> None:
+    _send_checks_by_type(agent_id, server_ip, 'tcp', 1, 'TCP', check_id)
+
+
+def send_ping_checks(agent_id: int, server_ip: str, check_id=None) -> None:
+    _send_checks_by_type(agent_id, server_ip, 'ping', 4, 'Ping', check_id)
+
+
 def send_dns_checks(agent_id: int, server_ip: str, check_id=None) -> None:
-    if check_id:
-        checks = smon_sql.select_one_smon(check_id, 5)
-    else:
-        checks = smon_sql.select_en_smon(agent_id, 'dns')
-    for check in checks:
-        json_data = {
-            'check_type': 'dns',
-            'name': check.smon_id.multi_check_id.name,
-            'server_ip': check.ip,
-            'port': check.port,
-            'record_type': check.record_type,
-            'resolver': check.resolver,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout
-        }
-        try:
-            send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
-        except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send DNS check: {e}',
-                                               'error',
-                                               extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
-                                               )
+    _send_checks_by_type(agent_id, server_ip, 'dns', 5, 'DNS', check_id)
 
 
 def send_http_checks(agent_id: int, server_ip: str, check_id=None) -> None:
-    if check_id:
-        checks = smon_sql.select_one_smon(check_id, 2)
-    else:
-        checks = smon_sql.select_en_smon(agent_id, 'http')
-    for check in checks:
-        body = check.body
-        if body:
-            try:
-                body = check.body.replace("'", "")
-            except Exception as e:
-                roxywi_common.logger(f'Cannot parse body for check {check.id}: {e}', 'error', additional_extra={'check_id': check.id})
-        json_data = {
-            'check_type': 'http',
-            'name': check.smon_id.multi_check_id.name,
-            'url': check.url,
-            'http_method': check.method,
-            'body': body,
-            'body_json': check.body_json,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout,
-            'accepted_status_codes': check.accepted_status_codes,
-            'ignore_ssl_error': check.ignore_ssl_error,
-            'body_req': check.body_req,
-            'header_req': check.header_req,
-            'redirects': check.redirects,
-            'auth': check.auth,
-            'proxy': check.proxy,
-            'headers_response': check.headers_response,
-            'http_version': check.http_version,
-            'accept_cookies': check.accept_cookies,
-            'resole_to_ip': check.resole_to_ip,
-        }
-        try:
-            send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
-        except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send HTTP check: {e}',
-                                               'error',
-                                               extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
-                                               )
+    _send_checks_by_type(agent_id, server_ip, 'http', 2, 'HTTP', check_id)
 
 
 def send_smtp_checks(agent_id: int, server_ip: str, check_id=None) -> None:
-    if check_id:
-        checks = smon_sql.select_one_smon(check_id, 3)
-    else:
-        checks = smon_sql.select_en_smon(agent_id, 'smtp')
-    for check in checks:
-        json_data = {
-            'check_type': 'smtp',
-            'name': check.smon_id.multi_check_id.name,
-            'server': check.ip,
-            'port': check.port,
-            'username': check.username,
-            'password': check.password,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout,
-            'ignore_ssl_error': check.ignore_ssl_error,
-        }
-        try:
-            send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
-        except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send SMTP check: {e}',
-                                               'error',
-                                               extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
-                                               )
+    _send_checks_by_type(agent_id, server_ip, 'smtp', 3, 'SMTP', check_id)
 
 
 def send_rabbit_checks(agent_id: int, server_ip: str, check_id=None) -> None:
-    if check_id:
-        checks = smon_sql.select_one_smon(check_id, 6)
-    else:
-        checks = smon_sql.select_en_smon(agent_id, 'rabbitmq')
-    for check in checks:
-        json_data = {
-            'check_type': 'rabbitmq',
-            'name': check.smon_id.multi_check_id.name,
-            'server': check.ip,
-            'port': check.port,
-            'username': check.username,
-            'password': check.password,
-            'vhost': check.vhost,
-            'interval': check.interval,
-            'timeout': check.smon_id.check_timeout,
-            'ignore_ssl_error': check.ignore_ssl_error,
-        }
-        try:
-            send_check_to_agent(agent_id, server_ip, check.smon_id, check.smon_id.multi_check_id, json_data)
-        except Exception as e:
-            roxywi_common.logging_without_user(f'Cannot send RabbitMQ checks: {e}',
-                                               'error',
-                                               extra={'check_id': check.id, 'agent_id': agent_id, 'multi_check_id': check.smon_id.multi_check_id}
-                                               )
+    _send_checks_by_type(agent_id, server_ip, 'rabbitmq', 6, 'RabbitMQ', check_id)
+
+
+CHECK_SENDERS = {
+    'tcp': send_tcp_checks,
+    'ping': send_ping_checks,
+    'dns': send_dns_checks,
+    'http': send_http_checks,
+    'smtp': send_smtp_checks,
+    'rabbitmq': send_rabbit_checks,
+}
+
+
+def _move_check(smon_id: int, check_type: str, old_agent: int, new_agent: int, enabled: bool = True) -> None:
+    if not enabled:
+        smon_sql.update_check_agent(smon_id, new_agent)
+        return
+    delete_check(old_agent, smon_sql.get_agent_ip_by_id(old_agent), smon_id)
+    smon_sql.update_check_agent(smon_id, new_agent)
+    CHECK_SENDERS[check_type](new_agent, smon_sql.select_server_ip_by_agent_id(new_agent), smon_id)
+
+
+def send_checks_by_ids(agent_id: int, checks: list[tuple[int, str]]) -> None:
+    """
+    Send only the given checks, as (smon_id, check_type) tuples, to the agent.
+    """
+    server_ip = smon_sql.select_server_ip_by_agent_id(agent_id)
+    for smon_id, check_type in checks:
+        CHECK_SENDERS[check_type](agent_id, server_ip, smon_id)
+
+
+def push_checks(agent_id: int, checks: list[tuple[int, str]]) -> None:
+    """
+    Send new checks, as (smon_id, check_type) tuples, to the agent in as few requests as possible.
+
+    Agents that acknowledged a checks manifest get them as one incremental sync, the others get a request per check.
+    """
+    _sync_or_run(agent_id, 'sending', lambda: send_checks_by_ids(agent_id, checks))
+
+
+def move_checks(moves: list[tuple[int, str, int, int]]) -> list[dict]:
+    """
+    Move checks between agents, only the moved checks are deleted from the old agents and sent to the new ones.
+    Disabled checks are not on any agent, only their agent is changed in the database.
+
+    Every move is a tuple of (smon_id, check_type, old_agent, new_agent). Moves run concurrently on the agent pool,
+    returns the run_on_agents() results.
+    """
+    enabled = smon_sql.select_enabled_check_ids([move[0] for move in moves]) if moves else set()
+    calls = [
+        (new_agent, _move_check, (smon_id, check_type, old_agent, new_agent, smon_id in enabled))
+        for smon_id, check_type, old_agent, new_agent in moves
+    ]
+    return run_on_agents(calls)
 
 
 def send_checks(agent_id: int) -> None:
@@ -386,3 +570,90 @@ def send_checks(agent_id: int) -> None:
         send_rabbit_checks(agent_id, server_ip)
     except Exception as e:
         roxywi_common.logger(f'Cannot send RabbitMQ checks: {e}', 'error')
+
+
+def _check_hash(json_data: dict) -> str:
+    return hashlib.sha256(json.dumps(json_data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def build_checks_manifest(agent_id: int) -> dict:
+    """
+    Serialize every enabled check of the agent into {check_id: check_json}.
+    Keys are strings, so the manifest can be stored in a JSON column as is.
+    """
+    checks = {}
+    for check_type, json_builder in CHECK_JSON_BUILDERS.items():
+        for check in smon_sql.select_en_smon(agent_id, check_type):
+            checks[str(check.smon_id.id)] = json_builder(check)
+    return checks
+
+
+def _split_sync_chunks(checks: dict, deleted: list) -> list[dict]:
+    chunks = []
+    check_ids = list(checks)
+    for i in range(0, len(check_ids), SYNC_CHUNK_SIZE):
+        chunks.append({'checks': {check_id: checks[check_id] for check_id in check_ids[i:i + SYNC_CHUNK_SIZE]}, 'deleted': []})
+    for i in range(0, len(deleted), SYNC_CHUNK_SIZE):
+        chunks.append({'checks': {}, 'deleted': deleted[i:i + SYNC_CHUNK_SIZE]})
+    # A full sync with no checks still has to reach the agent, so it can drop what it has
+    return chunks or [{'checks': {}, 'deleted': []}]
+
+
+def sync_checks(agent_id: int, agent_manifest_version: int = None) -> dict:
+    """
+    Send the agent its checks as a versioned manifest in one or a few chunked requests.
+
+    If the agent reports the same manifest version as the last one it acknowledged, only checks that were added,
+    changed or removed since then are sent. Otherwise, the whole manifest is sent and the agent must replace
+    its checks with it. Agents without the checks/sync endpoint get the per-check sync.
+    """
+    server_ip = smon_sql.select_server_ip_by_agent_id(agent_id)
+    session, port = get_agent_session(agent_id)
+    checks = build_checks_manifest(agent_id)
+    hashes = {check_id: _check_hash(json_data) for check_id, json_data in checks.items()}
+    acknowledged = smon_sql.get_agent_manifest(agent_id)
+    full = (
+        acknowledged is None
+        or agent_manifest_version is None
+        or agent_manifest_version != acknowledged.version
+    )
+
+    if full:
+        base_version = 0
+        deleted = []
+    else:
+        base_version = acknowledged.version
+        acknowledged_hashes = acknowledged.checks or {}
+        checks = {check_id: json_data for check_id, json_data in checks.items() if acknowledged_hashes.get(check_id) != hashes[check_id]}
+        deleted = [check_id for check_id in acknowledged_hashes if check_id not in hashes]
+        if not checks and not deleted:
+            return {'version': base_version, 'full': False, 'sent': 0, 'deleted': 0}
+
+    version = (acknowledged.version if acknowledged else 0) + 1
+    chunks = _split_sync_chunks(checks, deleted)
+    for number, chunk in enumerate(chunks, 1):
+        json_data = {
+            'version': version,
+            'base_version': base_version,
+            'full': full,
+            'chunk': number,
+            'chunks': len(chunks),
+            'checks': chunk['checks'],
+            'deleted': chunk['deleted'],
+        }
+        response = session.post(f'http://{server_ip}:{port}/checks/sync', json=json_data, timeout=(AGENT_CONNECT_TIMEOUT, 30))
+        if response.status_code in (404, 405):
+            roxywi_common.logging_without_user(
+                'Agent does not support bulk sync, sending checks one by one', 'warning', extra={'agent_id': agent_id}
+            )
+            smon_sql.delete_agent_manifest(agent_id)
+            send_checks(agent_id)
+            return {'version': 0, 'full': True, 'sent': len(hashes), 'deleted': 0}
+        if response.status_code not in (200, 201):
+            raise Exception(f'Agent returned: {response.status_code} {response.text}')
+
+    smon_sql.save_agent_manifest(agent_id, version, hashes)
+    roxywi_common.logging_without_user(
+        f'Checks manifest {version} has been synced with agent {agent_id}', 'info', extra={'agent_id': agent_id}
+    )
+    return {'version': version, 'full': full, 'sent': len(checks), 'deleted': len(deleted)}
@@ -0,0 +1,231 @@
+import io
+import csv
+import json
+from typing import Iterable, Iterator, Union
+
+from pydantic import ValidationError
+
+import app.modules.db.smon as smon_sql
+import app.modules.tools.smon as smon_mod
+from app.modules.roxywi.class_models import (
+    HttpCheckRequest, DnsCheckRequest, TcpCheckRequest, PingCheckRequest, SmtpCheckRequest, RabbitCheckRequest
+)
+
+# Imported checks are created in transactions of this many rows, their checks are sent to the agents after every one
+IMPORT_BATCH_SIZE = 200
+EXPORT_PAGE_SIZE = 500
+
+CHECK_REQUEST_MODELS = {
+    'http': HttpCheckRequest,
+    'tcp': TcpCheckRequest,
+    'dns': DnsCheckRequest,
+    'ping': PingCheckRequest,
+    'smtp': SmtpCheckRequest,
+    'rabbitmq': RabbitCheckRequest,
+}
+CHANNEL_FIELDS = (
+    'telegram_channel_id', 'slack_channel_id', 'pd_channel_id', 'mm_channel_id', 'incidentrelay_channel_id', 'email_channel_id'
+)
+COMMON_FIELDS = (
+    'check_type', 'name', 'description', 'place', 'entities', 'check_group', 'enabled', 'check_timeout', 'interval',
+    'retries', 'priority', 'runbook', 'expiration', 'threshold_timeout', 'keep_history'
+) + CHANNEL_FIELDS
+TYPE_FIELDS = {
+    'tcp': ('ip', 'port'),
+    'ping': ('ip', 'packet_size', 'count_packets', 'use_kernel_timestamp'),
+    'dns': ('ip', 'port', 'resolver', 'record_type'),
+    'smtp': ('ip', 'port', 'username', 'password', 'ignore_ssl_error'),
+    'rabbitmq': ('ip', 'port', 'username', 'password', 'vhost', 'ignore_ssl_error'),
+    'http': (
+        'url', 'method', 'accepted_status_codes', 'body', 'body_json', 'header_req', 'body_req', 'ignore_ssl_error', 'redirects',
+        'auth', 'proxy', 'headers_response', 'accept_cookies', 'http_version', 'resole_to_ip'
+    ),
+}
+CSV_COLUMNS = COMMON_FIELDS + tuple(dict.fromkeys(field for fields in TYPE_FIELDS.values() for field in fields))
+# CSV cells of these columns hold JSON, like [1, 2] or {"path": "$.status"}
+JSON_COLUMNS = ('entities', 'accepted_status_codes', 'auth', 'body_json', 'proxy', 'headers_response', 'http_version')
+# Shell quotes added by EscapedString are dropped on export, like the check views do
+UNQUOTED_FIELDS = ('name', 'check_group', 'runbook', 'body')
+
+CheckRequest = Union[HttpCheckRequest, DnsCheckRequest, TcpCheckRequest, PingCheckRequest, SmtpCheckRequest, RabbitCheckRequest]
+
+
+def _decode_lines(stream: Iterable) -> Iterator[str]:
+    for line in stream:
+        yield line.decode('utf-8-sig') if isinstance(line, bytes) else line
+
+
+def _parse_csv_row(row: dict) -> dict:
+    check = {}
+    for column, value in row.items():
+        if column is None:
+            raise ValueError('row has more cells than the header')
+        if value is None or value == '':
+            continue
+        check[column] = json.loads(value) if column in JSON_COLUMNS else value
+    return check
+
+
+def _read_rows(stream: Iterable, file_format: str) -> Iterator[tuple[int, Union[dict, Exception]]]:
+    lines = _decode_lines(stream)
+    if file_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(lines), 1):
+            try:
+                yield row_number, _parse_csv_row(row)
+            except ValueError as e:
+                yield row_number, e
+        return
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            check = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f'invalid JSON: {e}')
+            continue
+        if not isinstance(check, dict):
+            yield row_number, ValueError('row must be a JSON object')
+            continue
+        yield row_number, check
+
+
+def _validation_error(e: ValidationError) -> str:
+    return '; '.join(f'{".".join(str(loc) for loc in error["loc"]) or "check"}: {error["msg"]}' for error in e.errors())
+
+
+def validate_check(check: dict) -> tuple[str, CheckRequest]:
+    """
+    Validate one check definition with the request model of its check_type, the same as the check endpoints do.
+    """
+    check = dict(check)
+    check_type = check.pop('check_type', None)
+    # The group comes from the import request, not from the rows
+    check.pop('group_id', None)
+    if check_type not in CHECK_REQUEST_MODELS:
+        raise ValueError(f'check_type must be one of: {", ".join(CHECK_REQUEST_MODELS)}')
+    try:
+        return check_type, CHECK_REQUEST_MODELS[check_type].model_validate(check)
+    except ValidationError as e:
+        raise ValueError(_validation_error(e))
+
+
+def read_checks(stream: Iterable, file_format: str) -> Iterator[tuple[int, Union[str, None], Union[CheckRequest, Exception]]]:
+    """
+    Read a JSON Lines or CSV stream of check definitions row by row.
+
+    Yields (row number, check type, validated request), or (row number, None, error) for rows that cannot be
+    parsed or are not valid. Rows are numbered from 1, without empty lines and the CSV header.
+    """
+    for row_number, check in _read_rows(stream, file_format):
+        if isinstance(check, Exception):
+            yield row_number, None, check
+            continue
+        try:
+            check_type, data = validate_check(check)
+        except Exception as e:
+            yield row_number, None, e
+            continue
+        yield row_number, check_type, data
+
+
+def _unquote(value: Union[str, None]) -> Union[str, None]:
+    return value.replace("'", "") if value else value
+
+
+def _export_check(multi_check, smon_rows: list, type_check, group_names: dict) -> dict:
+    first = smon_rows[0]
+    entity_field = {'country': 'country_id_id', 'region': 'region_id_id', 'agent': 'agent_id_id'}.get(multi_check.entity_type)
+    entities = []
+    if entity_field:
+        entities = sorted({getattr(row, entity_field) for row in smon_rows if getattr(row, entity_field)})
+    expiration = None
+    if multi_check.expiration and multi_check.expiration != '0000-00-00 00:00:00':
+        expiration = multi_check.expiration.strftime("%Y-%m-%d %H:%M")
+
+    check = {
+        'check_type': first.check_type,
+        'name': multi_check.name,
+        'description': multi_check.description or '',
+        'place': multi_check.entity_type,
+        'entities': entities,
+        'check_group': group_names.get(multi_check.check_group_id_id),
+        'enabled': bool(first.enabled),
+        'check_timeout': first.check_timeout,
+        'interval': type_check.interval,
+        'retries': first.retries,
+        'priority': multi_check.priority,
+        'runbook': multi_check.runbook,
+        'expiration': expiration,
+        'threshold_timeout': multi_check.threshold_timeout,
+        'keep_history': multi_check.keep_history,
+    }
+    for field in CHANNEL_FIELDS:
+        check[field] = getattr(first, field) or 0
+    for field in TYPE_FIELDS[first.check_type]:
+        check[field] = getattr(type_check, field)
+    for field in UNQUOTED_FIELDS:
+        if field in check:
+            check[field] = _unquote(check[field])
+    return check
+
+
+def export_checks(group_id: int, check_type: str = None) -> Iterator[dict]:
+    """
+    Yield every multi check of the group as a check definition that the import accepts.
+
+    Multi checks are read in pages of EXPORT_PAGE_SIZE with a few queries per page.
+    """
+    after_id = 0
+    while True:
+        multi_checks = smon_sql.select_multi_checks_page(group_id, after_id, EXPORT_PAGE_SIZE, check_type)
+        if not multi_checks:
+            return
+        after_id = multi_checks[-1].id
+        group_names = smon_sql.get_smon_group_names(multi_check.check_group_id_id for multi_check in multi_checks)
+        smon_rows = {}
+        for smon in smon_sql.select_smon_by_multi_checks([multi_check.id for multi_check in multi_checks]):
+            smon_rows.setdefault(smon.multi_check_id_id, []).append(smon)
+
+        # Every check of a multi check has the same settings, the first one stands for all of them
+        first_ids = {}
+        for rows in smon_rows.values():
+            first_ids.setdefault(rows[0].check_type, []).append(rows[0].id)
+        type_checks = {}
+        for first_type, smon_ids in first_ids.items():
+            type_checks.update(smon_sql.select_checks_by_smon_ids(smon_ids, smon_mod.get_check_id_by_name(first_type)))
+
+        for multi_check in multi_checks:
+            rows = smon_rows.get(multi_check.id)
+            if not rows or rows[0].id not in type_checks:
+                continue
+            yield _export_check(multi_check, rows, type_checks[rows[0].id][0], group_names)
+
+
+def _csv_cell(column: str, value) -> Union[str, int, float]:
+    if value is None:
+        return ''
+    if column in JSON_COLUMNS:
+        return json.dumps(value, default=str)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def to_jsonl(checks: Iterable[dict]) -> Iterator[str]:
+    # Empty fields are left out, so the import uses their defaults, like it does for empty CSV cells
+    for check in checks:
+        yield json.dumps({field: value for field, value in check.items() if value is not None}, default=str) + '\n'
+
+
+def to_csv(checks: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for check in checks:
+        writer.writerow({column: _csv_cell(column, value) for column, value in check.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
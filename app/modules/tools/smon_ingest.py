@@ -0,0 +1,113 @@
+import time
+import threading
+from datetime import datetime
+
+import app.modules.db.smon as smon_sql
+import app.modules.tools.smon_rollup as smon_rollup
+import app.modules.roxywi.common as roxywi_common
+import app.modules.tools.alert_dispatcher as alert_dispatcher
+from app.modules.roxywi.class_models import CheckResult
+
+_stats = {
+    'results': 0,
+    'rejected': 0,
+    'batches': 0,
+    'seconds': 0.0,
+    'last_batch_size': 0,
+    'last_batch_seconds': 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def ingest_results(agent_id: int, results: list[CheckResult]) -> dict:
+    """
+    Save a batch of check results sent by an agent in one transaction.
+
+    Results of checks that do not belong to the agent or older than ROLLUP_MAX_LATE are rejected. SMON gets the response time of the newest
+    result of every check and a new status only when it changed. Returns the throughput of the batch.
+    """
+    started = time.perf_counter()
+    now = datetime.now()
+    oldest_allowed = now - smon_rollup.ROLLUP_MAX_LATE
+    statuses = smon_sql.select_agent_check_statuses(agent_id, {result.smon_id for result in results})
+    history = []
+    latest = {}
+    rejected = 0
+
+    for result in results:
+        if result.smon_id not in statuses:
+            rejected += 1
+            continue
+        row = result.model_dump()
+        row['date'] = row['date'] or now
+        if row['date'].replace(tzinfo=None) < oldest_allowed:
+            rejected += 1
+            continue
+        row['response_time'] = row['response_time'] or 0
+        row['mes'] = row['mes'] or ''
+        history.append(row)
+        if result.smon_id not in latest or row['date'] >= latest[result.smon_id]['date']:
+            latest[result.smon_id] = row
+
+    status_changes = {
+        smon_id: (row['status'], row['date']) for smon_id, row in latest.items() if row['status'] != statuses[smon_id]
+    }
+    response_times = {smon_id: row['response_time'] for smon_id, row in latest.items()}
+    if history:
+        # Rows older than the rollup lag may land in buckets that are rolled up already
+        oldest = min(row['date'].replace(tzinfo=None) for row in history)
+        late_since = oldest if oldest < now - smon_rollup.ROLLUP_LAG else None
+        smon_sql.save_check_results(history, status_changes, response_times, late_since)
+    if status_changes:
+        queue_status_alerts({smon_id: latest[smon_id] for smon_id in status_changes})
+
+    elapsed = time.perf_counter() - started
+    with _stats_lock:
+        _stats['results'] += len(history)
+        _stats['rejected'] += rejected
+        _stats['batches'] += 1
+        _stats['seconds'] += elapsed
+        _stats['last_batch_size'] = len(history)
+        _stats['last_batch_seconds'] = elapsed
+
+    return {
+        'inserted': len(history),
+        'rejected': rejected,
+        'status_changes': len(status_changes),
+        'seconds': round(elapsed, 4),
+        'results_per_second': round(len(history) / elapsed, 2) if elapsed else 0,
+    }
+
+
+def queue_status_alerts(changed: dict) -> None:
+    """
+    Queue an alert for every check whose status changed, the alert dispatcher sends them to the check channels.
+    changed is {smon_id: the newest result of the check}.
+    """
+    try:
+        checks = smon_sql.select_checks_alert_info(set(changed))
+        for smon_id, row in changed.items():
+            check = checks.get(smon_id)
+            if not check:
+                continue
+            name = (check['name'] or '').replace("'", "")
+            if row['status'] == 1:
+                message, level = f'Check {name} is UP', 'info'
+            else:
+                message, level = f'Check {name} is DOWN: {row["mes"]}', check['priority'] or 'critical'
+            alert_dispatcher.queue_alert(
+                check['multi_check_id'], message, level, alert_key=str(smon_id), state_id=smon_id, check_type=check['check_type']
+            )
+    except Exception as e:
+        # The results are saved already, a failed alert must not make the agent send them again
+        roxywi_common.logging_without_user(f'Cannot queue status alerts: {e}', 'error')
+
+
+def get_ingest_stats() -> dict:
+    """
+    Return the ingest totals of this process, with the average throughput since start.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['results_per_second'] = round(stats['results'] / stats['seconds'], 2) if stats['seconds'] else 0
+    return stats
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import app.modules.db.smon as smon_sql
+import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_placement as smon_placement
+import app.modules.roxywi.common as roxywi_common
+
+# An agent is dark when it sent nothing for its shortest check interval plus this grace, in seconds
+AGENT_STALE_GRACE = 30
+AGENT_STALE_MIN = 60
+# How far back history is searched for the last result of an agent
+AGENT_ACTIVITY_LOOKBACK = timedelta(hours=2)
+
+
+def _stale_after(min_interval: int) -> timedelta:
+    return timedelta(seconds=max(AGENT_STALE_MIN, (min_interval or 0) + AGENT_STALE_GRACE))
+
+
+def _probe_agent(agent_id: int) -> bool:
+    try:
+        server_ip = smon_sql.select_server_ip_by_agent_id(agent_id)
+        smon_agent.send_get_request_to_agent(agent_id, server_ip, 'scheduler')
+        return True
+    except Exception:
+        return False
+
+
+def failover_agent(agent) -> int:
+    """
+    Reassign the enabled checks of a dark agent to the least loaded healthy agents of its region in bulk.
+
+    Returns the number of reassigned checks.
+    """
+    checks = smon_sql.select_enabled_checks_for_agent(agent.id)
+    if not checks or not agent.region_id_id:
+        return 0
+    loads = smon_placement.get_region_loads(agent.region_id_id)
+    dead_checks = loads.pop(agent.id, {'checks': {}})['checks']
+    loads = {agent_id: load for agent_id, load in loads.items() if load['enabled']}
+    if not loads:
+        roxywi_common.logging_without_user(f'Agent {agent.id} is dark and there are no healthy agents in its region', 'error')
+        return 0
+
+    moves = {}
+    sends = {}
+    for check in sorted(checks, key=lambda c: -dead_checks.get(c.id, ('', 0))[1]):
+        load = dead_checks.get(check.id, ('', 0))[1]
+        new_agent_id = min(loads, key=lambda agent_id: loads[agent_id]['load'])
+        loads[new_agent_id]['load'] += load
+        moves.setdefault(new_agent_id, []).append(check.id)
+        sends.setdefault(new_agent_id, []).append((check.id, check.check_type))
+
+    smon_sql.failover_checks(moves, agent.id)
+    results = smon_agent.run_on_agents(
+        [(new_agent_id, smon_agent.send_checks_by_ids, (new_agent_id, agent_checks)) for new_agent_id, agent_checks in sends.items()]
+    )
+    for result in results:
+        if result['error']:
+            roxywi_common.logging_without_user(f'Cannot send failed over checks to agent {result["agent_id"]}: {result["error"]}', 'error')
+    roxywi_common.logging_without_user(f'Agent {agent.id} is dark, {len(checks)} checks have been moved to other agents', 'warning')
+    return len(checks)
+
+
+def reconcile_agent(agent_id: int) -> int:
+    """
+    Move the failed over checks back to their home agent once it is alive again.
+
+    Returns the number of checks moved back.
+    """
+    checks = smon_sql.select_check_failovers(agent_id)
+    moves = [(check.id, check.check_type, check.agent_id_id, agent_id) for check in checks if check.agent_id_id != agent_id]
+    results = smon_agent.move_checks(moves)
+    failed = {move[0] for move, result in zip(moves, results) if result['error']}
+    for result in results:
+        if result['error']:
+            roxywi_common.logging_without_user(f'Cannot move a check back to agent {agent_id}: {result["error"]}', 'error')
+    smon_sql.delete_check_failovers([check.id for check in checks if check.id not in failed])
+    if moves:
+        roxywi_common.logging_without_user(f'Agent {agent_id} is alive again, {len(moves) - len(failed)} checks have been moved back', 'info')
+    return len(moves) - len(failed)
+
+
+def check_agents_liveness() -> dict:
+    """
+    Fail over the checks of agents that went dark and move them back to agents that came back.
+
+    The last sign of life of an agent is the newest of its heartbeat and of the history of its checks.
+    An agent is dark once it was silent for longer than its shortest check interval plus AGENT_STALE_GRACE
+    and it does not answer a direct request.
+    """
+    now = datetime.now()
+    stats = {'failed_over': 0, 'reconciled': 0}
+    liveness = smon_sql.select_agents_liveness()
+    activity = smon_sql.select_agents_last_history(now - AGENT_ACTIVITY_LOOKBACK)
+    min_intervals = smon_sql.select_agents_min_interval()
+    failover_homes = smon_sql.select_failover_home_agents()
+
+    for agent in smon_sql.select_all_agents():
+        if not agent.enabled:
+            continue
+        state = liveness.get(agent.id)
+        seen = [date for date in (state.last_seen if state else None, activity.get(agent.id)) if date]
+        last_seen = max(seen) if seen else None
+        was_alive = state.alive if state else True
+        stale = last_seen is None or now - last_seen > _stale_after(min_intervals.get(agent.id))
+        # Agents without checks have nothing to report and nothing to fail over
+        if stale and was_alive and agent.id not in min_intervals:
+            continue
+        if stale and _probe_agent(agent.id):
+            smon_sql.touch_agent(agent.id)
+            stale = False
+
+        if stale and was_alive:
+            smon_sql.set_agent_alive(agent.id, False)
+            try:
+                stats['failed_over'] += failover_agent(agent)
+            except Exception as e:
+                roxywi_common.logging_without_user(f'Cannot fail over checks of agent {agent.id}: {e}', 'error')
+        elif not stale:
+            if not was_alive:
+                smon_sql.set_agent_alive(agent.id, True)
+            # Checks that could not be moved back yet are retried on every run
+            if agent.id in failover_homes:
+                try:
+                    stats['reconciled'] += reconcile_agent(agent.id)
+                except Exception as e:
+                    roxywi_common.logging_without_user(f'Cannot move checks back to agent {agent.id}: {e}', 'error')
+    return stats
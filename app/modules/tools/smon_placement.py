@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import app.modules.db.smon as smon_sql
+import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_rollup as smon_rollup
+from app.modules.roxywi.exception import RoxywiResourceNotFound
+
+# Relative cost of one second of work of a check type on an agent
+CHECK_TYPE_WEIGHTS = {'tcp': 1.0, 'ping': 1.0, 'dns': 1.0, 'http': 2.0, 'smtp': 1.5, 'rabbitmq': 1.5}
+# Measured execution time is averaged over this period
+MEASURE_PERIOD = timedelta(hours=1)
+MIN_CHECK_DURATION = 0.05
+# Agents are considered balanced when their loads differ by less than this share of the average load
+REBALANCE_TOLERANCE = 0.1
+REBALANCE_MAX_MOVES = 200
+
+
+def estimate_check_load(check_type: str, interval: int, timeout: int, measured_ms: float = None) -> float:
+    """
+    Estimate the share of agent time a check takes: its weighted duration per run divided by its interval.
+
+    The duration is the measured average response time when there is one, capped by the timeout,
+    otherwise the timeout, as a new check may take that long.
+    """
+    timeout = float(timeout or 2)
+    if measured_ms:
+        duration = min(measured_ms / 1000, timeout)
+    else:
+        duration = timeout
+    duration = max(duration, MIN_CHECK_DURATION)
+    return CHECK_TYPE_WEIGHTS.get(check_type, 1.0) * duration / max(int(interval or 120), 1)
+
+
+def get_region_loads(region_id: int) -> dict:
+    """
+    Return {agent_id: {'load', 'enabled', 'checks': {smon_id: (check_type, load)}}} of the agents of the region.
+
+    Agents that are disabled or dark are not enabled.
+    """
+    agents = smon_sql.select_region_agents(region_id)
+    if not agents:
+        raise RoxywiResourceNotFound(f'There are no agents in the region_id: {region_id}')
+    dead_agents = smon_sql.select_dead_agent_ids()
+    loads = {
+        agent.id: {'load': 0.0, 'enabled': bool(agent.enabled) and agent.id not in dead_agents, 'checks': {}} for agent in agents
+    }
+    checks = [check for check in smon_sql.select_region_checks_for_placement(region_id) if check['agent_id'] in loads]
+    totals = smon_rollup.get_checks_totals([check['id'] for check in checks], datetime.now() - MEASURE_PERIOD)
+
+    for check in checks:
+        total = totals.get(check['id'], {})
+        measured_ms = total['resp_sum'] / total['total'] if total.get('total') else None
+        load = estimate_check_load(check['check_type'], check['interval'], check['check_timeout'], measured_ms)
+        agent = loads[check['agent_id']]
+        agent['checks'][check['id']] = (check['check_type'], load)
+        agent['load'] += load
+    return loads
+
+
+def _least_loaded_agent(loads: dict, new_load: float) -> int:
+    return min(
+        loads,
+        key=lambda agent_id: (not loads[agent_id]['enabled'], loads[agent_id]['load'] + new_load, len(loads[agent_id]['checks']))
+    )
+
+
+def pick_agent(region_id: int, check_type: str, interval: int, timeout: int) -> int:
+    """
+    Return the enabled agent of the region with the lowest estimated load once the new check is added.
+    """
+    loads = get_region_loads(region_id)
+    return _least_loaded_agent(loads, estimate_check_load(check_type, interval, timeout))
+
+
+class AgentPicker:
+    """
+    Picks agents for many new checks in a row. The loads of a region are read once and every picked check
+    is added to them, so the checks are spread like pick_agent() would spread them one by one.
+    """
+
+    def __init__(self):
+        self._loads: dict[int, dict] = {}
+
+    def pick_agent(self, region_id: int, check_type: str, interval: int, timeout: int) -> int:
+        loads = self._loads.get(region_id)
+        if loads is None:
+            loads = self._loads[region_id] = get_region_loads(region_id)
+        new_load = estimate_check_load(check_type, interval, timeout)
+        agent_id = _least_loaded_agent(loads, new_load)
+        loads[agent_id]['load'] += new_load
+        return agent_id
+
+
+def plan_rebalance(region_id: int, tolerance: float = REBALANCE_TOLERANCE) -> list[tuple[int, str, int, int]]:
+    """
+    Return the moves (smon_id, check_type, old_agent, new_agent) that even out the load of the enabled agents.
+
+    Every step moves the check of the most loaded agent that narrows the gap to the least loaded one the most,
+    so the plan stays small: checks that would only swap the imbalance are never moved.
+    """
+    loads = {agent_id: agent for agent_id, agent in get_region_loads(region_id).items() if agent['enabled']}
+    if len(loads) < 2:
+        return []
+    average = sum(agent['load'] for agent in loads.values()) / len(loads)
+    moves = []
+    moved = set()
+
+    while len(moves) < REBALANCE_MAX_MOVES:
+        busiest = max(loads, key=lambda agent_id: loads[agent_id]['load'])
+        idlest = min(loads, key=lambda agent_id: loads[agent_id]['load'])
+        gap = loads[busiest]['load'] - loads[idlest]['load']
+        if gap <= tolerance * average:
+            break
+        candidates = [
+            (smon_id, check_type, load) for smon_id, (check_type, load) in loads[busiest]['checks'].items()
+            if load < gap and smon_id not in moved
+        ]
+        if not candidates:
+            break
+        smon_id, check_type, load = min(candidates, key=lambda candidate: abs(gap / 2 - candidate[2]))
+        del loads[busiest]['checks'][smon_id]
+        loads[busiest]['load'] -= load
+        loads[idlest]['checks'][smon_id] = (check_type, load)
+        loads[idlest]['load'] += load
+        moved.add(smon_id)
+        moves.append((smon_id, check_type, busiest, idlest))
+    return moves
+
+
+def rebalance_region(region_id: int, dry_run: bool = False) -> dict:
+    moves = plan_rebalance(region_id)
+    result = {'moves': [
+        {'check_id': smon_id, 'check_type': check_type, 'old_agent': old_agent, 'new_agent': new_agent}
+        for smon_id, check_type, old_agent, new_agent in moves
+    ]}
+    if dry_run or not moves:
+        return result
+    results = smon_agent.move_checks(moves)
+    smon_agent.raise_for_agent_errors(results, f'Cannot rebalance checks of the region {region_id}')
+    return result
@@ -0,0 +1,258 @@
+from datetime import datetime, timedelta
+from typing import Union
+
+import app.modules.db.sql as sql
+import app.modules.db.rollup as rollup_sql
+import app.modules.db.history_partition as history_partition
+import app.modules.common.common as common
+
+ROLLUP_TIERS = {
+    '1m': timedelta(minutes=1),
+    '5m': timedelta(minutes=5),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+# Every tier is built from the next finer one, so raw rows are only read once
+ROLLUP_SOURCES = {'5m': '1m', '1h': '5m', '1d': '1h'}
+ROLLUP_RETENTION_SETTINGS = {
+    '1m': 'smon_keep_rollup_1m_range',
+    '5m': 'smon_keep_rollup_5m_range',
+    '1h': 'smon_keep_rollup_1h_range',
+    '1d': 'smon_keep_rollup_1d_range',
+}
+# Rows may land a bit after their date, the last minute is rolled up on the next run
+ROLLUP_LAG = timedelta(minutes=1)
+# Rows dated further back are rejected by the ingest, the raw history to roll them up again may be gone already
+ROLLUP_MAX_LATE = timedelta(days=1)
+# Limits how much history one run reads, so the first run over a large history catches up gradually
+ROLLUP_MAX_SPAN = timedelta(hours=6)
+# Days past every retention that are cleaned again, so a late or missed daily run leaves nothing behind
+RETENTION_CATCH_UP_DAYS = 2
+# Upper bounds (ms) of the response time histogram bins, the last bin takes everything above
+RESPONSE_TIME_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def floor_date(date: datetime, tier: str) -> datetime:
+    date = date.replace(tzinfo=None)
+    return date - (date - _EPOCH) % ROLLUP_TIERS[tier]
+
+
+def _new_bucket(smon_id: int, check_id: int, tier: str, bucket: datetime) -> dict:
+    return {
+        'smon_id': smon_id,
+        'check_id': check_id,
+        'tier': tier,
+        'bucket': bucket,
+        'count': 0,
+        'up_count': 0,
+        'resp_sum': 0.0,
+        'resp_min': None,
+        'resp_max': None,
+        'resp_histogram': [0] * (len(RESPONSE_TIME_BOUNDS) + 1),
+    }
+
+
+def _add_value(bucket: dict, status: int, response_time: float) -> None:
+    response_time = float(response_time or 0)
+    bucket['count'] += 1
+    bucket['up_count'] += 1 if int(status or 0) == 1 else 0
+    bucket['resp_sum'] += response_time
+    bucket['resp_min'] = response_time if bucket['resp_min'] is None else min(bucket['resp_min'], response_time)
+    bucket['resp_max'] = response_time if bucket['resp_max'] is None else max(bucket['resp_max'], response_time)
+    bin_index = len(RESPONSE_TIME_BOUNDS)
+    for i, bound in enumerate(RESPONSE_TIME_BOUNDS):
+        if response_time <= bound:
+            bin_index = i
+            break
+    bucket['resp_histogram'][bin_index] += 1
+
+
+def _merge_bucket(bucket: dict, source) -> None:
+    bucket['count'] += source.count
+    bucket['up_count'] += source.up_count
+    bucket['resp_sum'] += source.resp_sum
+    for key, func in (('resp_min', min), ('resp_max', max)):
+        value = getattr(source, key)
+        if value is not None:
+            bucket[key] = value if bucket[key] is None else func(bucket[key], value)
+    for i, value in enumerate(source.resp_histogram or []):
+        bucket['resp_histogram'][i] += value
+
+
+def estimate_percentile(histogram: list, percentile: float, resp_max: float = None) -> Union[float, None]:
+    """
+    Estimate a response time percentile from the bucket histogram, accurate to the bin bounds.
+    """
+    total = sum(histogram or [])
+    if not total:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for i, value in enumerate(histogram):
+        seen += value
+        if seen >= rank:
+            bound = RESPONSE_TIME_BOUNDS[i] if i < len(RESPONSE_TIME_BOUNDS) else resp_max
+            if resp_max is not None and bound is not None:
+                return min(bound, resp_max)
+            return bound
+    return resp_max
+
+
+def _rollup_tier(tier: str, start: datetime, end: datetime, rewind: dict = None, dirty_ids: list = None) -> int:
+    buckets = {}
+    if tier == '1m':
+        for smon_id, check_id, date, status, response_time in rollup_sql.select_history_for_rollup(start, end):
+            bucket_date = floor_date(date, tier)
+            key = (smon_id, bucket_date)
+            if key not in buckets:
+                buckets[key] = _new_bucket(smon_id, check_id, tier, bucket_date)
+            _add_value(buckets[key], status, response_time)
+    else:
+        for row in rollup_sql.select_rollups_for_rollup(ROLLUP_SOURCES[tier], start, end):
+            bucket_date = floor_date(row.bucket, tier)
+            key = (row.smon_id_id, bucket_date)
+            if key not in buckets:
+                buckets[key] = _new_bucket(row.smon_id_id, row.check_id, tier, bucket_date)
+            _merge_bucket(buckets[key], row)
+    rollup_sql.replace_rollups(tier, list(buckets.values()), start, end, rewind, dirty_ids)
+    return len(buckets)
+
+
+def rollup_history() -> dict:
+    """
+    Roll up complete buckets of every tier since the tier watermark. Safe to run repeatedly.
+
+    Rows that landed after their bucket was rolled up leave a mark, the 1m tier is rolled up again from the oldest
+    mark and the coarser tiers follow it. Returns the number of buckets written per tier.
+    """
+    watermarks = rollup_sql.get_rollup_watermarks()
+    dirty_ids, dirty_since = rollup_sql.select_rollup_dirty()
+    written = {}
+    for tier in ROLLUP_TIERS:
+        if tier == '1m':
+            end = floor_date(datetime.now() - ROLLUP_LAG, tier)
+        else:
+            source_watermark = watermarks.get(ROLLUP_SOURCES[tier])
+            if source_watermark is None:
+                continue
+            end = floor_date(source_watermark, tier)
+        start = watermarks.get(tier)
+        if start is None:
+            if tier == '1m':
+                oldest = rollup_sql.get_oldest_history_date()
+            else:
+                oldest = rollup_sql.get_oldest_rollup_date(ROLLUP_SOURCES[tier])
+            if oldest is None:
+                continue
+            start = floor_date(oldest, tier)
+        rewind = {}
+        if tier == '1m' and dirty_since is not None:
+            late_start = floor_date(max(dirty_since, datetime.now() - ROLLUP_MAX_LATE), tier)
+            if late_start < start:
+                start = late_start
+                rewind = {coarser: floor_date(start, coarser) for coarser in ROLLUP_SOURCES}
+        end = min(end, start + max(ROLLUP_MAX_SPAN, ROLLUP_TIERS[tier]))
+        if start >= end:
+            continue
+        written[tier] = _rollup_tier(tier, start, end, rewind, dirty_ids if tier == '1m' else None)
+        watermarks[tier] = end
+        for coarser, bucket in rewind.items():
+            if watermarks.get(coarser) is not None:
+                watermarks[coarser] = min(watermarks[coarser], bucket)
+    return written
+
+
+def delete_old_history() -> None:
+    """
+    Apply the raw history retention.
+
+    Whole days past the longest retention of all checks are dropped as partitions. For the checks that keep less,
+    by their own keep_history or by the smon_keep_history_raw_range setting, only the days that went past their
+    retention since the last runs are cleaned.
+    """
+    now = datetime.now()
+    default_days = int(sql.get_setting('smon_keep_history_raw_range') or 1)
+    check_days = history_partition.select_checks_keep_history()
+    keep_days = max([default_days, *check_days.values()])
+
+    partitions = None
+    if history_partition.is_partitioned():
+        history_partition.ensure_partitions()
+        history_partition.drop_partitions_before(now.date() - timedelta(days=keep_days))
+        partitions = history_partition.select_partitions()
+    else:
+        history_partition.delete_history_before(now - timedelta(days=keep_days))
+
+    days = set()
+    for retention in {default_days, *check_days.values()}:
+        for offset in range(1, RETENTION_CATCH_UP_DAYS + 1):
+            if retention + offset <= keep_days:
+                days.add(now.date() - timedelta(days=retention + offset))
+    for day in sorted(days):
+        history_partition.expire_day_history(day, default_days, partitions)
+
+
+def delete_old_rollups() -> None:
+    for tier, setting in ROLLUP_RETENTION_SETTINGS.items():
+        keep_days = sql.get_setting(setting)
+        if not keep_days:
+            continue
+        rollup_sql.delete_old_rollups(tier, datetime.now() - timedelta(days=keep_days))
+
+
+def get_checks_totals(smon_ids: list, since: datetime) -> dict:
+    """
+    Return {smon_id: {'total', 'up', 'resp_sum'}} of the checks since the start of the hour of since.
+
+    Complete hours are read from the 1h tier, the rest of the rolled up time from the 1m tier and only the rows
+    that are not rolled up yet from smon_history, so the cost does not grow with the amount of raw history.
+    The number of queries does not depend on the number of checks.
+    """
+    smon_ids = list(smon_ids)
+    totals = {smon_id: {'total': 0, 'up': 0, 'resp_sum': 0.0} for smon_id in smon_ids}
+    if not smon_ids:
+        return totals
+    watermarks = rollup_sql.get_rollup_watermarks()
+    cursor = floor_date(since, '1h')
+    sums = []
+    for tier in ('1h', '1m'):
+        watermark = watermarks.get(tier)
+        if watermark is None or watermark <= cursor:
+            continue
+        sums.append(rollup_sql.sum_checks_rollups(smon_ids, tier, cursor, watermark))
+        cursor = watermark
+    sums.append(rollup_sql.sum_checks_history(smon_ids, cursor))
+    for tier_sums in sums:
+        for smon_id, (count, up, resp_sum) in tier_sums.items():
+            totals[smon_id]['total'] += count or 0
+            totals[smon_id]['up'] += up or 0
+            totals[smon_id]['resp_sum'] += resp_sum or 0
+    return totals
+
+
+def get_check_totals(smon_id: int, since: datetime) -> dict:
+    return get_checks_totals([smon_id], since)[smon_id]
+
+
+def rollup_metrics(smon_id: int, tier: str, start: datetime, end: datetime = None, fmt: str = 'string') -> dict:
+    buckets = list(rollup_sql.select_check_rollups(smon_id, tier, floor_date(start, tier), end))
+    series = {
+        'response_time': [round(bucket.resp_sum / bucket.count, 2) if bucket.count else 0 for bucket in buckets],
+        'min_resp_time': [bucket.resp_min if bucket.resp_min is not None else 0 for bucket in buckets],
+        'max_resp_time': [bucket.resp_max if bucket.resp_max is not None else 0 for bucket in buckets],
+        'p95_resp_time': [],
+        'uptime': [round(bucket.up_count * 100 / bucket.count, 2) if bucket.count else 0 for bucket in buckets],
+    }
+    for bucket in buckets:
+        p95 = estimate_percentile(bucket.resp_histogram, 95, bucket.resp_max)
+        series['p95_resp_time'].append(p95 if p95 is not None else 0)
+
+    if fmt != 'string':
+        return common.metrics_to_columns([common.to_epoch(bucket.bucket) for bucket in buckets], series, fmt)
+
+    fmt = '%Y-%m-%d %H:%M' if tier in ('1h', '1d') else '%H:%M'
+    metrics = {'chartData': {'labels': ''.join(f'{bucket.bucket.strftime(fmt)},' for bucket in buckets)}}
+    for name, values in series.items():
+        metrics['chartData'][name] = ''.join(f'{value},' for value in values)
+    return metrics
@@ -0,0 +1,185 @@
+import json
+import queue
+import threading
+from typing import Union
+
+from flask import Flask
+
+import app.modules.db.smon as smon_sql
+import app.modules.common.common as common
+import app.modules.tools.smon as smon_mod
+import app.modules.common.metrics as app_metrics
+from app.modules.db.db_model import conn
+
+# How often the publisher looks for new results of the watched checks
+POLL_INTERVAL = 2
+# How long a subscriber waits for a payload before it sends a keep-alive to detect closed connections
+KEEP_ALIVE_INTERVAL = 15
+SUBSCRIBER_QUEUE_SIZE = 5
+
+
+def build_check_metric_payload(check_id: int, check_type_id: int, time_zone: str = None) -> dict:
+    """
+    Build the chart payload of the latest result of the check, as sent by the metrics stream.
+    """
+    json_metric = {}
+    interval = 120
+    chart_metrics = smon_sql.get_history(check_id)
+    smon = smon_sql.select_one_smon(check_id, check_type_id)
+    is_enabled = 1
+
+    for s in smon:
+        json_metric['updated_at'] = common.get_time_zoned_date(s.smon_id.updated_at, time_zone=time_zone)
+        json_metric['name'] = str(s.smon_id.multi_check_id.name)
+        interval = s.interval
+        is_enabled = s.smon_id.enabled
+        if s.smon_id.ssl_expire_date is not None:
+            json_metric['ssl_expire_date'] = smon_mod.get_ssl_expire_date(s.smon_id.ssl_expire_date)
+        else:
+            json_metric['ssl_expire_date'] = 'N/A'
+
+    json_metric['time'] = common.get_time_zoned_date(chart_metrics.date, '%H:%M:%S', time_zone=time_zone)
+    json_metric['response_time'] = chart_metrics.response_time
+    json_metric['mes'] = str(chart_metrics.mes)
+    json_metric['uptime'] = smon_mod.check_uptime(check_id)
+    json_metric['avg_res_time'] = smon_mod.get_average_response_time(check_id, check_type_id)
+    json_metric['interval'] = interval
+    json_metric['status'] = int(chart_metrics.status) if is_enabled else 4
+
+    # Add HTTP-specific metrics if applicable
+    if check_type_id in (2, 3):
+        json_metric['name_lookup'] = str(chart_metrics.name_lookup)
+        json_metric['connect'] = str(chart_metrics.connect)
+        json_metric['app_connect'] = str(chart_metrics.app_connect)
+
+        if check_type_id != 3 and chart_metrics.redirect is not None:
+            json_metric['pre_transfer'] = str(chart_metrics.pre_transfer)
+
+            if chart_metrics.redirect:
+                json_metric['redirect'] = '0' if float(chart_metrics.redirect) <= 0 else str(chart_metrics.redirect)
+
+            json_metric['start_transfer'] = '0' if float(chart_metrics.start_transfer) <= 0 else str(chart_metrics.start_transfer)
+            json_metric['m_download'] = str(chart_metrics.download)
+    elif check_type_id == 4:
+        json_metric['avg_resp_time'] = str(chart_metrics.name_lookup)
+        json_metric['max_resp_time'] = str(chart_metrics.connect)
+        json_metric['min_resp_time'] = str(chart_metrics.app_connect)
+        json_metric['packet_loss_percent'] = str(chart_metrics.pre_transfer)
+
+    return json_metric
+
+
+class CheckMetricsPublisher:
+    """
+    Computes the latest payload of every watched check once and fans it out to all subscribers of that check.
+
+    One background thread per process polls the newest result date of the watched checks with a single query
+    and builds a payload only when a check got a new result. Subscribers are bounded queues, a slow subscriber
+    only loses its oldest payloads.
+    """
+
+    def __init__(self, poll_interval: int = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers: dict[tuple, set[queue.Queue]] = {}
+        self._last_dates: dict[tuple, object] = {}
+        self._last_payloads: dict[tuple, str] = {}
+        self._thread: Union[threading.Thread, None] = None
+        self._app: Union[Flask, None] = None
+
+    def subscribe(self, app: Flask, check_id: int, check_type_id: int, time_zone: str) -> tuple[tuple, queue.Queue]:
+        key = (check_id, check_type_id, time_zone)
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._app = app
+            self._subscribers.setdefault(key, set()).add(subscriber)
+            if key in self._last_payloads:
+                subscriber.put_nowait(self._last_payloads[key])
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='rmon-metrics-publisher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return key, subscriber
+
+    def unsubscribe(self, key: tuple, subscriber: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[key]
+                self._last_dates.pop(key, None)
+                self._last_payloads.pop(key, None)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    self._publish_updates()
+            except Exception as e:
+                print(f'error: cannot publish check metrics: {e}')
+            finally:
+                if not conn.is_closed():
+                    conn.close()
+
+    def _publish_updates(self) -> None:
+        with self._lock:
+            keys = list(self._subscribers)
+        if not keys:
+            return
+        last_dates = smon_sql.get_last_history_dates({key[0] for key in keys})
+        for key in keys:
+            date = last_dates.get(key[0])
+            if date is None or self._last_dates.get(key) == date:
+                continue
+            try:
+                payload = json.dumps(build_check_metric_payload(*key))
+            except Exception as e:
+                payload = json.dumps({'error': str(e)})
+            with self._lock:
+                if key not in self._subscribers:
+                    continue
+                self._last_dates[key] = date
+                self._last_payloads[key] = payload
+                subscribers = list(self._subscribers[key])
+            for subscriber in subscribers:
+                self._put(subscriber, payload)
+
+    @staticmethod
+    def _put(subscriber: queue.Queue, payload: str) -> None:
+        try:
+            subscriber.put_nowait(payload)
+        except queue.Full:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                subscriber.put_nowait(payload)
+            except queue.Full:
+                pass
+
+    def stream(self, app: Flask, check_id: int, check_type_id: int, time_zone: str):
+        """
+        Generate server-sent events for one subscriber until the client goes away.
+        """
+        key, subscriber = self.subscribe(app, check_id, check_type_id, time_zone)
+        app_metrics.stream_opened()
+        try:
+            while True:
+                try:
+                    payload = subscriber.get(timeout=KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'data:{payload}\n\n'
+        finally:
+            self.unsubscribe(key, subscriber)
+            app_metrics.stream_closed()
+
+
+publisher = CheckMetricsPublisher()
@@ -0,0 +1,115 @@
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Callable
+
+from flask import make_response, request
+
+import app.modules.db.smon as smon_sql
+import app.modules.common.metrics as app_metrics
+
+# A snapshot is rebuilt at least this often, so uptime keeps moving while no check changes its status
+STATUS_PAGE_TTL = 60
+# How often the state of the page checks is compared with the snapshot
+STATUS_PAGE_STATE_INTERVAL = 5
+
+_snapshots: dict[tuple, dict] = {}
+_build_locks: dict[tuple, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def _get_build_lock(key: tuple) -> threading.Lock:
+    with _lock:
+        return _build_locks.setdefault(key, threading.Lock())
+
+
+def _is_fresh(snapshot: dict, now: float) -> bool:
+    return snapshot is not None and now - snapshot['checked_at'] < STATUS_PAGE_STATE_INTERVAL
+
+
+def get_snapshot(key: tuple, build: Callable[[], tuple[int, str]]) -> dict:
+    """
+    Return the snapshot of a status page, rebuilding it when the page checks changed or it is older than STATUS_PAGE_TTL.
+
+    build() returns (page_id, body). Only one request per key rebuilds, the others get the previous snapshot,
+    or wait for the first one if there is none yet.
+    """
+    now = time.monotonic()
+    snapshot = _snapshots.get(key)
+    if _is_fresh(snapshot, now):
+        app_metrics.count_cache_lookup('status_page', True)
+        return snapshot
+
+    build_lock = _get_build_lock(key)
+    if not build_lock.acquire(blocking=snapshot is None):
+        app_metrics.count_cache_lookup('status_page', True)
+        return snapshot
+    try:
+        now = time.monotonic()
+        snapshot = _snapshots.get(key)
+        if _is_fresh(snapshot, now):
+            app_metrics.count_cache_lookup('status_page', True)
+            return snapshot
+        state = None
+        if snapshot is not None:
+            state = smon_sql.get_status_page_state(snapshot['page_id'])
+            if state == snapshot['state'] and now - snapshot['built_at'] < STATUS_PAGE_TTL:
+                snapshot['checked_at'] = now
+                app_metrics.count_cache_lookup('status_page', True)
+                return snapshot
+        app_metrics.count_cache_lookup('status_page', False)
+
+        page_id, body = build()
+        if state is None or snapshot['page_id'] != page_id:
+            state = smon_sql.get_status_page_state(page_id)
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        if snapshot is not None and snapshot['etag'] == etag:
+            last_modified = snapshot['last_modified']
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        snapshot = {
+            'page_id': page_id,
+            'state': state,
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'built_at': now,
+            'checked_at': now,
+        }
+        _snapshots[key] = snapshot
+        return snapshot
+    finally:
+        build_lock.release()
+        # Slugs without a page get no snapshot, their locks are dropped so unknown slugs can not grow the dict
+        if key not in _snapshots:
+            _drop_build_lock(key, build_lock)
+
+
+def _drop_build_lock(key: tuple, build_lock: threading.Lock) -> None:
+    with _lock:
+        if _build_locks.get(key) is build_lock:
+            del _build_locks[key]
+
+
+def invalidate() -> None:
+    """
+    Drop all snapshots of this process, after status pages were changed.
+    """
+    with _lock:
+        _snapshots.clear()
+        for key in [key for key, build_lock in _build_locks.items() if not build_lock.locked()]:
+            del _build_locks[key]
+
+
+def make_snapshot_response(snapshot: dict, mimetype: str):
+    """
+    Build a response that clients revalidate with ETag and Last-Modified, unchanged snapshots get a 304.
+    """
+    response = make_response(snapshot['body'])
+    response.mimetype = mimetype
+    response.set_etag(snapshot['etag'])
+    response.last_modified = snapshot['last_modified']
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
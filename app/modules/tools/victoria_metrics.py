@@ -0,0 +1,173 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import app.modules.common.metrics as app_metrics
+
+VM_CONNECT_TIMEOUT = 3
+VM_READ_TIMEOUT = 15
+VM_POOL_SIZE = 10
+# The step is chosen so a range has about this many points, never finer than the requested step
+VM_TARGET_POINTS = 300
+VM_STEPS = (15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 21600, 43200, 86400)
+# Ranges that end in the past do not change, ranges that end now are cached for about one step
+VM_CACHE_TTL_HISTORICAL = 600
+VM_CACHE_TTL_MAX_RECENT = 30
+VM_CACHE_MAX_SIZE = 512
+
+_session: Union[requests.Session, None] = None
+_cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+_inflight: dict[tuple, dict] = {}
+_lock = threading.Lock()
+
+_STEP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=VM_POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def parse_step(step: str) -> int:
+    """
+    Convert a Prometheus duration like 30s, 1m or 2h to seconds.
+    """
+    match = re.fullmatch(r'(\d+)([smhdw]?)', str(step).strip())
+    if not match:
+        raise ValueError(f'Wrong step: {step}')
+    return int(match.group(1)) * _STEP_UNITS[match.group(2) or 's']
+
+
+def choose_step(start: float, end: float, min_step: int = 0, target_points: int = VM_TARGET_POINTS) -> int:
+    """
+    Return the smallest step of VM_STEPS that keeps the range under target_points, but not below min_step.
+    """
+    wanted = max((end - start) / target_points, min_step, 1)
+    for step in VM_STEPS:
+        if step >= wanted:
+            return step
+    return int(wanted)
+
+
+def _cache_get(key: tuple, now: float) -> Union[dict, None]:
+    with _lock:
+        cached = _cache.get(key)
+        if cached is None:
+            return None
+        if cached[0] <= now:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return cached[1]
+
+
+def _cache_set(key: tuple, expires_at: float, value: dict) -> None:
+    with _lock:
+        _cache[key] = (expires_at, value)
+        _cache.move_to_end(key)
+        while len(_cache) > VM_CACHE_MAX_SIZE:
+            _cache.popitem(last=False)
+
+
+def _fetch(vm_select: str, query: str, step: int, start: int, end: int) -> dict:
+    response = _get_session().get(
+        f'{vm_select}/query_range',
+        params={'query': query, 'step': step, 'start': start, 'end': end},
+        timeout=(VM_CONNECT_TIMEOUT, VM_READ_TIMEOUT),
+    )
+    try:
+        data = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise Exception(f'VictoriaMetrics returned a wrong response: {response.text[:200]}')
+    if data.get('status') == 'error':
+        raise Exception(data.get('error'))
+    return data
+
+
+def query_range(vm_select: str, query: str, start: float, end: float, min_step: int = 0) -> tuple[int, dict]:
+    """
+    Run a range query and return (step, response).
+
+    Start and end are aligned to the step, so dashboards asking for nearly the same range share cache entries.
+    Concurrent requests for the same range wait for the first one instead of querying VictoriaMetrics again.
+    """
+    step = choose_step(start, end, min_step)
+    aligned_start = int(start // step * step)
+    aligned_end = int(end // step * step)
+    key = (vm_select, query, step, aligned_start, aligned_end)
+    now = time.time()
+
+    cached = _cache_get(key, now)
+    app_metrics.count_cache_lookup('victoria_metrics', cached is not None)
+    if cached is not None:
+        return step, cached
+
+    with _lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = {'event': threading.Event(), 'result': None, 'error': None}
+            _inflight[key] = flight
+    if not leader:
+        flight['event'].wait(VM_CONNECT_TIMEOUT + VM_READ_TIMEOUT)
+        if flight['error'] is not None:
+            raise flight['error']
+        if flight['result'] is not None:
+            return step, flight['result']
+        # The first request is stuck, do not wait for it any longer
+        return step, _fetch(vm_select, query, step, aligned_start, aligned_end)
+
+    try:
+        result = _fetch(vm_select, query, step, aligned_start, aligned_end)
+        if now - aligned_end > step:
+            ttl = VM_CACHE_TTL_HISTORICAL
+        else:
+            ttl = min(step, VM_CACHE_TTL_MAX_RECENT)
+        _cache_set(key, now + ttl, result)
+        flight['result'] = result
+        return step, result
+    except Exception as e:
+        flight['error'] = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        flight['event'].set()
+
+
+def series_columns(result: dict) -> dict[str, tuple[list, list]]:
+    """
+    Split every series of a query_range result into columns: {metric label: (timestamps, values)}.
+    """
+    columns = {}
+    for series in result['data']['result']:
+        if series['values']:
+            timestamps, values = zip(*series['values'])
+        else:
+            timestamps, values = (), ()
+        columns[series['metric'].get('metric', series['metric'].get('__name__', ''))] = (list(timestamps), list(values))
+    return columns
+
+
+def format_timestamps(timestamps: list, fmt: str = '%Y-%m-%d %H:%M:%S+0000') -> list[str]:
+    """
+    Format UTC unix timestamps, without building a datetime for every point.
+    """
+    return [time.strftime(fmt, time.gmtime(timestamp)) for timestamp in timestamps]
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
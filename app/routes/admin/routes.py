@@ -14,6 +14,7 @@ import app.modules.roxywi.roxy as roxy
 import app.modules.roxywi.auth as roxywi_auth
 import app.modules.roxywi.common as roxywi_common
 import app.modules.tools.common as tools_common
+import app.modules.tools.service_status as service_status
 
 
 @bp.before_request
@@ -127,7 +128,9 @@ def action_tools(service, action):
     if action not in ('start', 'stop', 'restart'):
         return 'error: wrong action'
 
-    return roxy.action_service(action, service)
+    result = roxy.action_service(action, service)
+    service_status.invalidate()
+    return result
 
 
 @bp.route('/update')
@@ -156,12 +159,12 @@ def check_update():
     It performs the following steps:
 
     1. Authenticates the user as an supeAadmin using the roxywi_auth.page_for_admin() method.
-    2. Runs the "check_new_version" job using the scheduler.run_job() method.
+    2. Runs the "check_new_version" job on this worker, even if it is not the scheduler leader.
     3. Returns the string 'ok' to indicate successful completion.
 
     Returns:
         str: A string 'ok' indicating successful completion.
     """
     roxywi_auth.page_for_admin()
-    scheduler.run_job('check_new_version')
+    scheduler.get_job('check_new_version').func(force=True)
     return 'ok'
@@ -2,9 +2,11 @@ import json
 
 from flask import render_template, request, jsonify, g
 from flask_jwt_extended import jwt_required
+from flask_pydantic import validate
 from playhouse.shortcuts import model_to_dict
 
 from app.modules.db.db_model import InstallationTasks
+from app.modules.roxywi.class_models import CheckResultsRequest
 from app.routes.smon import bp
 from app.middleware import get_user_params
 import app.modules.db.smon as smon_sql
@@ -12,6 +14,7 @@ import app.modules.db.region as region_sql
 import app.modules.db.country as country_sql
 import app.modules.db.server as server_sql
 import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_ingest as smon_ingest
 import app.modules.tools.common as tools_common
 import app.modules.roxywi.common as roxywi_common
 import app.modules.server.server as server_mod
@@ -101,13 +104,40 @@ def get_country(country_id):
 def agent_get_checks():
     json_data = request.json
     agent_id = smon_sql.get_agent_by_uuid(json_data['uuid'])
+    smon_sql.touch_agent(agent_id.id)
+    manifest_version = json_data.get('manifest_version')
+    if manifest_version is not None:
+        try:
+            manifest_version = int(manifest_version)
+        except (TypeError, ValueError):
+            return 'manifest_version must be an integer', 400
     try:
-        smon_agent.send_checks(agent_id.id)
+        smon_agent.sync_checks(agent_id.id, manifest_version)
     except Exception as e:
         return f'{e}', 500
     return 'ok'
 
 
+@bp.post('/agent/results')
+@validate(body=CheckResultsRequest)
+def agent_post_results(body: CheckResultsRequest):
+    try:
+        agent = smon_sql.get_agent_by_uuid(body.uuid)
+    except Exception as e:
+        return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot find agent')
+    smon_sql.touch_agent(agent.id)
+    try:
+        return jsonify(smon_ingest.ingest_results(agent.id, body.results))
+    except Exception as e:
+        return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot save check results')
+
+
+@bp.get('/agent/results/stats')
+@jwt_required()
+def agent_results_stats():
+    return jsonify(smon_ingest.get_ingest_stats())
+
+
 @bp.get('/agent/free')
 @jwt_required()
 @get_user_params()
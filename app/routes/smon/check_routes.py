@@ -1,13 +1,17 @@
-from flask import render_template, request, jsonify
+from flask import render_template, request, jsonify, g
 from flask_jwt_extended import jwt_required
 
 from app.routes.smon import bp
 from app.middleware import get_user_params
 
 import app.modules.db.smon as smon_sql
+import app.modules.db.region as region_sql
+import app.modules.roxywi.auth as roxywi_auth
 import app.modules.tools.smon as smon_mod
 import app.modules.tools.smon_agent as agent_mod
+import app.modules.tools.smon_placement as smon_placement
 import app.modules.roxywi.common as roxywi_common
+from app.modules.roxywi.exception import RoxywiGroupMismatch
 
 
 @bp.route('/check/<int:multi_check_id>/<int:check_type_id>')
@@ -45,19 +49,42 @@ def get_checks_count():
 def move_checks():
     old_agent = int(request.json.get('old_agent'))
     new_agent = int(request.json.get('new_agent'))
-    old_agent_ip = smon_sql.get_agent_ip_by_id(old_agent)
     checks = {}
 
     try:
-        for check_type in ('http', 'tcp', 'dns', 'ping', 'smtp', 'rabbitmq'):
-            got_checks = smon_sql.select_checks_for_agent(old_agent)
-            for c in got_checks:
-                checks[c.id] = check_type
-                agent_mod.delete_check(old_agent, old_agent_ip, c.id)
-                smon_sql.update_check_agent(c.id, new_agent)
+        got_checks = smon_sql.select_checks_for_agent(old_agent)
+        moves = []
+        for c in got_checks:
+            checks[c.id] = c.check_type
+            moves.append((c.id, c.check_type, old_agent, new_agent))
+        results = agent_mod.move_checks(moves)
+        agent_mod.raise_for_agent_errors(results, 'Cannot move checks')
     except Exception as e:
-        roxywi_common.handle_json_exceptions(e, 'Cannot get checks')
-
-    agent_mod.send_checks(new_agent)
+        return roxywi_common.handle_json_exceptions(e, 'Cannot move checks')
 
     return jsonify({'checks': str(checks)})
+
+
+@bp.post('/checks/rebalance')
+@jwt_required()
+@get_user_params()
+def rebalance_checks():
+    roxywi_auth.page_for_admin(level=2)
+    region_id = int(request.json.get('region_id'))
+    dry_run = bool(request.json.get('dry_run', False))
+
+    try:
+        if g.user_params['role'] == 1:
+            region_sql.get_region(region_id)
+        else:
+            region = region_sql.get_region_with_group(region_id, int(g.user_params['group_id']))
+            # Checks of every group in the region are moved, a shared region of another group is for the superAdmin only
+            if region.group_id != int(g.user_params['group_id']):
+                raise RoxywiGroupMismatch
+    except Exception as e:
+        return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot find the region')
+
+    try:
+        return jsonify(smon_placement.rebalance_region(region_id, dry_run))
+    except Exception as e:
+        return roxywi_common.handle_json_exceptions(e, 'Cannot rebalance checks')
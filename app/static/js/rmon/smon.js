@@ -701,26 +701,48 @@ function show_smon_history_statuses(check_id, id_for_history_replace) {
 		url: api_v_prefix + "/rmon/check/" + check_id + "/statuses",
 		contentType: "application/json; charset=utf-8",
 		success: function (data) {
-			let statuses = '';
-			for (let status of data.reverse()) {
-				let add_class = 'serverUp';
-				if (status.status === 0 || status.status === 7 || status.status === 8) {
-					add_class = 'serverDown';
-				} else if (status.status === 5 || status.status === 6|| status.status === 9) {
-					add_class = 'serverWarn';
+			render_smon_history_statuses(data, id_for_history_replace);
+			init_smon_history_statuses_tooltips();
+		}
+	});
+}
+function show_smon_history_statuses_batch(check_ids, id_prefix) {
+	const batch_size = 500;
+	for (let i = 0; i < check_ids.length; i += batch_size) {
+		$.ajax({
+			url: api_v_prefix + "/rmon/checks/statuses",
+			data: {check_id: check_ids.slice(i, i + batch_size).join(',')},
+			contentType: "application/json; charset=utf-8",
+			success: function (data) {
+				for (let check_id in data) {
+					render_smon_history_statuses(data[check_id], id_prefix + check_id);
 				}
-				statuses += '<div class="smon_server_statuses ' + add_class + '" title="" data-help="' + status.date + ' ' + status.error + '"></div>';
+				init_smon_history_statuses_tooltips();
 			}
-			$(id_for_history_replace).html(statuses);
-			$("[title]").tooltip({
-				"content": function () {
-					return $(this).attr("data-help");
-				},
-				show: {"delay": 1000}
-			});
-			$.getScript("/static/js/fontawesome.min.js");
+		});
+	}
+}
+function render_smon_history_statuses(data, id_for_history_replace) {
+	let statuses = '';
+	for (let status of data.reverse()) {
+		let add_class = 'serverUp';
+		if (status.status === 0 || status.status === 7 || status.status === 8) {
+			add_class = 'serverDown';
+		} else if (status.status === 5 || status.status === 6|| status.status === 9) {
+			add_class = 'serverWarn';
 		}
+		statuses += '<div class="smon_server_statuses ' + add_class + '" title="" data-help="' + status.date + ' ' + status.error + '"></div>';
+	}
+	$(id_for_history_replace).html(statuses);
+}
+function init_smon_history_statuses_tooltips() {
+	$("[title]").tooltip({
+		"content": function () {
+			return $(this).attr("data-help");
+		},
+		show: {"delay": 1000}
 	});
+	$.getScript("/static/js/fontawesome.min.js");
 }
 function checkChecksLimit() {
 	let return_value = false;
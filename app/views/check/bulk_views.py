@@ -0,0 +1,225 @@
+from flask.views import MethodView
+from flask_jwt_extended import jwt_required
+from flask import jsonify, request, Response, stream_with_context
+from flask_pydantic import validate
+
+import app.modules.db.smon as smon_sql
+import app.modules.roxywi.common as roxywi_common
+import app.modules.tools.smon as smon_mod
+import app.modules.tools.smon_bulk as smon_bulk
+import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_placement as smon_placement
+from app.middleware import get_user_params, check_group
+from app.views.check.views import CheckView
+from app.modules.common.common_classes import SupportClass
+from app.modules.roxywi.class_models import ChecksImportQuery, ChecksExportQuery
+from app.modules.roxywi.exception import RoxywiCheckLimits, RoxywiResourceNotFound
+from app.modules.db.db_model import conn
+
+
+class ChecksImportView(CheckView):
+    methods = ['POST']
+    decorators = [jwt_required(), get_user_params(), check_group()]
+
+    def __init__(self):
+        super().__init__()
+        self.agent_picker = smon_placement.AgentPicker()
+        self.created_checks = []
+        self.user_plan = None
+        self.checks_limit = None
+        self.checks_count = 0
+
+    @validate(query=ChecksImportQuery)
+    def post(self, query: ChecksImportQuery):
+        """
+        Import checks from a JSON Lines or CSV stream.
+        ---
+        tags:
+        - 'Checks'
+        description: >
+          Every row is a check definition with a `check_type` (`http`, `tcp`, `ping`, `dns`, `smtp`, `rabbitmq`) and
+          the fields of the matching create check request. CSV rows have one column per field, list and object fields,
+          like `entities` or `accepted_status_codes`, hold JSON. The export endpoint returns checks in the same format.
+          Rows are created in batched transactions and their checks are sent to the agents once per batch and agent.
+        consumes:
+        - application/x-ndjson
+        - text/csv
+        parameters:
+        - name: format
+          in: query
+          description: '`jsonl` or `csv`. By default, `csv` for a text/csv body, otherwise `jsonl`.'
+          required: false
+          type: string
+        - name: dry_run
+          in: query
+          description: 'Only validate the rows.'
+          required: false
+          type: boolean
+        - name: group_id
+          in: query
+          description: This parameter is used only for the superAdmin role.
+          required: false
+          type: integer
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: string
+            example: '{"check_type": "tcp", "name": "db", "place": "region", "entities": [1], "ip": "10.0.0.5", "port": 5432}'
+        responses:
+          200:
+            description: Result of every row
+            schema:
+              type: object
+              properties:
+                created:
+                  type: integer
+                failed:
+                  type: integer
+                results:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      row:
+                        type: integer
+                        description: Number of the row, without empty lines and the CSV header
+                      status:
+                        type: string
+                        description: '`created`, `valid` for dry runs or `failed`'
+                      id:
+                        type: integer
+                        description: ID of the created multi check
+                      error:
+                        type: string
+                      warnings:
+                        type: array
+                        items:
+                          type: string
+        """
+        self.group_id = SupportClass.return_group_id(query)
+        file_format = query.format or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+        self.user_plan, self.checks_limit = smon_mod.get_checks_limit()
+        if self.checks_limit is not None:
+            self.checks_count = smon_sql.count_checks()
+
+        results = []
+        batch = []
+        for row, check_type, data in smon_bulk.read_checks(request.stream, file_format):
+            if check_type is None:
+                results.append({'row': row, 'status': 'failed', 'error': str(data)})
+            elif query.dry_run:
+                results.append({'row': row, 'status': 'valid'})
+            else:
+                batch.append((row, check_type, data))
+                if len(batch) >= smon_bulk.IMPORT_BATCH_SIZE:
+                    results.extend(self._import_batch(batch))
+                    batch = []
+        if batch:
+            results.extend(self._import_batch(batch))
+
+        results.sort(key=lambda result: result['row'])
+        created = sum(1 for result in results if result['status'] == 'created')
+        if created:
+            roxywi_common.logger(f'{created} checks have been imported', service='RMON', keep_history=1)
+        return jsonify({
+            'created': created,
+            'failed': sum(1 for result in results if result['status'] == 'failed'),
+            'results': results,
+        })
+
+    def _import_batch(self, batch: list) -> list[dict]:
+        """
+        Create the checks of the batch in one transaction, a failed row only rolls back its own savepoint.
+        The enabled checks are sent to the agents after the commit, with one call per agent.
+        """
+        results = {}
+        agent_checks = {}
+        agent_rows = {}
+        with conn.atomic():
+            for row, check_type, data in batch:
+                self.check_type = check_type
+                self.created_checks = []
+                try:
+                    if self.checks_limit is not None and self.checks_count >= self.checks_limit:
+                        raise RoxywiCheckLimits(f'You have reached limit for {self.user_plan.capitalize()} plan')
+                    with conn.atomic():
+                        multi_check_id = self._create_multi_check(data)
+                except Exception as e:
+                    results[row] = {'row': row, 'status': 'failed', 'error': str(e)}
+                    continue
+                results[row] = {'row': row, 'status': 'created', 'id': multi_check_id}
+                self.checks_count += len(self.created_checks)
+                if not data.enabled:
+                    continue
+                for agent_id, smon_id in self.created_checks:
+                    agent_checks.setdefault(agent_id, []).append((smon_id, check_type))
+                    agent_rows.setdefault(agent_id, set()).add(row)
+
+        calls = [(agent_id, smon_agent.push_checks, (agent_id, checks)) for agent_id, checks in agent_checks.items()]
+        for result in smon_agent.run_on_agents(calls):
+            if result['error']:
+                for row in agent_rows[result['agent_id']]:
+                    results[row].setdefault('warnings', []).append(
+                        f'Cannot send checks to agent {result["agent_id"]}: {result["error"]}'
+                    )
+        return list(results.values())
+
+    def _create_agent_check(self, data, multi_check_id: int, agent_id, region_id: int = None, country_id: int = None, check_id: int = None):
+        last_id = smon_mod.create_check(data, self.group_id, self.check_type, multi_check_id, agent_id, region_id, country_id)
+        if self.create_func[self.check_type](data, last_id) is not None:
+            raise Exception(f'Cannot create {self.check_type} check')
+        self.created_checks.append((agent_id, last_id))
+
+    def _get_agent_id(self, region_id: int, data) -> int:
+        try:
+            return self.agent_picker.pick_agent(region_id, self.check_type, data.interval, data.check_timeout)
+        except RoxywiResourceNotFound:
+            raise RoxywiResourceNotFound(f'There are no agents in the region_id: {region_id}')
+        except Exception as e:
+            raise Exception(f'Cannot get agent from region: {e}')
+
+
+class ChecksExportView(MethodView):
+    methods = ['GET']
+    decorators = [jwt_required(), get_user_params(), check_group()]
+
+    @validate(query=ChecksExportQuery)
+    def get(self, query: ChecksExportQuery):
+        """
+        Export checks as JSON Lines or CSV, in the format of the import endpoint.
+        ---
+        tags:
+        - 'Checks'
+        parameters:
+        - name: format
+          in: query
+          description: '`jsonl` (default) or `csv`.'
+          required: false
+          type: string
+        - name: check_type
+          in: query
+          description: 'Export only checks of this type. Available values: `http`, `tcp`, `ping`, `dns`, `rabbitmq`, `smtp`.'
+          required: false
+          type: string
+        - name: group_id
+          in: query
+          description: This parameter is used only for the superAdmin role.
+          required: false
+          type: integer
+        produces:
+        - application/x-ndjson
+        - text/csv
+        responses:
+          200:
+            description: One check definition per line or CSV row. Entities are the IDs of this instance.
+        """
+        group_id = SupportClass.return_group_id(query)
+        checks = smon_bulk.export_checks(group_id, query.check_type)
+        if query.format == 'csv':
+            body, mimetype = smon_bulk.to_csv(checks), 'text/csv'
+        else:
+            body, mimetype = smon_bulk.to_jsonl(checks), 'application/x-ndjson'
+        response = Response(stream_with_context(body), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=rmon-checks.{query.format}'
+        return response
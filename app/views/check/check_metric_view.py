@@ -6,11 +6,12 @@ from flask_pydantic import validate
 import app.modules.db.sql as sql
 import app.modules.db.smon as smon_sql
 import app.modules.tools.smon as smon_mod
+import app.modules.tools.smon_rollup as smon_rollup
 import app.modules.common.common as common
 import app.modules.roxywi.common as roxywi_common
 from app.modules.common.common_classes import SupportClass
 from app.middleware import get_user_params, check_group
-from app.modules.roxywi.class_models import CheckMetricsQuery, GroupQuery
+from app.modules.roxywi.class_models import CheckMetricsQuery, GroupQuery, ChecksStatusesQuery
 
 
 class ChecksMetricView(MethodView):
@@ -35,8 +36,11 @@ class ChecksMetricView(MethodView):
                 return jsonify(smon_mod.history_metrics_from_vm(check_id, query))
             except Exception as e:
                 return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get metrics')
+        elif query.tier:
+            start, end = smon_mod.get_metrics_range(query)
+            return jsonify(smon_rollup.rollup_metrics(check_id, query.tier, start, end, query.format))
         else:
-            return jsonify(smon_mod.history_metrics(check_id, self.check_type_id))
+            return jsonify(smon_mod.history_metrics(check_id, self.check_type_id, query.format))
 
 
 class ChecksMetricViewHttp(ChecksMetricView):
@@ -78,6 +82,17 @@ class ChecksMetricViewHttp(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -158,6 +173,17 @@ class ChecksMetricViewTcp(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -217,6 +243,17 @@ class ChecksMetricViewSMTP(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -288,6 +325,17 @@ class ChecksMetricViewPing(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -365,6 +413,17 @@ class ChecksMetricViewDNS(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -424,6 +483,17 @@ class ChecksMetricViewRabbitmq(ChecksMetricView):
           description: the ending timestamp of the time range for query evaluation. If the end isn’t set, then the end is automatically set to the current time. Only if VictoriaMetrics is used.
           default: now
           type: string
+        - name: tier
+          in: query
+          description: Return pre-aggregated buckets (1m, 5m, 1h or 1d) between start and end instead of the last raw results. Only if VictoriaMetrics is not used.
+          required: false
+          type: string
+        - name: format
+          in: query
+          description: "string returns comma-separated strings in chartData, columnar returns {timestamps, series, time_zone} with unix timestamps and numeric arrays, columnar_f32 returns every series as a base64 encoded little-endian float32 buffer"
+          required: false
+          type: string
+          default: string
         responses:
           '200':
             description: 'Successful Operation'
@@ -502,6 +572,94 @@ class CheckStatusesView(MethodView):
         )
 
 
+class ChecksStatusesView(MethodView):
+    methods = ["GET"]
+    decorators = [jwt_required(), get_user_params(), check_group()]
+
+    @validate(query=ChecksStatusesQuery)
+    def get(self, query: ChecksStatusesQuery):
+        """
+        Get the last statuses of many checks in one request.
+        ---
+        tags:
+        - 'Check Statuses'
+        parameters:
+        - name: check_id
+          in: query
+          description: 'Comma separated IDs of the checks, up to 500. Without it, the checks are selected by the filters of /checks'
+          required: false
+          type: string
+        - name: last
+          in: query
+          description: 'How many statuses to return for every check, up to 100'
+          required: false
+          type: integer
+          default: 40
+        - name: offset
+          in: query
+          required: false
+          type: integer
+        - name: limit
+          in: query
+          required: false
+          type: integer
+        - name: check_group
+          in: query
+          required: false
+          type: string
+        - name: check_name
+          in: query
+          required: false
+          type: string
+        - name: check_status
+          in: query
+          required: false
+          type: integer
+        - name: check_type
+          in: query
+          required: false
+          type: string
+        - name: group_id
+          in: query
+          description: This parameter is used only for the superAdmin role.
+          required: false
+          type: integer
+        responses:
+          '200':
+            description: 'Statuses of every check, newest first'
+            schema:
+              type: 'object'
+              additionalProperties:
+                type: 'array'
+                items:
+                  type: 'object'
+                  properties:
+                    date:
+                      type: 'string'
+                      format: 'date-time'
+                    error:
+                      type: 'string'
+                    status:
+                      type: 'integer'
+        """
+        group_id = SupportClass.return_group_id(query)
+
+        try:
+            if query.check_id:
+                check_ids = smon_sql.select_group_check_ids(group_id, query.check_id)
+            else:
+                check_ids = [check.id for check in smon_sql.select_multi_check_with_filters(group_id, query)]
+            statuses = smon_sql.select_checks_last_statuses(check_ids, query.last)
+        except Exception as e:
+            return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get statuses')
+
+        return jsonify({
+            check_id: [
+                {'status': s['status'], 'date': common.get_time_zoned_date(s['date']), 'error': s['mes']} for s in check_statuses
+            ] for check_id, check_statuses in statuses.items()
+        })
+
+
 class CheckStatusView(MethodView):
     methods = ["GET"]
     decorators = [jwt_required(), get_user_params(), check_group()]
@@ -15,38 +15,35 @@ from app.modules.db.db_model import SMON
 def _return_checks(checks: SMON, check_type_id: int = None) -> list:
     entities = []
     check_list = []
+    checks = list(checks)
+    # Load the type-specific checks and group names of the whole page at once instead of per row
+    type_checks = smon_sql.select_checks_by_smon_ids([m.id for m in checks], check_type_id)
+    group_names = smon_sql.get_smon_group_names(m.multi_check_id.check_group_id_id for m in checks)
 
     for m in checks:
         check_json = {'checks': []}
         place = m.multi_check_id.entity_type
-        check_id = m.id
         name = m.multi_check_id.name.replace("'", "")
         description = m.multi_check_id.description.replace("'", "")
-        if m.multi_check_id.check_group_id:
-            group_name = smon_sql.get_smon_group_by_id(m.multi_check_id.check_group_id).name
+        group_name = group_names.get(m.multi_check_id.check_group_id_id)
+        if group_name:
             group_name = group_name.replace("'", "")
-        else:
-            group_name = None
         check_json['check_group'] = group_name
-        if m.country_id:
-            entities.append(m.country_id.id)
-        elif m.region_id:
-            entities.append(m.region_id.id)
-        elif m.agent_id:
-            entities.append(m.agent_id.id)
-        checks = smon_sql.select_one_smon(check_id, check_type_id=check_type_id)
-        i = 0
-        for check in checks:
+        if m.country_id_id:
+            entities.append(m.country_id_id)
+        elif m.region_id_id:
+            entities.append(m.region_id_id)
+        elif m.agent_id_id:
+            entities.append(m.agent_id_id)
+        for check in type_checks.get(m.id, []):
             check_dict = model_to_dict(check, max_depth=1)
             check_json['checks'].append(check_dict)
             check_json['entities'] = entities
             check_json['place'] = place
-            smon_id = model_to_dict(check, max_depth=1)
-            check_json.update(smon_id['smon_id'])
+            check_json.update(check_dict['smon_id'])
             check_json.update(model_to_dict(check, recurse=False))
             check_json['name'] = name
             check_json['description'] = description
-            i += 1
         check_list.append(check_json)
     return check_list
 
@@ -967,7 +964,7 @@ class AllChecksViewWithFilters(MethodView):
           type: string
         - name: check_name
           in: query
-          description: 'Filter by check name.'
+          description: 'Search checks by name, description and check group. Every word of the search must match, as a word prefix.'
           required: false
           type: string
         - name: check_status
@@ -995,6 +992,11 @@ class AllChecksViewWithFilters(MethodView):
           type: integer
           description: 'Limit for pagination.'
           default: 25
+        - name: cursor
+          in: query
+          type: string
+          description: 'Cursor of the next page, from `next_cursor` of the previous one. It is used instead of offset and can not be used with sort_by.'
+          required: false
         responses:
           '200':
             description: 'Successful Operation'
@@ -1094,13 +1096,19 @@ class AllChecksViewWithFilters(MethodView):
                         description: The date and time when the check was last updated.
                 total:
                   type: integer
-                  description: Total number of checks matching the criteria.
+                  description: Total number of checks matching the criteria. It is null for pages requested with a cursor.
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last page and for pages sorted with sort_by.
 
         """
         group_id = SupportClass.return_group_id(query)
-        checks = smon_sql.select_multi_check_with_filters(group_id, query)
+        checks, next_cursor = smon_sql.select_multi_check_page(group_id, query)
         entities = []
-        if any((query.check_name, query.check_group, query.check_type)):
+        if query.cursor:
+            # The total was returned with the first page, the next ones do not count the checks again
+            len_checks = None
+        elif any((query.check_name, query.check_group, query.check_type)):
             if query.check_type:
                 len_checks = smon_sql.get_count_multi_check_check_type(group_id, query.check_type)
             elif query.check_group:
@@ -1111,18 +1119,18 @@ class AllChecksViewWithFilters(MethodView):
             len_checks = smon_sql.get_count_multi_with_status_checks(group_id, query.check_status)
         else:
             len_checks = smon_sql.get_count_multi_checks(group_id)
-        check_list = {'results': [], 'total': len_checks}
+        check_list = {'results': [], 'total': len_checks, 'next_cursor': next_cursor}
+
+        group_names = smon_sql.get_smon_group_names(m.multi_check_id.check_group_id_id for m in checks)
 
         for m in checks:
             check_json = {}
             place = m.multi_check_id.entity_type
             name = m.multi_check_id.name.replace("'", "")
             description = m.multi_check_id.description.replace("'", "")
-            if m.multi_check_id.check_group_id:
-                group_name = smon_sql.get_smon_group_by_id(m.multi_check_id.check_group_id).name
+            group_name = group_names.get(m.multi_check_id.check_group_id_id)
+            if group_name:
                 group_name = group_name.replace("'", "")
-            else:
-                group_name = None
 
             check_json['check_group'] = group_name
             check_json['entities'] = entities
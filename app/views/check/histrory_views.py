@@ -51,6 +51,16 @@ class ChecksHistoryView(MethodView):
             description: 'Sort checks by check status. If add "-" to a value it will be sorted by ASC. Available values: `name`, `id`, `date`.'
             required: false
             type: 'string'
+          - name: check_name
+            in: query
+            description: 'Search alerts by check name and message. Every word of the search must match, as a word prefix.'
+            required: false
+            type: 'string'
+          - name: cursor
+            in: query
+            description: 'Cursor of the next page, from `next_cursor` of the previous one. It is used instead of offset, only when sorting by `date` or `-date` or without sort_by.'
+            required: false
+            type: 'string'
         responses:
           200:
             description: Successful response with checks history
@@ -92,8 +102,14 @@ class ChecksHistoryView(MethodView):
                   example: 175
                 total_filtered:
                   type: integer
-                  description: Total filtered entries.
+                  description: Total filtered entries, counted up to 10000.
                   example: 10
+                total_filtered_approximate:
+                  type: boolean
+                  description: True if there are more filtered entries than total_filtered.
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last page and for pages sorted by `name` or `id`.
           400:
             description: Request error
           401:
@@ -106,16 +122,18 @@ class ChecksHistoryView(MethodView):
         group_id = SupportClass.return_group_id(query)
 
         try:
-            history = history_sql.alerts_history('RMON', group_id, query)
+            history, next_cursor = history_sql.alerts_history('RMON', group_id, query)
+            total_history = history_sql.total_alerts_history('RMON', group_id)
+            if query.check_name:
+                total_filtered, approximate = history_sql.total_filtered_alerts_history('RMON', group_id, query.check_name)
+            else:
+                total_filtered, approximate = total_history, False
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get history')
-        if query.check_name:
-            total_history = len(history_sql.all_alerts_history('RMON', group_id))
-            total_filtered = len(history)
-        else:
-            total_history = history_sql.total_alerts_history('RMON', group_id)
-            total_filtered = total_history
-        history_list = {'results': [], 'total': total_history, 'total_filtered': total_filtered}
+        history_list = {
+            'results': [], 'total': total_history, 'total_filtered': total_filtered,
+            'total_filtered_approximate': approximate, 'next_cursor': next_cursor
+        }
         for h in history:
             history = model_to_dict(h, recurse=query.recurse, exclude={RMONAlertsHistory.service}, max_depth=1)
             history['name'] = history['name'].replace("'", "")
@@ -167,6 +185,11 @@ class CheckHistoryView(MethodView):
             description: 'Sort checks by check status. If add "-" to a value it will be sorted by ASC. Available values: `name`, `id`, `date`.'
             required: false
             type: 'string'
+          - name: cursor
+            in: query
+            description: 'Cursor of the next page, from `next_cursor` of the previous one. It is used instead of offset, only when sorting by `date` or `-date` or without sort_by.'
+            required: false
+            type: 'string'
         responses:
           200:
             description: Successful response with checks history
@@ -206,6 +229,9 @@ class CheckHistoryView(MethodView):
                   type: integer
                   description: Total entries.
                   example: 175
+                next_cursor:
+                  type: string
+                  description: Cursor of the next page, null on the last page and for pages sorted by `name` or `id`.
           400:
             description: Request error
           401:
@@ -218,11 +244,11 @@ class CheckHistoryView(MethodView):
         group_id = SupportClass.return_group_id(query)
 
         try:
-            history = history_sql.rmon_multi_check_history(check_id, group_id, query)
+            history, next_cursor = history_sql.rmon_multi_check_history(check_id, group_id, query)
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get history')
         total_history = history_sql.total_rmon_multi_check_history(check_id, group_id)
-        history_list = {'results': [], 'total': total_history}
+        history_list = {'results': [], 'total': total_history, 'next_cursor': next_cursor}
         for h in history:
             history = model_to_dict(h, recurse=query.recurse, exclude={RMONAlertsHistory.service}, max_depth=1)
             history['name'] = history['name'].replace("'", "")
@@ -1,11 +1,12 @@
 from flask.views import MethodView
 from flask_jwt_extended import jwt_required
-from flask import jsonify
+from flask import jsonify, current_app
 from flask_pydantic import validate
 from playhouse.shortcuts import model_to_dict
 
 import app.modules.db.smon as smon_sql
 import app.modules.tools.smon as smon_mod
+import app.modules.tools.status_page_cache as status_page_cache
 import app.modules.roxywi.common as roxywi_common
 from app.middleware import get_user_params, check_group
 from app.modules.common.common_classes import SupportClass
@@ -275,6 +276,7 @@ class StatusPageView(MethodView):
 
         try:
             smon_sql.delete_status_page(page_id)
+            status_page_cache.invalidate()
             return BaseResponse().model_dump(mode='json'), 204
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot delete Status page')
@@ -343,6 +345,31 @@ class StatusPages(MethodView):
         return jsonify(pages_list)
 
 
+def _build_status_page_json(slug: str) -> tuple[int, str]:
+    page = smon_sql.get_status_page(slug)
+    page = model_to_dict(page)
+    for key in ('name', 'description'):
+        page[key] = page[key].replace("'", "")
+    page_id = page['id']
+
+    checks = smon_sql.select_status_page_smon(page_id)
+    group_names = smon_sql.get_smon_group_names(c_d.multi_check_id.check_group_id_id for c_d in checks)
+    uptimes = smon_sql.get_uptime_and_status_by_multi_checks([c_d.multi_check_id_id for c_d in checks])
+    page['checks'] = []
+    for c_d in checks:
+        check = model_to_dict(c_d, recurse=False)
+        check.update(uptimes[c_d.multi_check_id_id])
+        group_name = group_names.get(c_d.multi_check_id.check_group_id_id)
+        check.update({
+            'name': c_d.multi_check_id.name or '',
+            'description': c_d.multi_check_id.description or '',
+            'check_group': group_name.replace("'", "") if group_name else '',
+        })
+        page['checks'].append(check)
+
+    return page_id, current_app.json.dumps(page)
+
+
 class StatusPageSlug(MethodView):
     methods = ['GET']
 
@@ -396,39 +423,8 @@ class StatusPageSlug(MethodView):
                   type: string
         """
         try:
-            page = smon_sql.get_status_page(slug)
-            page = model_to_dict(page)
-            for key in ('name', 'description'):
-                page[key] = page[key].replace("'", "")
-            page_id = page['id']
+            snapshot = status_page_cache.get_snapshot(('json', slug), lambda: _build_status_page_json(slug))
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get Status page')
 
-        try:
-            checks = smon_sql.select_status_page_checks(page_id)
-            page['checks'] = []
-            groups_name = {}
-            check_names = {}
-            for check in checks:
-                check_data = smon_sql.select_one_smon_by_multi_check(check.multi_check_id)
-                for c_d in check_data:
-                    if c_d.multi_check_id.check_group_id:
-                        group_name = smon_sql.get_smon_group_by_id(c_d.multi_check_id.check_group_id).name
-                        group_name = group_name.replace("'", "")
-                        groups_name.update({int(c_d.multi_check_id.id): group_name})
-                    check_names.update({
-                        f'name_{int(c_d.multi_check_id.id)}': c_d.multi_check_id.name,
-                        f'description_{int(c_d.multi_check_id.id)}': c_d.multi_check_id.description
-                    })
-                    page['checks'].append(model_to_dict(c_d, recurse=False))
-            for check in page['checks']:
-                check.update(smon_sql.get_uptime_and_status(check['multi_check_id']))
-                check.update({
-                    'name': check_names.get(f"name_{check['multi_check_id']}", ''),
-                    'description': check_names.get(f"description_{check['multi_check_id']}", ''),
-                    'check_group': groups_name.get(check['multi_check_id'], ''),
-                })
-        except Exception as e:
-            return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot get Status page checks')
-
-        return jsonify(page)
+        return status_page_cache.make_snapshot_response(snapshot, 'application/json')
@@ -12,6 +12,7 @@ import app.modules.db.country as country_sql
 import app.modules.roxywi.common as roxywi_common
 import app.modules.tools.smon as smon_mod
 import app.modules.tools.smon_agent as smon_agent
+import app.modules.tools.smon_placement as smon_placement
 from app.middleware import get_user_params, check_group
 from app.modules.common.common_classes import SupportClass
 from app.modules.roxywi.class_models import (
@@ -36,6 +37,7 @@ class CheckView(MethodView):
         """
         self.check_type = None
         self.group_id = g.user_params['group_id']
+        self.agent_calls = []
         self.multi_check_func = {
             'country': self._create_country_check,
             'region': self._create_region_check,
@@ -59,6 +61,12 @@ class CheckView(MethodView):
         check_json = {'checks': []}
         i = 0
 
+        multi_check = list(multi_check)
+        smon_ids = [m.id for m in multi_check]
+        type_checks = smon_sql.select_checks_by_smon_ids(smon_ids, check_type_id)
+        group_names = smon_sql.get_smon_group_names(m.multi_check_id.check_group_id_id for m in multi_check)
+        check_stats = smon_mod.get_checks_uptime_and_avg_resp_time(smon_ids)
+
         for m in multi_check:
             place = m.multi_check_id.entity_type
             name = m.multi_check_id.name.replace("'", "")
@@ -71,25 +79,22 @@ class CheckView(MethodView):
             else:
                 runbook = ''
             check_id = m.id
-            if m.multi_check_id.check_group_id:
-                group_name = smon_sql.get_smon_group_by_id(m.multi_check_id.check_group_id).name
+            group_name = group_names.get(m.multi_check_id.check_group_id_id)
+            if group_name:
                 group_name = group_name.replace("'", "")
-            else:
-                group_name = None
             if m.multi_check_id.expiration and m.multi_check_id.expiration != '0000-00-00 00:00:00':
                 expiration = m.multi_check_id.expiration.strftime("%Y-%m-%d %H:%M")
             check_json['check_group'] = group_name
-            if m.country_id:
-                entities.append(m.country_id.id)
-            elif m.region_id:
-                entities.append(m.region_id.id)
-            elif m.agent_id:
-                entities.append(m.agent_id.id)
+            if m.country_id_id:
+                entities.append(m.country_id_id)
+            elif m.region_id_id:
+                entities.append(m.region_id_id)
+            elif m.agent_id_id:
+                entities.append(m.agent_id_id)
             entities = list(set(entities))
-            checks = smon_sql.select_one_smon(check_id, check_type_id=check_type_id)
-            for check in checks:
+            for check in type_checks.get(check_id, []):
                 check_dict = model_to_dict(check, max_depth=query.max_depth)
-                check_dict['average_response_time'] = smon_mod.get_average_response_time(check_id, check_type_id)
+                check_dict['average_response_time'] = check_stats[check_id]['average_response_time']
                 check_json['checks'].append(check_dict)
                 check_json['entities'] = entities
                 check_json['place'] = place
@@ -97,13 +102,13 @@ class CheckView(MethodView):
                 check_json['priority'] = m.multi_check_id.priority
                 check_json['threshold_timeout'] = m.multi_check_id.threshold_timeout
                 check_json['expiration'] = expiration
-                smon_id = model_to_dict(check, max_depth=query.max_depth)
-                check_json.update(smon_id['smon_id'])
+                check_json['keep_history'] = m.multi_check_id.keep_history
+                check_json.update(check_dict['smon_id'])
                 check_json.update(model_to_dict(check, recurse=query.recurse))
                 check_json['name'] = name
                 check_json['description'] = description
                 check_json['email_channel_id'] = check_json['email_channel_id'] if check_json['email_channel_id'] else 0
-                check_json['checks'][i]['smon_id']['uptime'] = smon_mod.check_uptime(check_json['checks'][i]['smon_id']['id'])
+                check_json['checks'][i]['smon_id']['uptime'] = check_stats[check_id]['uptime']
                 if check_json['checks'][i]['smon_id']['check_type'] == 'http':
                     check_json['checks'][i]['accepted_status_codes'] = check_json['checks'][i]['accepted_status_codes']
                     check_json['accepted_status_codes'] = check_json['accepted_status_codes']
@@ -144,14 +149,8 @@ class CheckView(MethodView):
             smon_mod.check_checks_limit()
         except Exception as e:
             raise e
-        check_parameters = self._return_check_parameters(data)
-        check_parameters['group_id'] = self.group_id
-        check_parameters['entity_type'] = data.place
-        multi_check_id = smon_sql.create_multi_check(**check_parameters)
-        if data.place == 'all':
-            self._create_all_checks(data, multi_check_id)
-        for entity_id in data.entities:
-            self.multi_check_func[data.place](data, multi_check_id, entity_id)
+        multi_check_id = self._create_multi_check(data)
+        self._send_agent_calls(multi_check_id)
         roxywi_common.logger(
             f'Check {multi_check_id} has been created',
             additional_extra={'multi_check_id': multi_check_id},
@@ -190,7 +189,7 @@ class CheckView(MethodView):
             for check in entity_id_check_id[entity_id]:
                 smon_sql.delete_smon(check['check_id'], group_id)
                 agent_ip = smon_sql.get_agent_ip_by_id(check['agent_id'])
-                smon_agent.delete_check(check['agent_id'], agent_ip, check['check_id'])
+                self.agent_calls.append((check['agent_id'], smon_agent.delete_check, (check['agent_id'], agent_ip, check['check_id'])))
                 roxywi_common.logger(
                     f'Check {check["check_id"]} has been recreated on Agent {check["agent_id"]}',
                     additional_extra={'check_id': check["check_id"], 'multi_check_id': multi_check_id, 'agent_id': check['agent_id']},
@@ -199,7 +198,7 @@ class CheckView(MethodView):
         for entity_id in need_to_update:
             for check in entity_id_check_id[entity_id]:
                 try:
-                    smon_mod.update_smon(check['check_id'], data)
+                    smon_mod.update_smon(check['check_id'], data, delete_from_agent=False)
                     self._create_agent_check(
                         data,
                         multi_check_id,
@@ -218,6 +217,7 @@ class CheckView(MethodView):
                     self.multi_check_func[place](data, multi_check_id, entity_id)
                 except Exception as e:
                     raise Exception(f'here: {e}')
+        self._send_agent_calls(multi_check_id)
         roxywi_common.logger(f'Multi check {multi_check_id} has been updated', additional_extra={'multi_check_id': multi_check_id})
 
     def delete(self, check_id: int, query: GroupQuery) -> Union[int, tuple]:
@@ -240,11 +240,23 @@ class CheckView(MethodView):
             'priority': data.priority,
             'expiration': data.expiration,
             'threshold_timeout': float(data.threshold_timeout),
+            'keep_history': data.keep_history,
             'name': data.name,
             'description': data.description,
         }
         return check_parameters
 
+    def _create_multi_check(self, data) -> int:
+        check_parameters = self._return_check_parameters(data)
+        check_parameters['group_id'] = self.group_id
+        check_parameters['entity_type'] = data.place
+        multi_check_id = smon_sql.create_multi_check(**check_parameters)
+        if data.place == 'all':
+            self._create_all_checks(data, multi_check_id)
+        for entity_id in data.entities:
+            self.multi_check_func[data.place](data, multi_check_id, entity_id)
+        return multi_check_id
+
     def _create_all_checks(self, data, multi_check_id: int):
         countries = country_sql.select_enabled_countries_by_group(self.group_id)
 
@@ -267,7 +279,7 @@ class CheckView(MethodView):
             roxywi_common.logger(f'A new check {data.name.encode("utf-8")} has been created on Region {region.name}')
 
     def _create_region_check(self, data, multi_check_id: int, region_id: int, country_id: int = None):
-        agent_id = self._get_agent_id(region_id)
+        agent_id = self._get_agent_id(region_id, data)
         self._create_agent_check(data, multi_check_id, agent_id, region_id, country_id)
 
     def _create_agent_check(self, data, multi_check_id: int, agent_id, region_id: int = None, country_id: int = None, check_id: int = None):
@@ -281,11 +293,27 @@ class CheckView(MethodView):
 
         try:
             self.create_func[self.check_type](data, last_id)
-            if data.enabled:
-                smon_mod.send_new_check(last_id, data, agent_id)
         except Exception as e:
             raise e
 
+        if check_id is not None:
+            # The check already lives on the agent, so it has to be removed there before it is sent again
+            if data.enabled:
+                self.agent_calls.append((agent_id, smon_mod.resend_check, (last_id, data, agent_id)))
+            else:
+                agent_ip = smon_sql.get_agent_ip_by_id(agent_id)
+                self.agent_calls.append((agent_id, smon_agent.delete_check, (agent_id, agent_ip, last_id)))
+        elif data.enabled:
+            self.agent_calls.append((agent_id, smon_mod.send_new_check, (last_id, data, agent_id)))
+
+    def _send_agent_calls(self, multi_check_id: int) -> None:
+        """
+        Send the collected agent requests of the multi-check concurrently, one worker per request.
+        """
+        results = smon_agent.run_on_agents(self.agent_calls)
+        self.agent_calls = []
+        smon_agent.raise_for_agent_errors(results, f'Cannot send {self.check_type} check {multi_check_id} to agents')
+
     @staticmethod
     def _extract_entity_details(check, data_place: str) -> Tuple[int, dict]:
         country_id = check.country_id.id if check.country_id else None
@@ -313,15 +341,11 @@ class CheckView(MethodView):
         else:
             return None
 
-    @staticmethod
-    def _get_agent_id(region_id: int) -> int:
+    def _get_agent_id(self, region_id: int, data) -> int:
         """
-        Determines and retrieves an agent ID based on the specified region and sorting type.
+        Picks the agent of the region with the lowest estimated load for the new check.
 
-        The method first tries to retrieve an agent ID using the 'least_check' sorting type
-        if it matches the criteria. If this retrieval fails or if the sorting type is
-        unspecified, it falls back to retrieving a random agent ID. If no agents are found
-        for the given region, a specific exception `RoxywiResourceNotFound` is raised.
+        The load of an agent is the sum of the estimated loads of its checks, see smon_placement.estimate_check_load.
 
         Raises:
             RoxywiResourceNotFound: If no agents are available in the specified region.
@@ -329,19 +353,13 @@ class CheckView(MethodView):
 
         Args:
             region_id (int): The identifier for the region where the agent search is performed.
+            data: The check request, its interval and timeout are used to estimate the load of the check.
 
         Returns:
             int: The ID of the selected agent.
         """
-        sort_type = 'least_check'
         try:
-            if sort_type == 'least_check':
-                try:
-                    agent_id = smon_sql.get_less_check_agent(region_id)
-                except RoxywiResourceNotFound:
-                    agent_id = smon_sql.get_randon_agent(region_id)
-            else:
-                agent_id = smon_sql.get_randon_agent(region_id)
+            agent_id = smon_placement.pick_agent(region_id, self.check_type, data.interval, data.check_timeout)
         except RoxywiResourceNotFound:
             raise RoxywiResourceNotFound(f'There are no agents in the region_id: {region_id}')
         except Exception as e:
@@ -528,6 +546,9 @@ class CheckHttpView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 threshold_timeout:
                   type: 'integer'
                   description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -720,6 +741,9 @@ class CheckHttpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -922,6 +946,9 @@ class CheckHttpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1191,6 +1218,9 @@ class CheckTcpView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 threshold_timeout:
                   type: 'integer'
                   description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1284,6 +1314,9 @@ class CheckTcpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1387,6 +1420,9 @@ class CheckTcpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1587,6 +1623,9 @@ class CheckDnsView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 threshold_timeout:
                   type: 'integer'
                   description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1689,6 +1728,9 @@ class CheckDnsView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1801,6 +1843,9 @@ class CheckDnsView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -1995,6 +2040,9 @@ class CheckPingView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 count_packets:
                   type: 'integer'
                   description: 'Number of packets to send'
@@ -2095,6 +2143,9 @@ class CheckPingView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               count_packets:
                 type: 'integer'
                 description: 'Number of packets to send'
@@ -2210,6 +2261,9 @@ class CheckPingView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               count_packets:
                 type: 'integer'
                 description: 'Number of packets to send'
@@ -2415,6 +2469,9 @@ class CheckSmtpView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 threshold_timeout:
                   type: 'integer'
                   description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -2519,6 +2576,9 @@ class CheckSmtpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -2632,6 +2692,9 @@ class CheckSmtpView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -2835,6 +2898,9 @@ class CheckRabbitView(CheckView):
                 expiration:
                   type: 'string'
                   description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+                keep_history:
+                  type: 'integer'
+                  description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
                 threshold_timeout:
                   type: 'integer'
                   description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -2942,6 +3008,9 @@ class CheckRabbitView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'
@@ -3061,6 +3130,9 @@ class CheckRabbitView(CheckView):
               expiration:
                 type: 'string'
                 description: 'Expiration date. After this date, the check will be disabled. Format: YYYY-MM-DD HH:MM:SS. Must be in UTC time.'
+              keep_history:
+                type: 'integer'
+                description: 'How many days the results of the check are kept. The smon_keep_history_raw_range setting is used if it is not set.'
               threshold_timeout:
                 type: 'integer'
                 description: 'A warning message will be sent if the response is slower than this value. In ms. 0 disabled.'